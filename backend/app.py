@@ -4,17 +4,36 @@ Provides API endpoints for AI-powered diagram modification and diagram persisten
 Using Supabase as the backend database.
 """
 import os
-from flask import Flask, request, jsonify
+import time
+from datetime import datetime
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
-from langchain_service import process_diagram_request
-from models import Folder, Diagram, initialize_schema, ensure_root_folder_exists, migrate_diagrams_to_root_folder
+from langchain_service import process_diagram_request, estimate_diagram_request, new_usage
+from token_budget import client_budget, MAX_REQUEST_INPUT_TOKENS, MAX_CHARS_PER_TOKEN
+from models import Folder, Diagram, DiagramVersion, search_index, initialize_schema, ensure_root_folder_exists, migrate_diagrams_to_root_folder, collect_diagram_blobs
+from edit_sessions import edit_sessions
+from text_delta import compute_text_delta, content_hash, apply_text_ops
+from json_provider import FastJSONProvider, json_list_response, dumps
+from http_compression import init_compression
+from request_profiler import init_profiler
+from workspace_transfer import export_workspace, import_workspace
+from bulk_operations import apply_bulk_operations, BULK_MAX_OPERATIONS
+from change_feed import change_feed
+from folder_ai_edit import load_folder_diagrams, plan_folder_edit, run_folder_edit, FOLDER_AI_EDIT_MAX_CONCURRENCY, FOLDER_AI_EDIT_MAX_DIAGRAMS
 
 # Load environment variables
 load_dotenv()
 
 # Create Flask app
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+
+# Compress large responses
+init_compression(app)
+
+# Profile requests on demand (only when PROFILER_ENABLED=1)
+init_profiler(app)
 
 # Configure CORS
 cors_origins = os.getenv("CORS_ORIGINS", "http://localhost:5000,http://127.0.0.1:5000,http://localhost:3000")
@@ -31,6 +50,62 @@ with app.app_context():
     # Migrate existing diagrams to root folder
     if root_folder:
         migrate_diagrams_to_root_folder(root_folder.get('id'))
+    
+    # Drop content blobs no diagram uses anymore
+    collect_diagram_blobs()
+
+# Ways an AI edit can be applied; "chunked" edits each top-level subgraph in parallel
+AI_EDIT_MODES = ("default", "chunked")
+
+def check_token_budget(estimate):
+    """
+    Helper function to enforce the per-request and per-client token budgets
+    before calling the model.
+    
+    Returns an error response if the request is over budget, otherwise None.
+    """
+    if estimate["input_tokens"] > MAX_REQUEST_INPUT_TOKENS:
+        return jsonify({
+            "error": "Diagram is too large to edit with AI.",
+            "estimate": estimate,
+            "max_request_input_tokens": MAX_REQUEST_INPUT_TOKENS
+        }), 413
+    
+    return charge_token_budget(estimate["input_tokens"] + estimate["output_tokens"])
+
+def charge_token_budget(tokens):
+    """
+    Helper function to charge tokens to the client's budget.
+    
+    Returns an error response if the budget is exhausted, otherwise None.
+    """
+    charged, retry_after = client_budget.charge(request.remote_addr, tokens)
+    if not charged:
+        response = jsonify({"error": "AI edit budget exhausted. Try again later.", "retry_after": retry_after})
+        response.headers["Retry-After"] = str(retry_after)
+        return response, 429
+    return None
+
+def settle_token_budget(client, charged, usage):
+    """
+    Helper function to replace the tokens charged up front with the tokens
+    the model calls actually used, as counted by new_usage().
+    """
+    client_budget.adjust(client, usage["input_tokens"] + usage["output_tokens"] - charged)
+
+def estimate_ai_edit(current_code, user_request, chunked):
+    """
+    Helper function to estimate an AI edit, rejecting very large diagrams by length alone.
+    """
+    if len(current_code) > MAX_REQUEST_INPUT_TOKENS * MAX_CHARS_PER_TOKEN:
+        return {
+            "input_tokens": len(current_code) // MAX_CHARS_PER_TOKEN,
+            "output_tokens": len(current_code) // MAX_CHARS_PER_TOKEN,
+            "estimated_seconds": None,
+            "model_calls": 0,
+            "strategy": "rejected"
+        }
+    return estimate_diagram_request(current_code, user_request, chunked)
 
 @app.route("/api/update-diagram", methods=["POST"])
 def update_diagram_with_ai():
@@ -40,7 +115,9 @@ def update_diagram_with_ai():
     Expected request body:
     {
         "current_code": "graph TD\nA[Start] --> B{Is it working?}\nB -->|Yes| C[Great!]\nB -->|No| D[Debug]\nD --> B",
-        "user_request": "Add a new node for error handling"
+        "user_request": "Add a new node for error handling",
+        "mode": "chunked" (optional, edit each top-level subgraph separately and in parallel),
+        "dry_run": true (optional, only estimate the cost without calling the model)
     }
     
     Returns:
@@ -48,6 +125,24 @@ def update_diagram_with_ai():
         "updated_code": "graph TD\nA[Start] --> B{Is it working?}\nB -->|Yes| C[Great!]\nB -->|No| D[Debug]\nD --> B\nD --> E[Error Handling]\nE --> B"
     }
     
+    Or for a dry run:
+    {
+        "dry_run": true,
+        "estimate": {
+            "input_tokens": 1450,
+            "output_tokens": 420,
+            "estimated_seconds": 8.5,
+            "model_calls": 1,
+            "strategy": "full"
+        },
+        "within_budget": true,
+        "max_request_input_tokens": 60000,
+        "client_tokens_remaining": 998130
+    }
+    
+    Requests whose estimated prompt is larger than MAX_REQUEST_INPUT_TOKENS are
+    rejected with 413, and clients that used up their token budget get 429.
+    
     Or in case of error:
     {
         "error": "Failed to process request"
@@ -67,9 +162,37 @@ def update_diagram_with_ai():
         # Basic validation
         if not current_code or not user_request:
             return jsonify({"error": "Invalid request. Empty fields."}), 400
+        
+        mode = data.get("mode", "default")
+        if mode not in AI_EDIT_MODES:
+            return jsonify({"error": f"Invalid mode. Use one of: {', '.join(AI_EDIT_MODES)}"}), 400
+        
+        # Estimate the cost before calling the model
+        estimate = estimate_ai_edit(current_code, user_request, mode == "chunked")
+        
+        if data.get("dry_run"):
+            remaining = client_budget.remaining(request.remote_addr)
+            return jsonify({
+                "dry_run": True,
+                "estimate": estimate,
+                "within_budget": estimate["input_tokens"] <= MAX_REQUEST_INPUT_TOKENS and (
+                    remaining is None or estimate["input_tokens"] + estimate["output_tokens"] <= remaining
+                ),
+                "max_request_input_tokens": MAX_REQUEST_INPUT_TOKENS,
+                "client_tokens_remaining": remaining
+            })
+        
+        over_budget = check_token_budget(estimate)
+        if over_budget:
+            return over_budget
             
         # Process the request using LangChain service
-        updated_code = process_diagram_request(current_code, user_request)
+        usage = new_usage()
+        try:
+            updated_code = process_diagram_request(current_code, user_request, chunked=mode == "chunked", usage=usage)
+        finally:
+            # Bill what was used, including fallback calls and failed requests
+            settle_token_budget(request.remote_addr, estimate["input_tokens"] + estimate["output_tokens"], usage)
         
         # Return the updated code
         return jsonify({"updated_code": updated_code})
@@ -80,37 +203,72 @@ def update_diagram_with_ai():
         return jsonify({"error": "Failed to process request"}), 500
 
 
+def list_query_args():
+    """
+    Helper function to read the filter and sort parameters of list endpoints.
+    """
+    return {
+        "kind": request.args.get("kind"),
+        "sort": request.args.get("sort", "last_updated"),
+        "descending": request.args.get("order", "desc").lower() != "asc"
+    }
+
+def diagram_list_metadata(diagram):
+    """
+    Helper function to get the precomputed metadata of a diagram for list responses.
+    """
+    return {
+        "kind": diagram.get('kind'),
+        "node_count": diagram.get('node_count'),
+        "edge_count": diagram.get('edge_count'),
+        "byte_size": diagram.get('byte_size')
+    }
+
+
 @app.route("/api/diagrams", methods=["GET"])
 def get_all_diagrams():
     """
     API endpoint to retrieve all diagrams.
     
+    Query parameters (optional):
+        kind: only return diagrams of this type, e.g. "flowchart"
+        sort: last_updated (default), name, node_count, edge_count or byte_size
+        order: desc (default) or asc
+    
     Returns:
     [
         {
             "id": 1,
             "name": "Diagram 1",
-            "last_updated": "2023-10-03T12:34:56"
+            "last_updated": "2023-10-03T12:34:56",
+            "kind": "flowchart",
+            "node_count": 12,
+            "edge_count": 14,
+            "byte_size": 512
         },
         ...
     ]
     """
     try:
-        # Get all diagrams from the database, ordered by last updated
-        diagrams = Diagram.get_all()
+        # Get all diagrams from the database without their content
+        diagrams = Diagram.list(**list_query_args())
         
-        # Return a simplified version with just id, name, and last_updated
-        result = [
+        # Return a simplified version with id, name, last_updated and metadata,
+        # serialized page by page as the diagrams are read
+        result = (
             {
                 "id": diagram.get('id'),
                 "name": diagram.get('name') or f"Untitled Diagram {diagram.get('id')}",
-                "last_updated": diagram.get('last_updated')
+                "last_updated": diagram.get('last_updated'),
+                **diagram_list_metadata(diagram)
             }
             for diagram in diagrams
-        ]
+        )
         
-        return jsonify(result)
+        return json_list_response(result)
             
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Error retrieving diagrams: {str(e)}")
         return jsonify({"error": "Failed to retrieve diagrams"}), 500
@@ -207,6 +365,9 @@ def get_diagram_by_id(diagram_id):
     """
     API endpoint to retrieve a specific diagram by ID.
     
+    The response has an ETag derived from the content hash; a request with a
+    matching If-None-Match header gets an empty 304 response.
+    
     Returns:
     {
         "id": 1,
@@ -221,8 +382,18 @@ def get_diagram_by_id(diagram_id):
         
         if not diagram:
             return jsonify({"error": f"Diagram with id {diagram_id} not found"}), 404
-            
-        return jsonify(Diagram.to_dict(diagram))
+        
+        # Include delta saves that have not been written to the database yet
+        session = edit_sessions.peek(diagram_id)
+        if session and session.dirty:
+            diagram["content"] = session.content
+        
+        result = Diagram.to_dict(diagram)
+        
+        # The content hash alone would miss renames and moves
+        response = jsonify(result)
+        response.set_etag(f"{result['version']}-{result['last_updated']}")
+        return response.make_conditional(request)
             
     except Exception as e:
         print(f"Error retrieving diagram: {str(e)}")
@@ -276,6 +447,9 @@ def update_diagram(diagram_id):
             
         updated_diagram = Diagram.update(diagram_id, update_data)
         
+        # Keep any editing session in sync with the saved content
+        edit_sessions.update(diagram_id, content, updated_diagram.get('last_updated'))
+        
         # Return the updated diagram
         return jsonify(Diagram.to_dict(updated_diagram))
         
@@ -284,6 +458,227 @@ def update_diagram(diagram_id):
         return jsonify({"error": "Failed to update diagram"}), 500
 
 
+@app.route("/api/diagram/<int:diagram_id>", methods=["PATCH"])
+def patch_diagram(diagram_id):
+    """
+    API endpoint to apply text operations to an existing diagram.
+    
+    Operations are applied in order to the cached content of the diagram, and
+    every offset refers to the text as modified by the operations before it.
+    Offsets and lengths are counted in characters. The write to the database is
+    debounced, so a burst of patches results in a single write.
+    
+    Expected request body:
+    {
+        "base_version": "9f86d0...",
+        "operations": [
+            {"offset": 120, "delete": 0, "insert": "D --> E[Error Handling]\n"}
+        ]
+    }
+    
+    Returns:
+    {
+        "id": 1,
+        "version": "60303a..."
+    }
+    
+    Or, if base_version does not match the current content (status 409):
+    {
+        "error": "Version mismatch",
+        "version": "2c26b4..."
+    }
+    """
+    try:
+        # Get request data
+        data = request.get_json()
+        
+        # Validate request data
+        if not data or "base_version" not in data or not isinstance(data.get("operations"), list):
+            return jsonify({"error": "Invalid request. Missing required fields."}), 400
+            
+        base_version = data["base_version"]
+        operations = data["operations"]
+        
+        # Get the editing session, loading the diagram if needed
+        session = edit_sessions.get(diagram_id)
+        
+        if not session:
+            return jsonify({"error": f"Diagram with id {diagram_id} not found"}), 404
+        
+        with session.lock:
+            if base_version != session.version:
+                return jsonify({"error": "Version mismatch", "version": session.version}), 409
+                
+            try:
+                content = apply_text_ops(session.content, operations)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+                
+            # Basic validation
+            if not content:
+                return jsonify({"error": "Invalid request. Empty content."}), 400
+                
+            if content != session.content:
+                edit_sessions.apply_change(session, content)
+                
+            version = session.version
+            
+        return jsonify({"id": diagram_id, "version": version})
+        
+    except Exception as e:
+        print(f"Error patching diagram: {str(e)}")
+        return jsonify({"error": "Failed to update diagram"}), 500
+
+
+@app.route("/api/diagram/<int:diagram_id>/ai-edit", methods=["POST"])
+def ai_edit_diagram(diagram_id):
+    """
+    API endpoint to update a stored diagram based on a natural language request.
+    
+    The current content is read from the server-side editing session, so the
+    client only sends the request text. The result is saved in the same call
+    and returned as a delta against the content the edit was applied to.
+    
+    Expected request body:
+    {
+        "user_request": "Add a new node for error handling",
+        "base_version": "9f86d0..." (optional, the version the client holds),
+        "mode": "chunked" (optional, edit each top-level subgraph separately and in parallel)
+    }
+    
+    Returns:
+    {
+        "id": 1,
+        "changed": true,
+        "base_version": "9f86d0...",
+        "version": "60303a...",
+        "delta": [{"offset": 120, "delete": 0, "insert": "D --> E[Error Handling]\n"}],
+        "last_updated": "2023-10-03T12:34:56"
+    }
+    
+    If base_version is given and does not match, the response also contains the
+    full "content" the delta applies to.
+    """
+    try:
+        # Get request data
+        data = request.get_json()
+        
+        # Validate request data
+        if not data or not data.get("user_request"):
+            return jsonify({"error": "Invalid request. Missing required fields."}), 400
+            
+        user_request = data["user_request"]
+        base_version = data.get("base_version")
+        
+        mode = data.get("mode", "default")
+        if mode not in AI_EDIT_MODES:
+            return jsonify({"error": f"Invalid mode. Use one of: {', '.join(AI_EDIT_MODES)}"}), 400
+        
+        # Get the editing session, loading the diagram if needed
+        session = edit_sessions.get(diagram_id)
+        
+        if not session:
+            return jsonify({"error": f"Diagram with id {diagram_id} not found"}), 404
+        
+        # Estimate outside the session lock; the charge is settled against the actual usage
+        estimate = estimate_ai_edit(session.content, user_request, mode == "chunked")
+        over_budget = check_token_budget(estimate)
+        if over_budget:
+            return over_budget
+        
+        usage = new_usage()
+        with session.lock:
+            current_code = session.content
+            current_version = session.version
+            last_updated = session.last_updated
+            
+            # Process the request using LangChain service
+            try:
+                updated_code = process_diagram_request(current_code, user_request, chunked=mode == "chunked", usage=usage)
+            finally:
+                settle_token_budget(request.remote_addr, estimate["input_tokens"] + estimate["output_tokens"], usage)
+            changed = updated_code != current_code
+            
+            # Persist the result
+            if changed:
+                updated_diagram = Diagram.update(diagram_id, {"content": updated_code})
+                last_updated = updated_diagram.get('last_updated')
+                edit_sessions.update(diagram_id, updated_code, last_updated)
+                
+        result = {
+            "id": diagram_id,
+            "changed": changed,
+            "base_version": current_version,
+            "version": content_hash(updated_code),
+            "delta": compute_text_delta(current_code, updated_code),
+            "last_updated": last_updated
+        }
+        
+        # The client's copy is stale, so send the content the delta applies to
+        if base_version and base_version != current_version:
+            result["content"] = current_code
+            
+        return jsonify(result)
+        
+    except Exception as e:
+        print(f"Error processing AI edit: {str(e)}")
+        return jsonify({"error": "Failed to process request"}), 500
+
+
+@app.route("/api/diagram/<int:diagram_id>/versions", methods=["GET"])
+def get_diagram_versions(diagram_id):
+    """
+    API endpoint to list the saved versions of a diagram, without their content.
+    
+    Returns:
+    [
+        {
+            "version_number": 2,
+            "kind": "delta",
+            "content_bytes": 1534,
+            "stored_bytes": 96,
+            "content_hash": "60303a...",
+            "created_at": "2023-10-03T12:34:56"
+        },
+        ...
+    ]
+    """
+    try:
+        # Check if diagram exists
+        if not Diagram.get_last_updated(diagram_id):
+            return jsonify({"error": f"Diagram with id {diagram_id} not found"}), 404
+            
+        return jsonify(DiagramVersion.get_all(diagram_id))
+    except Exception as e:
+        print(f"Error retrieving diagram versions: {str(e)}")
+        return jsonify({"error": "Failed to retrieve diagram versions"}), 500
+
+
+@app.route("/api/diagram/<int:diagram_id>/versions/<int:version_number>", methods=["GET"])
+def get_diagram_version(diagram_id, version_number):
+    """
+    API endpoint to retrieve the content of a specific version of a diagram.
+    
+    Returns:
+    {
+        "version_number": 2,
+        "content": "graph TD\nA[Start] --> B{Is it working?}",
+        "content_hash": "60303a...",
+        "created_at": "2023-10-03T12:34:56"
+    }
+    """
+    try:
+        version = DiagramVersion.get_content(diagram_id, version_number)
+        
+        if not version:
+            return jsonify({"error": f"Version {version_number} of diagram {diagram_id} not found"}), 404
+            
+        return jsonify(version)
+    except Exception as e:
+        print(f"Error retrieving diagram version: {str(e)}")
+        return jsonify({"error": "Failed to retrieve diagram version"}), 500
+
+
 @app.route("/api/diagram/<int:diagram_id>", methods=["DELETE"])
 def delete_diagram(diagram_id):
     """
@@ -309,6 +704,7 @@ def delete_diagram(diagram_id):
             
         # Delete the diagram
         Diagram.delete(diagram_id)
+        edit_sessions.invalidate(diagram_id)
         
         # Return success response
         return jsonify({
@@ -341,6 +737,8 @@ def get_folders():
                     "name": "Subfolder 1",
                     "parent_id": 1,
                     "is_root": false,
+                    "diagram_count": 3,
+                    "total_bytes": 2048,
                     "children": []
                 }
             ]
@@ -355,38 +753,83 @@ def get_folders():
             # This should not happen as we ensure a root folder exists at startup
             root_folder = ensure_root_folder_exists()
         
+        # Load all folders in one query and group them by parent
+        children_by_parent = {}
+        for folder in Folder.get_all() or []:
+            children_by_parent.setdefault(folder.get('parent_id'), []).append(folder)
+        
+        # Per-folder diagram counts, from precomputed metadata
+        stats_by_folder = Folder.get_diagram_stats()
+        
         # Build the hierarchy recursively
-        result = [build_folder_hierarchy(root_folder)]
+        result = [build_folder_hierarchy(root_folder, children_by_parent, stats_by_folder)]
         
         return jsonify(result)
     except Exception as e:
         print(f"Error retrieving folders: {str(e)}")
         return jsonify({"error": "Failed to retrieve folders"}), 500
 
-def build_folder_hierarchy(folder):
+def build_folder_hierarchy(folder, children_by_parent, stats_by_folder):
     """
-    Helper function to build a folder hierarchy recursively.
+    Helper function to build a folder hierarchy recursively from folders grouped by parent id.
     """
+    stats = stats_by_folder.get(folder.get('id'), {})
     folder_dict = {
         'id': folder.get('id'),
         'name': folder.get('name'),
         'parent_id': folder.get('parent_id'),
         'is_root': folder.get('is_root'),
+        'path': folder.get('path'),
         'created_at': folder.get('created_at'),
         'last_updated': folder.get('last_updated'),
+        'diagram_count': stats.get('diagram_count', 0),
+        'total_bytes': stats.get('total_bytes', 0),
         'children': []
     }
     
-    # Get all direct children
-    children = Folder.get_children(folder.get('id'))
-    
-    # Recursively build hierarchy for each child
-    for child in children:
-        child_dict = build_folder_hierarchy(child)
+    # Recursively build hierarchy for each direct child
+    for child in children_by_parent.get(folder.get('id'), []):
+        child_dict = build_folder_hierarchy(child, children_by_parent, stats_by_folder)
         folder_dict['children'].append(child_dict)
     
     return folder_dict
 
+@app.route("/api/folder/<int:folder_id>/breadcrumbs", methods=["GET"])
+def get_folder_breadcrumbs(folder_id):
+    """
+    API endpoint to retrieve a folder and its ancestors, from the root down.
+    
+    Returns:
+    [
+        {
+            "id": 1,
+            "name": "Root",
+            "parent_id": null,
+            "is_root": true,
+            "path": "/1/",
+            ...
+        },
+        {
+            "id": 4,
+            "name": "Subfolder 1",
+            "parent_id": 1,
+            "is_root": false,
+            "path": "/1/4/",
+            ...
+        }
+    ]
+    """
+    try:
+        ancestors = Folder.get_ancestors(folder_id)
+        
+        if not ancestors:
+            return jsonify({"error": f"Folder with id {folder_id} not found"}), 404
+            
+        return jsonify([Folder.to_dict(folder) for folder in ancestors])
+    except Exception as e:
+        print(f"Error retrieving breadcrumbs: {str(e)}")
+        return jsonify({"error": "Failed to retrieve breadcrumbs"}), 500
+
 @app.route("/api/folder", methods=["POST"])
 def create_folder():
     """
@@ -458,6 +901,8 @@ def update_folder(folder_id):
         "parent_id": 2 (optional, not applicable for root folder)
     }
     
+    Moving a folder moves its whole subtree in a single operation.
+    
     Returns:
     {
         "id": 1,
@@ -465,7 +910,8 @@ def update_folder(folder_id):
         "parent_id": 2,
         "is_root": false,
         "created_at": "2023-10-03T12:34:56",
-        "last_updated": "2023-10-03T12:34:56"
+        "last_updated": "2023-10-03T12:34:56",
+        "folders_moved": 3 (only when the folder was moved)
     }
     """
     try:
@@ -484,6 +930,7 @@ def update_folder(folder_id):
             
         # Create an update data dictionary
         update_data = {}
+        folders_moved = None
         
         # Update the folder name if provided
         if "name" in data and data["name"]:
@@ -505,13 +952,22 @@ def update_folder(folder_id):
                 if not parent_folder:
                     return jsonify({"error": f"Parent folder with id {data['parent_id']} not found"}), 404
                     
-            update_data["parent_id"] = data["parent_id"]
+                # Prevent moving a folder below one of its own subfolders
+                if Folder.is_in_subtree(parent_folder, folder):
+                    return jsonify({"error": "A folder cannot be moved into one of its subfolders"}), 400
+                    
+            # Move the folder and its subtree in one operation
+            if data["parent_id"] != folder.get("parent_id"):
+                folders_moved = Folder.move(folder_id, data["parent_id"])
             
         # Update the folder
         updated_folder = Folder.update(folder_id, update_data)
         
         # Return the updated folder
-        return jsonify(Folder.to_dict(updated_folder))
+        result = Folder.to_dict(updated_folder)
+        if folders_moved is not None:
+            result["folders_moved"] = folders_moved
+        return jsonify(result)
     except ValueError as e:
         # Handle the specific error from the model
         print(f"Error updating folder: {str(e)}")
@@ -525,10 +981,15 @@ def delete_folder(folder_id):
     """
     API endpoint to delete an existing folder.
     
+    With ?recursive=true the folder is deleted together with all its
+    subfolders and diagrams in a single operation.
+    
     Returns:
     {
         "success": true,
-        "message": "Folder deleted successfully"
+        "message": "Folder deleted successfully",
+        "folders_deleted": 3 (only for recursive deletes),
+        "diagrams_deleted": 12 (only for recursive deletes)
     }
     """
     try:
@@ -538,14 +999,25 @@ def delete_folder(folder_id):
         if not folder:
             return jsonify({"error": f"Folder with id {folder_id} not found"}), 404
             
+        recursive = request.args.get("recursive", "false").lower() == "true"
+        
         # Delete the folder (the model handles validation)
-        Folder.delete(folder_id)
+        result = Folder.delete(folder_id, recursive=recursive)
         
-        # Return success response
-        return jsonify({
+        response = {
             "success": True,
             "message": f"Folder with id {folder_id} deleted successfully"
-        })
+        }
+        
+        if recursive:
+            # Drop editing sessions of the deleted diagrams
+            for diagram_id in result.get("diagram_ids") or []:
+                edit_sessions.invalidate(diagram_id)
+            response["folders_deleted"] = result.get("folders_deleted", 0)
+            response["diagrams_deleted"] = result.get("diagrams_deleted", 0)
+        
+        # Return success response
+        return jsonify(response)
     except ValueError as e:
         # Handle the specific error from the model
         print(f"Error deleting folder: {str(e)}")
@@ -554,18 +1026,104 @@ def delete_folder(folder_id):
         print(f"Error deleting folder: {str(e)}")
         return jsonify({"error": "Failed to delete folder"}), 500
 
+@app.route("/api/folder/<int:folder_id>/ai-edit", methods=["POST"])
+def ai_edit_folder(folder_id):
+    """
+    API endpoint to apply one natural language request to every diagram in a folder.
+    
+    The diagrams are edited concurrently and the changed ones are saved in
+    batches. Progress is streamed back as NDJSON, one line per diagram as it
+    finishes, followed by a summary line.
+    
+    Expected request body:
+    {
+        "user_request": "Rename service X to Y",
+        "mode": "chunked" (optional, see /api/update-diagram),
+        "concurrency": 4 (optional, at most FOLDER_AI_EDIT_MAX_CONCURRENCY)
+    }
+    
+    Returns (streamed):
+    {"type": "diagram", "id": 1, "name": "Diagram 1", "status": "changed", "version": "60303a..."}
+    {"type": "diagram", "id": 2, "name": "Diagram 2", "status": "unchanged"}
+    {"type": "summary", "changed": 1, "unchanged": 1, "skipped": 0, "conflict": 0, "error": 0}
+    
+    Diagrams too large for the per-request token limit are reported as
+    skipped; the estimated tokens of the whole folder are charged to the
+    client's token budget up front and settled against the tokens used once
+    the response is closed.
+    """
+    try:
+        # Get request data
+        data = request.get_json()
+        
+        # Validate request data
+        if not data or not data.get("user_request"):
+            return jsonify({"error": "Invalid request. Missing required fields."}), 400
+        
+        user_request = data["user_request"]
+        
+        mode = data.get("mode", "default")
+        if mode not in AI_EDIT_MODES:
+            return jsonify({"error": f"Invalid mode. Use one of: {', '.join(AI_EDIT_MODES)}"}), 400
+        
+        try:
+            concurrency = int(data.get("concurrency", FOLDER_AI_EDIT_MAX_CONCURRENCY))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid concurrency"}), 400
+        
+        if not Folder.get(folder_id):
+            return jsonify({"error": f"Folder with id {folder_id} not found"}), 404
+        
+        # Load all diagrams of the folder with one query
+        diagrams = load_folder_diagrams(folder_id)
+        if len(diagrams) > FOLDER_AI_EDIT_MAX_DIAGRAMS:
+            return jsonify({"error": f"Folder has more than {FOLDER_AI_EDIT_MAX_DIAGRAMS} diagrams"}), 400
+        
+        # Charge the whole batch to the client's budget before starting
+        plan = plan_folder_edit(diagrams, user_request, mode == "chunked")
+        over_budget = charge_token_budget(plan["input_tokens"] + plan["output_tokens"])
+        if over_budget:
+            return over_budget
+        
+        usage = new_usage()
+        client = request.remote_addr
+        
+        def generate():
+            for event in run_folder_edit(plan, user_request, mode == "chunked", concurrency, usage):
+                yield dumps(event) + "\n"
+        
+        response = Response(
+            generate(),
+            mimetype="application/x-ndjson",
+            # Compressing would hold back progress lines
+            headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"}
+        )
+        # Refund the diagrams that were not edited, e.g. after the client disconnected
+        response.call_on_close(lambda: settle_token_budget(client, plan["input_tokens"] + plan["output_tokens"], usage))
+        return response
+        
+    except Exception as e:
+        print(f"Error editing folder: {str(e)}")
+        return jsonify({"error": "Failed to edit folder"}), 500
+
 @app.route("/api/folder/<int:folder_id>/diagrams", methods=["GET"])
 def get_diagrams_in_folder(folder_id):
     """
     API endpoint to retrieve all diagrams in a specific folder.
     
+    Accepts the same kind, sort and order query parameters as /api/diagrams.
+    
     Returns:
     [
         {
             "id": 1,
             "name": "Diagram 1",
             "last_updated": "2023-10-03T12:34:56",
-            "folder_id": 1
+            "folder_id": 1,
+            "kind": "flowchart",
+            "node_count": 12,
+            "edge_count": 14,
+            "byte_size": 512
         },
         ...
     ]
@@ -576,21 +1134,24 @@ def get_diagrams_in_folder(folder_id):
         if not folder:
             return jsonify({"error": f"Folder with id {folder_id} not found"}), 404
                 
-        # Get diagrams in the folder
-        diagrams = Diagram.get_by_folder(folder_id)
+        # Get diagrams in the folder without their content
+        diagrams = Diagram.list(folder_id=folder_id, **list_query_args())
         
-        # Return a simplified version with just id, name, last_updated, and folder_id
-        result = [
+        # Return a simplified version with id, name, last_updated, folder_id and metadata
+        result = (
             {
                 "id": diagram.get('id'),
                 "name": diagram.get('name') or f"Untitled Diagram {diagram.get('id')}",
                 "last_updated": diagram.get('last_updated'),
-                "folder_id": diagram.get('folder_id')
+                "folder_id": diagram.get('folder_id'),
+                **diagram_list_metadata(diagram)
             }
             for diagram in diagrams
-        ]
+        )
         
-        return jsonify(result)
+        return json_list_response(result)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Error retrieving diagrams: {str(e)}")
         return jsonify({"error": "Failed to retrieve diagrams"}), 500
@@ -644,6 +1205,192 @@ def move_diagram(diagram_id):
         print(f"Error moving diagram: {str(e)}")
         return jsonify({"error": "Failed to move diagram"}), 500
 
+@app.route("/api/diagrams/bulk", methods=["POST"])
+def bulk_diagram_operations():
+    """
+    API endpoint to apply a batch of move, delete, rename and create operations.
+    
+    The batch is validated with one query for diagrams and one for folders and
+    applied with one write per operation type, so the number of database round
+    trips does not depend on the batch size. Each operation succeeds or fails
+    on its own, also when one of the writes fails.
+    
+    Expected request body:
+    {
+        "operations": [
+            {"op": "move", "id": 1, "folder_id": 2},
+            {"op": "rename", "id": 3, "name": "New Name"},
+            {"op": "delete", "id": 4},
+            {"op": "create", "content": "graph TD\nA --> B", "name": "My Diagram", "folder_id": 2}
+        ]
+    }
+    
+    Returns:
+    {
+        "results": [
+            {"index": 0, "op": "move", "id": 1, "success": true},
+            {"index": 1, "op": "rename", "id": 3, "success": false, "error": "Diagram with id 3 not found"},
+            ...
+        ],
+        "succeeded": 3,
+        "failed": 1
+    }
+    """
+    try:
+        # Get request data
+        data = request.get_json()
+        
+        # Validate request data
+        if not data or not isinstance(data.get("operations"), list):
+            return jsonify({"error": "Invalid request. Missing required fields."}), 400
+            
+        operations = data["operations"]
+        if len(operations) > BULK_MAX_OPERATIONS:
+            return jsonify({"error": f"Too many operations. The maximum is {BULK_MAX_OPERATIONS}."}), 400
+        
+        # Invalid operations and failed writes are reported per operation
+        return jsonify(apply_bulk_operations(operations))
+        
+    except Exception as e:
+        print(f"Error applying bulk operations: {str(e)}")
+        return jsonify({"error": "Failed to apply bulk operations"}), 500
+
+@app.route("/api/search", methods=["GET"])
+def search_diagrams():
+    """
+    API endpoint to search diagrams by name and by the labels in their content.
+    
+    Query parameters:
+        q: the search query (required); the last word also matches as a prefix
+        limit: maximum number of results (optional, default 20)
+        folder_id: only search diagrams in this folder (optional)
+    
+    Returns:
+    [
+        {
+            "id": 1,
+            "name": "Checkout",
+            "folder_id": 1,
+            "score": 2.0794,
+            "snippets": ["Payment Gateway"]
+        },
+        ...
+    ]
+    """
+    try:
+        query = request.args.get("q", "").strip()
+        
+        if not query:
+            return jsonify({"error": "Invalid request. Missing search query."}), 400
+            
+        limit = min(request.args.get("limit", 20, type=int), 100)
+        folder_id = request.args.get("folder_id", type=int)
+        
+        return jsonify(search_index.search(query, limit, folder_id))
+    except Exception as e:
+        print(f"Error searching diagrams: {str(e)}")
+        return jsonify({"error": "Failed to search diagrams"}), 500
+
+
+# Seconds between keep-alive comments on idle change feed connections
+CHANGE_FEED_HEARTBEAT_SECONDS = float(os.getenv("CHANGE_FEED_HEARTBEAT_SECONDS", 15))
+
+# Seconds after which a change feed connection is closed; clients reconnect with Last-Event-ID
+CHANGE_FEED_MAX_SECONDS = float(os.getenv("CHANGE_FEED_MAX_SECONDS", 300))
+
+@app.route("/api/changes", methods=["GET"])
+def stream_changes():
+    """
+    API endpoint to follow folder and diagram changes as Server-Sent Events.
+    
+    Event types are folder.created, folder.updated, folder.moved, folder.deleted,
+    diagram.created, diagram.updated, diagram.moved and diagram.deleted. Each
+    event carries an id; reconnecting clients send it back in the Last-Event-ID
+    header (or the last_event_id query parameter) to receive the events they missed.
+    If those events are no longer available, a "reset" event is sent and the
+    client should reload its folders and diagram lists.
+    
+    Returns (text/event-stream):
+    id: 3f2a9c1d-42
+    event: diagram.moved
+    data: {"id": 1, "name": "My Diagram", "folder_id": 2, ...}
+    """
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    
+    def generate():
+        sequence = change_feed.parse_cursor(last_event_id)
+        
+        # Unknown cursor: start from now and ask the client to reload if it had one
+        if sequence is None:
+            sequence = change_feed.latest()
+            if last_event_id:
+                yield "event: reset\ndata: {}\n\n"
+        
+        yield "retry: 3000\n\n"
+        
+        deadline = time.monotonic() + CHANGE_FEED_MAX_SECONDS
+        while time.monotonic() < deadline:
+            events, missed = change_feed.events_after(sequence)
+            if missed:
+                yield "event: reset\ndata: {}\n\n"
+            for event in events:
+                sequence = event["sequence"]
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {app.json.dumps(event['data'])}\n\n"
+            
+            if not change_feed.wait(sequence, min(CHANGE_FEED_HEARTBEAT_SECONDS, max(deadline - time.monotonic(), 0))):
+                yield ": keep-alive\n\n"
+    
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.route("/api/export", methods=["GET"])
+def export_all():
+    """
+    API endpoint to export all folders and diagrams as a stream of JSON lines.
+    
+    Returns (application/x-ndjson):
+    {"type": "header", "version": 1, "exported_at": "2023-10-03T12:34:56"}
+    {"type": "folder", "id": 1, "name": "Root", "parent_id": null, "is_root": true, ...}
+    {"type": "diagram", "id": 1, "name": "My Diagram", "folder_id": 1, "content": "graph TD\nA --> B", ...}
+    """
+    filename = f"easy-diagram-export-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.ndjson"
+    return Response(
+        export_workspace(),
+        mimetype="application/x-ndjson",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+
+@app.route("/api/import", methods=["POST"])
+def import_all():
+    """
+    API endpoint to import an export created by /api/export.
+    
+    The request body is parsed line by line. Folders are created under new ids
+    (the exported root folder maps to the existing root folder) and diagrams
+    are inserted in batches into the corresponding new folders.
+    
+    Returns:
+    {
+        "folders_imported": 3,
+        "diagrams_imported": 120,
+        "errors": [{"line": 7, "error": "Invalid JSON"}]
+    }
+    """
+    try:
+        result = import_workspace(request.stream, app.json.loads)
+        return jsonify(result)
+    except ValueError as e:
+        print(f"Error importing workspace: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error importing workspace: {str(e)}")
+        return jsonify({"error": "Failed to import workspace"}), 500
+
 @app.route("/api/health", methods=["GET"])
 def health_check():
     """
@@ -0,0 +1,25 @@
+"""
+ASGI entry point, for serving the app with an ASGI server such as uvicorn.
+
+Run with (needs: pip install uvicorn a2wsgi):
+    uvicorn asgi:asgi_app --host 0.0.0.0 --port 5000
+
+Requests are handled by the WSGI app on a thread pool, so slow AI edits do
+not block the event loop. ASGI_THREADS bounds the number of requests handled
+at the same time; further requests wait for a free thread. Like the gunicorn
+thread count, it defaults to the expected concurrent AI edits plus open change
+feed streams plus headroom for CRUD requests.
+"""
+import os
+
+from a2wsgi import WSGIMiddleware
+
+from app import app
+
+ASGI_THREADS = int(os.getenv("ASGI_THREADS", (
+    int(os.getenv("EXPECTED_AI_CONCURRENCY", 100))
+    + int(os.getenv("EXPECTED_CHANGE_FEED_CLIENTS", 50))
+    + int(os.getenv("CRUD_THREADS", 32))
+)))
+
+asgi_app = WSGIMiddleware(app, workers=ASGI_THREADS)
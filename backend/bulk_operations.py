@@ -0,0 +1,188 @@
+"""
+Batches of diagram move, rename, delete and create operations.
+
+A batch is validated with one query for diagrams and one for folders and
+applied with one write per operation type, so the number of database round
+trips does not depend on the batch size. Each operation succeeds or fails on
+its own: invalid operations are reported without being applied, and when one
+of the writes fails only the operations of that write are reported as failed.
+"""
+import os
+from typing import Dict, List
+
+from edit_sessions import edit_sessions
+from models import Diagram, Folder, ensure_root_folder_exists
+
+# Maximum number of operations accepted in one batch
+BULK_MAX_OPERATIONS = int(os.getenv("BULK_MAX_OPERATIONS", 1000))
+
+# Length of the diagrams.name column
+NAME_MAX_LENGTH = 255
+
+
+def _name_error(name, required: bool):
+    """
+    Get the validation error of a diagram name, or None if it is valid.
+    """
+    if name is None and not required:
+        return None
+    if not isinstance(name, str):
+        return "Invalid operation. The name must be a string."
+    if required and not name:
+        return "Invalid operation. Empty name."
+    if len(name) > NAME_MAX_LENGTH:
+        return f"Invalid operation. The name is longer than {NAME_MAX_LENGTH} characters."
+    return None
+
+
+def apply_bulk_operations(operations: List) -> Dict:
+    """
+    Validate and apply a batch of operations.
+
+    Returns:
+        Dict: A "results" entry per operation, in order, and the numbers of
+        operations that "succeeded" and "failed"
+    """
+    results = [None] * len(operations)
+
+    def fail(index, error):
+        operation = operations[index]
+        results[index] = {
+            "index": index,
+            "op": operation.get("op") if isinstance(operation, dict) else None,
+            "id": operation.get("id") if isinstance(operation, dict) else None,
+            "success": False,
+            "error": error
+        }
+
+    def succeed(index, diagram_id):
+        results[index] = {"index": index, "op": operations[index]["op"], "id": diagram_id, "success": True}
+
+    # Collect the ids referenced by the batch
+    diagram_ids = set()
+    folder_ids = set()
+    for operation in operations:
+        if not isinstance(operation, dict):
+            continue
+        if operation.get("op") in ("move", "rename", "delete") and isinstance(operation.get("id"), int):
+            diagram_ids.add(operation["id"])
+        if operation.get("op") in ("move", "create") and isinstance(operation.get("folder_id"), int):
+            folder_ids.add(operation["folder_id"])
+
+    # Validate everything with one query per table
+    existing_diagrams = {diagram.get('id') for diagram in Diagram.get_many(diagram_ids, "id")}
+    existing_folders = {folder.get('id') for folder in Folder.get_many(folder_ids, "id")}
+    root_folder = None
+
+    deletes = {}
+    updates = {}
+    update_indices = {}
+    creates = []
+
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            fail(index, "Invalid operation.")
+            continue
+
+        op = operation.get("op")
+        diagram_id = operation.get("id")
+        folder_id = operation.get("folder_id")
+
+        if op not in ("move", "rename", "delete", "create"):
+            fail(index, f"Unknown operation: {op}")
+            continue
+
+        if op != "create":
+            if diagram_id not in existing_diagrams:
+                fail(index, f"Diagram with id {diagram_id} not found")
+                continue
+            if diagram_id in deletes:
+                fail(index, f"Diagram with id {diagram_id} is deleted in the same batch")
+                continue
+
+        if op in ("move", "create") and folder_id is not None and folder_id not in existing_folders:
+            fail(index, f"Folder with id {folder_id} not found")
+            continue
+
+        if op == "move":
+            if folder_id is None:
+                fail(index, "Invalid operation. Missing folder_id.")
+                continue
+            updates.setdefault(diagram_id, {"id": diagram_id})["folder_id"] = folder_id
+            update_indices.setdefault(diagram_id, []).append(index)
+        elif op == "rename":
+            error = _name_error(operation.get("name"), required=True)
+            if error:
+                fail(index, error)
+                continue
+            updates.setdefault(diagram_id, {"id": diagram_id})["name"] = operation["name"]
+            update_indices.setdefault(diagram_id, []).append(index)
+        elif op == "delete":
+            if diagram_id in updates:
+                fail(index, f"Diagram with id {diagram_id} is updated in the same batch")
+                continue
+            deletes[diagram_id] = index
+        elif op == "create":
+            content = operation.get("content")
+            if not isinstance(content, str) or not content:
+                fail(index, "Invalid operation. The content must be a non-empty string.")
+                continue
+            error = _name_error(operation.get("name"), required=False)
+            if error:
+                fail(index, error)
+                continue
+            if folder_id is None:
+                root_folder = root_folder or ensure_root_folder_exists()
+                folder_id = root_folder.get('id')
+            creates.append((index, {
+                "content": content,
+                "name": operation.get("name"),
+                "folder_id": folder_id
+            }))
+
+    # Apply the batch with one write per operation type
+    if deletes:
+        try:
+            Diagram.delete_many(list(deletes))
+            for diagram_id, index in deletes.items():
+                edit_sessions.invalidate(diagram_id)
+                succeed(index, diagram_id)
+        except Exception as e:
+            print(f"Error deleting diagrams: {str(e)}")
+            for index in deletes.values():
+                fail(index, "Failed to delete diagram")
+
+    if updates:
+        try:
+            updated = {diagram.get('id') for diagram in Diagram.update_many(list(updates.values()))}
+            for diagram_id, indices in update_indices.items():
+                for index in indices:
+                    if diagram_id in updated:
+                        succeed(index, diagram_id)
+                    else:
+                        # Deleted after the batch was validated
+                        fail(index, f"Diagram with id {diagram_id} not found")
+        except Exception as e:
+            print(f"Error updating diagrams: {str(e)}")
+            for indices in update_indices.values():
+                for index in indices:
+                    fail(index, "Failed to update diagram")
+
+    if creates:
+        try:
+            created = Diagram.create_many([diagram for _, diagram in creates])
+            for (index, _), diagram in zip(creates, created):
+                succeed(index, diagram.get('id'))
+            for index, _ in creates[len(created):]:
+                fail(index, "Failed to create diagram")
+        except Exception as e:
+            print(f"Error creating diagrams: {str(e)}")
+            for index, _ in creates:
+                fail(index, "Failed to create diagram")
+
+    succeeded = sum(1 for result in results if result["success"])
+    return {
+        "results": results,
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded
+    }
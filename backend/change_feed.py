@@ -0,0 +1,94 @@
+"""
+In-memory change feed of folder and diagram events.
+
+Write paths publish create, update, move and delete events into a bounded ring
+buffer. Clients follow the feed over Server-Sent Events and resume from the
+last event they saw. Event ids include a per-process epoch, so a cursor from
+before a restart (or from another server process) is detected and the client
+is told to reload instead of silently missing events.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# Number of events kept for resuming clients
+CHANGE_FEED_CAPACITY = int(os.getenv("CHANGE_FEED_CAPACITY", 1000))
+
+
+class ChangeFeed:
+    """
+    Bounded ring buffer of change events with blocking waits for new events.
+    """
+
+    def __init__(self, capacity: int = CHANGE_FEED_CAPACITY):
+        self.epoch = uuid.uuid4().hex[:8]
+        self._events = deque(maxlen=capacity)
+        self._sequence = 0
+        self._condition = threading.Condition()
+
+    def publish(self, entity: str, action: str, data: Dict):
+        """
+        Publish an event, e.g. publish("diagram", "moved", {"id": 1, "folder_id": 2}).
+        """
+        with self._condition:
+            self._sequence += 1
+            self._events.append({
+                "sequence": self._sequence,
+                "id": f"{self.epoch}-{self._sequence}",
+                "type": f"{entity}.{action}",
+                "data": data,
+                "timestamp": datetime.utcnow().isoformat()
+            })
+            self._condition.notify_all()
+
+    def parse_cursor(self, event_id: Optional[str]) -> Optional[int]:
+        """
+        Get the sequence number of an event id from this process, or None if it cannot be resumed from.
+        """
+        if not event_id:
+            return None
+        epoch, _, sequence = event_id.partition("-")
+        if epoch != self.epoch or not sequence.isdigit():
+            return None
+        return int(sequence)
+
+    def latest(self) -> int:
+        """
+        Get the sequence number of the latest event.
+        """
+        with self._condition:
+            return self._sequence
+
+    def events_after(self, sequence: int) -> Tuple[List[Dict], bool]:
+        """
+        Get the buffered events after a sequence number.
+
+        Returns the events and whether events after the sequence number have
+        already been dropped from the buffer.
+        """
+        with self._condition:
+            if not self._events:
+                return [], False
+            oldest = self._events[0]["sequence"]
+            missed = sequence < oldest - 1
+            return [event for event in self._events if event["sequence"] > sequence], missed
+
+    def wait(self, sequence: int, timeout: float) -> bool:
+        """
+        Wait until there are events after a sequence number. Returns False on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._sequence <= sequence:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+
+change_feed = ChangeFeed()
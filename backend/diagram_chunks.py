@@ -0,0 +1,176 @@
+"""
+Splitting of large flowcharts into independently editable chunks.
+
+Each top-level subgraph block becomes one chunk, and the lines outside any
+subgraph (edges between subgraphs, top-level nodes and styling) become one
+more. Whole-diagram requests such as translating every label can then be
+applied to the chunks in parallel, and the edited chunks are reassembled into
+the full diagram. Whenever a diagram cannot be split or an edited chunk does
+not fit back, callers should fall back to editing the full diagram.
+"""
+import os
+from typing import Dict, List, Optional, Set
+
+from diagram_parser import parse_flowchart
+
+# Diagrams with fewer top-level subgraphs than this are not split
+CHUNKED_MIN_SUBGRAPHS = int(os.getenv("CHUNKED_MIN_SUBGRAPHS", 2))
+
+FENCE = "```"
+
+
+def _subgraph_id(line: str) -> str:
+    """
+    Get the id (or title) that follows the subgraph keyword.
+    """
+    parts = line.strip().split(None, 1)
+    return parts[1].strip() if len(parts) > 1 else ""
+
+
+def split_into_chunks(code: str) -> Optional[Dict]:
+    """
+    Split a flowchart into its top-level subgraph blocks and the remaining lines.
+
+    Args:
+        code (str): The full mermaid diagram code
+
+    Returns:
+        Optional[Dict]: The "header", the "chunks" (each with its "lines", the
+        "line_indices" they were taken from, the line index to put the edited
+        lines back at as "insert_at", the node ids it references as "nodes"
+        and whether it "is_subgraph"), and the node ids referenced by
+        more than one chunk as "shared_nodes"; or None if the diagram cannot
+        be split
+    """
+    parsed = parse_flowchart(code)
+    if not parsed or not parsed["header"]:
+        return None
+
+    statements = parsed["statements"]
+
+    # linkStyle refers to edges by position, which editing chunks separately would invalidate
+    if any(statement.text.strip().startswith("linkStyle") for statement in statements):
+        return None
+
+    subgraphs: List[Dict] = []
+    remainder = {"lines": [], "line_indices": [], "nodes": set(), "is_subgraph": False}
+    current = None
+
+    for statement in statements:
+        if statement.kind == "header":
+            continue
+        if statement.kind == "subgraph" and statement.depth == 0:
+            current = {"lines": [], "line_indices": [], "nodes": set(), "is_subgraph": True}
+            subgraphs.append(current)
+
+        chunk = current if current is not None else remainder
+        chunk["lines"].append(statement.text)
+        chunk["line_indices"].append(statement.index)
+        chunk["nodes"].update(statement.nodes)
+
+        if statement.kind == "end" and statement.depth == 0 and current is not None:
+            current = None
+
+    # An unterminated subgraph cannot be split reliably
+    if current is not None or len(subgraphs) < CHUNKED_MIN_SUBGRAPHS:
+        return None
+
+    # Subgraphs are put back in place; the remaining lines are put back after the
+    # last of them, so edges and styling still follow the nodes they refer to
+    for chunk in subgraphs:
+        chunk["insert_at"] = chunk["line_indices"][0]
+    chunks = subgraphs[:]
+    if any(line.strip() and not line.strip().startswith("%%") for line in remainder["lines"]):
+        remainder["insert_at"] = remainder["line_indices"][-1]
+        chunks.append(remainder)
+
+    # Nodes that are referenced in several chunks must keep their ids
+    seen: Dict[str, int] = {}
+    shared: Set[str] = set()
+    for position, chunk in enumerate(chunks):
+        for node_id in chunk["nodes"]:
+            if node_id in seen and seen[node_id] != position:
+                shared.add(node_id)
+            seen[node_id] = position
+
+    return {
+        "header": parsed["header"].strip(),
+        "chunks": chunks,
+        "shared_nodes": shared,
+    }
+
+
+def clean_edited_chunk(chunk: Dict, edited: str, shared_nodes: Set[str]) -> Optional[List[str]]:
+    """
+    Check that an edited chunk can replace the original chunk.
+
+    Args:
+        chunk (Dict): The original chunk, as returned by split_into_chunks
+        edited (str): The edited chunk returned by the model
+        shared_nodes (Set[str]): Node ids that other chunks refer to
+
+    Returns:
+        Optional[List[str]]: The edited lines, or None if they do not fit back
+        into the diagram
+    """
+    lines = [line.rstrip() for line in edited.split("\n") if not line.strip().startswith(FENCE)]
+    while lines and not lines[0].strip():
+        lines.pop(0)
+    while lines and not lines[-1].strip():
+        lines.pop()
+
+    # Drop a diagram header if the model added one
+    if lines and lines[0].strip().split(" ")[0] in ("graph", "flowchart"):
+        lines = lines[1:]
+
+    meaningful = [line.strip() for line in lines if line.strip() and not line.strip().startswith("%%")]
+    if not meaningful:
+        return None
+
+    first_words = [line.split()[0] for line in meaningful]
+    opened = first_words.count("subgraph")
+    if opened != first_words.count("end"):
+        return None
+
+    if chunk["is_subgraph"]:
+        # The block must still be one subgraph with the same id
+        original_first = next(line for line in chunk["lines"] if line.strip().startswith("subgraph"))
+        if first_words[0] != "subgraph" or first_words[-1] != "end":
+            return None
+        if _subgraph_id(meaningful[0]).split("[")[0].strip() != _subgraph_id(original_first).split("[")[0].strip():
+            return None
+    elif opened:
+        # Subgraphs added outside the original blocks would not be reassembled correctly
+        return None
+
+    # Every node the other chunks refer to must still exist
+    parsed = parse_flowchart("graph TD\n" + "\n".join(lines))
+    if not parsed:
+        return None
+    missing = (chunk["nodes"] & shared_nodes) - set(parsed["nodes"])
+    if missing:
+        return None
+
+    return lines
+
+
+def reassemble_chunks(code: str, split: Dict, edited_chunks: List[List[str]]) -> str:
+    """
+    Replace the lines of every chunk of a diagram with its edited lines.
+
+    Each chunk's edited lines are placed at the chunk's "insert_at" line.
+    """
+    lines = code.split("\n")
+    replacements = {}
+    removed = set()
+    for chunk, edited_lines in zip(split["chunks"], edited_chunks):
+        replacements[chunk["insert_at"]] = edited_lines
+        removed.update(chunk["line_indices"])
+
+    result = []
+    for index, line in enumerate(lines):
+        if index in replacements:
+            result.extend(replacements[index])
+        if index not in removed:
+            result.append(line)
+    return "\n".join(result)
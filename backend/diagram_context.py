@@ -0,0 +1,171 @@
+"""
+Relevance-based context trimming for large flowchart diagrams.
+
+Instead of sending a whole diagram to the model, the nodes named in the user's
+request are located, the subgraph within a few hops of them is cut out as an
+excerpt, and the model's edited excerpt is spliced back into the full diagram.
+Whenever the excerpt cannot be chosen with confidence, callers should fall back
+to sending the full diagram.
+"""
+import os
+import re
+from typing import Dict, List, Optional
+
+from diagram_parser import parse_flowchart, get_neighbourhood
+
+# Diagrams shorter than this are always sent in full
+CONTEXT_TRIM_MIN_LINES = int(os.getenv("CONTEXT_TRIM_MIN_LINES", 150))
+
+# Number of hops around the nodes named in the request to include in the excerpt
+CONTEXT_TRIM_HOPS = int(os.getenv("CONTEXT_TRIM_HOPS", 2))
+
+# Give up trimming if the excerpt would contain more than this fraction of the diagram
+CONTEXT_TRIM_MAX_FRACTION = float(os.getenv("CONTEXT_TRIM_MAX_FRACTION", 0.5))
+
+# Give up trimming if the request names more nodes than this
+CONTEXT_TRIM_MAX_ANCHORS = 10
+
+# Requests containing these words are likely to touch the whole diagram
+GLOBAL_REQUEST_WORDS = {
+    "all", "every", "each", "entire", "whole", "everything", "everywhere",
+    "throughout", "overall", "layout", "direction", "reorganize", "reorder",
+    "rearrange", "restructure", "consistent",
+}
+
+WORD_RE = re.compile(r"[\w\-]+")
+
+
+def _find_anchor_nodes(nodes: Dict[str, str], user_request: str) -> List[str]:
+    """
+    Find the nodes referred to in the user's request, either by id or by label.
+    """
+    request_lower = user_request.lower()
+    request_words = set(WORD_RE.findall(user_request))
+    anchors = []
+
+    for node_id, label in nodes.items():
+        if node_id in request_words and len(node_id) > 1:
+            anchors.append(node_id)
+            continue
+        if label and len(label) >= 3:
+            pattern = r"(?<![\w])" + re.escape(label.lower()) + r"(?![\w])"
+            if re.search(pattern, request_lower):
+                anchors.append(node_id)
+
+    return anchors
+
+
+def build_trimmed_context(code: str, user_request: str, hops: int = CONTEXT_TRIM_HOPS) -> Optional[Dict]:
+    """
+    Select the part of a diagram that is relevant to the user's request.
+
+    Args:
+        code (str): The full mermaid diagram code
+        user_request (str): The user's natural language request
+        hops (int): Number of hops around the named nodes to include
+
+    Returns:
+        Optional[Dict]: The excerpt, a summary of the remaining node declarations
+        and the line indices the excerpt was taken from, or None when trimming
+        is not appropriate and the full diagram should be sent instead
+    """
+    lines = code.split("\n")
+    if len(lines) < CONTEXT_TRIM_MIN_LINES:
+        return None
+
+    request_words = {word.lower() for word in WORD_RE.findall(user_request)}
+    if request_words & GLOBAL_REQUEST_WORDS:
+        return None
+
+    parsed = parse_flowchart(code)
+    if not parsed or not parsed["header"]:
+        return None
+
+    statements = parsed["statements"]
+
+    # linkStyle refers to edges by position, which splicing would invalidate
+    if any(statement.text.strip().startswith("linkStyle") for statement in statements):
+        return None
+
+    anchors = _find_anchor_nodes(parsed["nodes"], user_request)
+    if not anchors or len(anchors) > CONTEXT_TRIM_MAX_ANCHORS:
+        return None
+
+    selected_nodes = get_neighbourhood(parsed["edges"], set(anchors), hops)
+
+    selected_statements = [
+        statement for statement in statements
+        if statement.nodes and set(statement.nodes) <= selected_nodes
+    ]
+    if not selected_statements:
+        return None
+
+    # Splicing lines back into subgraphs is not reliable
+    if any(statement.depth > 0 for statement in selected_statements):
+        return None
+
+    if len(selected_statements) > len(lines) * CONTEXT_TRIM_MAX_FRACTION:
+        return None
+
+    other_nodes = [
+        f"{node_id}[{label}]" if label else node_id
+        for node_id, label in parsed["nodes"].items()
+        if node_id not in selected_nodes
+    ]
+
+    return {
+        "header": parsed["header"].strip(),
+        "excerpt": "\n".join(statement.text for statement in selected_statements),
+        "summary": ", ".join(other_nodes),
+        "line_indices": [statement.index for statement in selected_statements],
+    }
+
+
+def splice_excerpt(code: str, context: Dict, edited_excerpt: str) -> Optional[str]:
+    """
+    Replace the excerpt lines of a diagram with the model's edited excerpt.
+
+    Args:
+        code (str): The full mermaid diagram code
+        context (Dict): The context returned by build_trimmed_context
+        edited_excerpt (str): The edited excerpt returned by the model
+
+    Returns:
+        Optional[str]: The full updated diagram code, or None if the edited
+        excerpt does not look like a valid replacement
+    """
+    # An empty answer would delete the excerpt
+    if not edited_excerpt.strip():
+        return None
+
+    edited_lines = [line for line in edited_excerpt.strip().split("\n") if not line.strip().startswith("```")]
+
+    # Drop a diagram header if the model added one
+    if edited_lines and edited_lines[0].strip().split(" ")[0] in ("graph", "flowchart"):
+        edited_lines = edited_lines[1:]
+
+    if not edited_lines:
+        return None
+
+    lines = code.split("\n")
+    line_indices = context["line_indices"]
+
+    # The model answered with something closer to a whole diagram than an excerpt
+    if len(edited_lines) > len(line_indices) + (len(lines) - len(line_indices)) // 2:
+        return None
+
+    # Nested subgraphs in the excerpt would end up in the wrong place
+    if any(line.strip().split(" ")[0] in ("subgraph", "end") for line in edited_lines):
+        return None
+
+    removed = set(line_indices)
+    insert_at = line_indices[0]
+
+    result = []
+    for index, line in enumerate(lines):
+        if index == insert_at:
+            result.extend(edited_lines)
+        if index not in removed:
+            result.append(line)
+
+    return "\n".join(result)
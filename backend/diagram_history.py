@@ -0,0 +1,189 @@
+"""
+Compact encoding of diagram version history.
+
+A diagram's history is a chain of versions. Every few versions a full snapshot
+is stored; the versions in between are stored as line diffs against the
+previous version. Payloads are zlib compressed and base64 encoded so they can
+be stored in a text column.
+
+Run this module directly to benchmark the encoding on a synthetic edit history.
+"""
+import base64
+import difflib
+import json
+import os
+import zlib
+from typing import Dict, List, Optional
+
+# Store a full snapshot at least every this many versions
+HISTORY_SNAPSHOT_INTERVAL = int(os.getenv("HISTORY_SNAPSHOT_INTERVAL", 20))
+
+# Number of versions kept per diagram by the compaction job
+HISTORY_MAX_VERSIONS = int(os.getenv("HISTORY_MAX_VERSIONS", 200))
+
+SNAPSHOT = "snapshot"
+DELTA = "delta"
+
+
+def _compress(data: str) -> str:
+    return base64.b64encode(zlib.compress(data.encode("utf-8"), 9)).decode("ascii")
+
+
+def _decompress(payload: str) -> str:
+    return zlib.decompress(base64.b64decode(payload)).decode("utf-8")
+
+
+def encode_snapshot(content: str) -> str:
+    """
+    Encode the full content of a version.
+
+    Args:
+        content (str): The diagram content
+
+    Returns:
+        str: The encoded payload
+    """
+    return _compress(content)
+
+
+def encode_delta(previous: str, content: str) -> str:
+    """
+    Encode a version as a line diff against the previous version.
+
+    The diff is a list of [start, end, lines] entries, each replacing lines
+    start..end of the previous version with the given lines.
+
+    Args:
+        previous (str): The content of the previous version
+        content (str): The content of the new version
+
+    Returns:
+        str: The encoded payload
+    """
+    previous_lines = previous.splitlines(keepends=True)
+    lines = content.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, previous_lines, lines, autojunk=False)
+
+    diff = [
+        [old_start, old_end, lines[new_start:new_end]]
+        for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+    return _compress(json.dumps(diff, separators=(",", ":")))
+
+
+def apply_delta(previous: str, payload: str) -> str:
+    """
+    Apply an encoded line diff to the previous version.
+
+    Args:
+        previous (str): The content of the previous version
+        payload (str): The encoded diff
+
+    Returns:
+        str: The content of the new version
+    """
+    lines = previous.splitlines(keepends=True)
+    # Apply from the end so earlier line numbers stay valid
+    for old_start, old_end, new_lines in reversed(json.loads(_decompress(payload))):
+        lines[old_start:old_end] = new_lines
+    return "".join(lines)
+
+
+def encode_version(previous: Optional[str], content: str, deltas_since_snapshot: int) -> Dict:
+    """
+    Choose how to store a new version and encode it.
+
+    A snapshot is stored for the first version, after HISTORY_SNAPSHOT_INTERVAL - 1
+    consecutive deltas, or when the delta would not be much smaller than a snapshot.
+
+    Args:
+        previous (Optional[str]): The content of the previous version, if any
+        content (str): The content of the new version
+        deltas_since_snapshot (int): Number of deltas stored since the last snapshot
+
+    Returns:
+        Dict: The "kind" and "payload" of the version
+    """
+    snapshot = encode_snapshot(content)
+    if previous is None or deltas_since_snapshot >= HISTORY_SNAPSHOT_INTERVAL - 1:
+        return {"kind": SNAPSHOT, "payload": snapshot}
+
+    delta = encode_delta(previous, content)
+    if len(delta) * 2 > len(snapshot):
+        return {"kind": SNAPSHOT, "payload": snapshot}
+
+    return {"kind": DELTA, "payload": delta}
+
+
+def reconstruct(versions: List[Dict]) -> str:
+    """
+    Reconstruct the content of the last version in a chain.
+
+    Args:
+        versions (List[Dict]): Versions in ascending order, starting with a snapshot
+
+    Returns:
+        str: The content of the last version
+
+    Raises:
+        ValueError: If the chain does not start with a snapshot
+    """
+    if not versions or versions[0].get("kind") != SNAPSHOT:
+        raise ValueError("Version chain must start with a snapshot")
+
+    content = _decompress(versions[0]["payload"])
+    for version in versions[1:]:
+        if version.get("kind") == SNAPSHOT:
+            content = _decompress(version["payload"])
+        else:
+            content = apply_delta(content, version["payload"])
+    return content
+
+
+def _benchmark(lines: int = 300, edits: int = 1000):
+    """
+    Report storage per version and reconstruction time on a synthetic edit history.
+    """
+    import random
+    import time
+
+    random.seed(0)
+    diagram = ["flowchart TD"] + [f"    N{i}[Step {i}] --> N{i + 1}" for i in range(lines)]
+    previous = None
+    versions = []
+    deltas_since_snapshot = 0
+    full_bytes = 0
+
+    for edit in range(edits):
+        index = random.randint(1, len(diagram) - 1)
+        if edit % 3 == 0:
+            diagram.insert(index, f"    N{index} --> X{edit}[Retry {edit}]")
+        else:
+            diagram[index] = diagram[index].replace("Step", "Stage", 1)
+        content = "\n".join(diagram)
+        version = encode_version(previous, content, deltas_since_snapshot)
+        deltas_since_snapshot = 0 if version["kind"] == SNAPSHOT else deltas_since_snapshot + 1
+        versions.append(version)
+        full_bytes += len(content.encode("utf-8"))
+        previous = content
+
+    stored_bytes = sum(len(version["payload"]) for version in versions)
+    snapshots = sum(1 for version in versions if version["kind"] == SNAPSHOT)
+
+    start = time.perf_counter()
+    last_snapshot = max(i for i, version in enumerate(versions) if version["kind"] == SNAPSHOT)
+    assert reconstruct(versions[last_snapshot:]) == previous
+    rounds = 100
+    for _ in range(rounds):
+        reconstruct(versions[last_snapshot:])
+    elapsed = (time.perf_counter() - start) / (rounds + 1)
+
+    print(f"versions: {edits} ({snapshots} snapshots, interval {HISTORY_SNAPSHOT_INTERVAL})")
+    print(f"full copies: {full_bytes / edits:.0f} bytes/version")
+    print(f"stored:      {stored_bytes / edits:.0f} bytes/version")
+    print(f"reconstruction of latest version: {elapsed * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,373 @@
+"""
+Lightweight parsing helpers for mermaid flowchart code.
+
+This is not a full mermaid grammar. It understands enough of the flowchart
+syntax (node declarations, edges, subgraphs and styling directives) to let the
+backend reason about the structure of a diagram without rendering it.
+"""
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+# Diagram type keywords recognized at the start of mermaid code
+DIAGRAM_KINDS = (
+    "graph", "flowchart", "sequenceDiagram", "classDiagram",
+    "stateDiagram", "erDiagram", "journey", "gantt", "pie"
+)
+
+# Diagram types whose structure can be parsed by this module
+FLOWCHART_KINDS = ("graph", "flowchart")
+
+# Statements that start with one of these keywords are styling/interaction directives
+DIRECTIVE_KEYWORDS = ("classDef", "class", "style", "linkStyle", "click")
+
+# Keywords that can never be node identifiers
+RESERVED_WORDS = {"subgraph", "end", "direction", "graph", "flowchart"}
+
+# Edge operators such as -->, ---, -.->, ==>, --o, <-->, ~~~
+EDGE_OPERATOR_RE = re.compile(r"\s*(?:<?(?:-{2,}|={2,}|-?\.+-?)[->xo]?|~~~)\s*")
+
+# Edge text written inline, e.g. "A -- some text --> B" or "A == text ==> B"
+INLINE_EDGE_TEXT_RE = re.compile(r"(--|==|-\.)\s+[^|\-=.>][^|]*?\s*(?=-->|---|==>|===|\.->|\.-)")
+
+NODE_ID_RE = re.compile(r"[A-Za-z0-9_][\w\-]*")
+
+OPENERS = {"[": "]", "(": ")", "{": "}"}
+
+
+class Statement:
+    """
+    A single line of a flowchart together with the nodes and edges it references.
+    """
+
+    def __init__(self, index: int, text: str, kind: str, depth: int):
+        self.index = index
+        self.text = text
+        self.kind = kind
+        self.depth = depth
+        self.nodes: List[str] = []
+        self.edges: List[Tuple[str, str]] = []
+        self.labels: Dict[str, str] = {}
+
+
+def get_diagram_kind(code: str) -> Optional[str]:
+    """
+    Get the diagram type keyword from the first meaningful line of mermaid code.
+
+    Args:
+        code (str): The mermaid code
+
+    Returns:
+        Optional[str]: The first word of the header line (e.g. "graph"), or None
+    """
+    for line in code.strip().split("\n"):
+        stripped = line.strip()
+        if not stripped or stripped.startswith("%%"):
+            continue
+        return stripped.split()[0].rstrip(";")
+    return None
+
+
+def detect_diagram_kind(code: str) -> Optional[str]:
+    """
+    Detect the mermaid diagram type from the first line of the code.
+
+    Args:
+        code (str): The mermaid code
+
+    Returns:
+        Optional[str]: The matching keyword from DIAGRAM_KINDS, or None if the
+        code does not start with a known diagram type
+    """
+    first_line = code.strip().split("\n")[0].strip()
+    for kind in DIAGRAM_KINDS:
+        if first_line.startswith(kind):
+            return kind
+    return None
+
+
+def _mask_labels(text: str) -> Tuple[str, Dict[int, str]]:
+    """
+    Replace bracketed labels, edge labels and quoted strings with spaces.
+
+    Returns the masked text and a mapping from the start offset of each node
+    shape to the label text it contained.
+    """
+    chars = list(text)
+    labels: Dict[int, str] = {}
+    i = 0
+    length = len(text)
+
+    while i < length:
+        char = text[i]
+        prev = text[i - 1] if i > 0 else ""
+
+        if char == '"':
+            end = text.find('"', i + 1)
+            end = length - 1 if end == -1 else end
+            for j in range(i, end + 1):
+                chars[j] = " "
+            i = end + 1
+            continue
+
+        if char == "|":
+            end = text.find("|", i + 1)
+            end = length - 1 if end == -1 else end
+            for j in range(i, end + 1):
+                chars[j] = " "
+            i = end + 1
+            continue
+
+        # Asymmetric shape: A>label]
+        is_asymmetric = char == ">" and (prev.isalnum() or prev == "_")
+        if char in OPENERS or is_asymmetric:
+            closer = "]" if is_asymmetric else OPENERS[char]
+            depth = 0
+            j = i
+            while j < length:
+                if text[j] == '"':
+                    quote_end = text.find('"', j + 1)
+                    j = length - 1 if quote_end == -1 else quote_end
+                elif not is_asymmetric and text[j] == char:
+                    depth += 1
+                elif text[j] == closer:
+                    depth -= 1
+                    if depth <= 0:
+                        break
+                j += 1
+            end = min(j, length - 1)
+            raw_label = text[i + 1:end].strip()
+            if '"' in raw_label:
+                raw_label = raw_label[raw_label.find('"') + 1:raw_label.rfind('"')]
+            else:
+                raw_label = raw_label.strip("[](){}/\\> ")
+            labels[i] = raw_label.strip()
+            for k in range(i, end + 1):
+                chars[k] = " "
+            i = end + 1
+            continue
+
+        i += 1
+
+    return "".join(chars), labels
+
+
+def _parse_node_group(masked: str, offset: int, labels: Dict[int, str], statement: Statement) -> List[str]:
+    """
+    Parse one side of an edge ("A", "A[Label]", "A & B") into node identifiers.
+    """
+    ids = []
+    for match in NODE_ID_RE.finditer(masked):
+        node_id = match.group(0)
+        if node_id in RESERVED_WORDS:
+            continue
+        ids.append(node_id)
+        label = labels.get(offset + match.end())
+        if label:
+            statement.labels[node_id] = label
+    return ids
+
+
+def _parse_graph_statement(text: str, statement: Statement) -> None:
+    """
+    Collect the nodes, edges and labels referenced by a node or edge statement.
+    """
+    cleaned = INLINE_EDGE_TEXT_RE.sub("", text)
+    masked, labels = _mask_labels(cleaned)
+
+    groups = []
+    position = 0
+    for match in EDGE_OPERATOR_RE.finditer(masked):
+        if not match.group(0).strip():
+            continue
+        groups.append((masked[position:match.start()], position))
+        position = match.end()
+    groups.append((masked[position:], position))
+
+    previous: List[str] = []
+    for group_text, group_offset in groups:
+        ids = _parse_node_group(group_text, group_offset, labels, statement)
+        if not ids:
+            continue
+        for node_id in ids:
+            if node_id not in statement.nodes:
+                statement.nodes.append(node_id)
+        for source in previous:
+            for target in ids:
+                statement.edges.append((source, target))
+        previous = ids
+
+    statement.kind = "edge" if statement.edges else "node"
+
+
+def _parse_directive(text: str, statement: Statement) -> None:
+    """
+    Collect the nodes referenced by a style/class/click directive.
+    """
+    parts = text.split()
+    keyword = parts[0]
+    if keyword in ("style", "click") and len(parts) > 1:
+        statement.nodes = [parts[1]]
+    elif keyword == "class" and len(parts) > 1:
+        statement.nodes = [node_id for node_id in parts[1].split(",") if node_id]
+
+
+def parse_flowchart(code: str) -> Optional[Dict]:
+    """
+    Parse flowchart mermaid code into statements, nodes and edges.
+
+    Args:
+        code (str): The mermaid code
+
+    Returns:
+        Optional[Dict]: A dictionary with "header", "statements", "nodes"
+        (node id -> label) and "edges", or None if the code is not a flowchart
+    """
+    if get_diagram_kind(code) not in FLOWCHART_KINDS:
+        return None
+
+    statements: List[Statement] = []
+    nodes: Dict[str, str] = {}
+    edges: List[Tuple[str, str]] = []
+    header: Optional[str] = None
+    depth = 0
+
+    for index, line in enumerate(code.split("\n")):
+        text = line.strip().rstrip(";").strip()
+
+        if not text:
+            statements.append(Statement(index, line, "blank", depth))
+            continue
+        if text.startswith("%%"):
+            statements.append(Statement(index, line, "comment", depth))
+            continue
+        if header is None:
+            header = line
+            statements.append(Statement(index, line, "header", depth))
+            continue
+
+        first_word = text.split()[0]
+
+        if first_word == "subgraph":
+            statement = Statement(index, line, "subgraph", depth)
+            depth += 1
+        elif first_word == "end":
+            depth = max(depth - 1, 0)
+            statement = Statement(index, line, "end", depth)
+        elif first_word == "direction":
+            statement = Statement(index, line, "other", depth)
+        elif first_word in DIRECTIVE_KEYWORDS:
+            statement = Statement(index, line, "directive", depth)
+            _parse_directive(text, statement)
+        else:
+            statement = Statement(index, line, "node", depth)
+            for part in text.split(";"):
+                if part.strip():
+                    _parse_graph_statement(part.strip(), statement)
+            if statement.edges:
+                statement.kind = "edge"
+
+        for node_id in statement.nodes:
+            nodes.setdefault(node_id, "")
+        for node_id, label in statement.labels.items():
+            if not nodes.get(node_id):
+                nodes[node_id] = label
+        edges.extend(statement.edges)
+        statements.append(statement)
+
+    return {
+        "header": header,
+        "statements": statements,
+        "nodes": nodes,
+        "edges": edges,
+    }
+
+
+def get_neighbourhood(edges: List[Tuple[str, str]], anchors: Set[str], hops: int) -> Set[str]:
+    """
+    Get all nodes within a number of hops of the anchor nodes, ignoring edge direction.
+
+    Args:
+        edges (List[Tuple[str, str]]): The edges of the graph
+        anchors (Set[str]): The nodes to start from
+        hops (int): The maximum distance from an anchor
+
+    Returns:
+        Set[str]: The anchors and every node reachable within the given number of hops
+    """
+    adjacency: Dict[str, Set[str]] = {}
+    for source, target in edges:
+        adjacency.setdefault(source, set()).add(target)
+        adjacency.setdefault(target, set()).add(source)
+
+    selected = set(anchors)
+    frontier = set(anchors)
+    for _ in range(hops):
+        next_frontier = set()
+        for node_id in frontier:
+            next_frontier.update(adjacency.get(node_id, set()) - selected)
+        if not next_frontier:
+            break
+        selected.update(next_frontier)
+        frontier = next_frontier
+
+    return selected
+
+
+# Arrows of the non-flowchart diagram types, e.g. A->>B, Class1 <|-- Class2, s1 --> s2, A ||--o{ B
+ARROW_RE = re.compile(
+    r"^\s*([\w\[\]*]+)\s*"
+    r"(-{1,2}>>|-{1,2}>|-{1,2}x|-{1,2}\)|<\|--|--\|>|\*--|--\*|o--|--o|\.\.>|<\.\.|\.\.\|>|<\|\.\.|-->|--|\.\.|[|}o][|o]--[|o][|{]|[|}o][|o]\.\.[|o][|{])"
+    r"[+-]?\s*(?:\"[^\"]*\"\s*)?([\w\[\]*]+)"
+)
+
+# Explicit declarations of participants, classes and states
+DECLARATION_RE = re.compile(r"^\s*(?:participant|actor|class|state)\s+(?:\"[^\"]*\"\s+as\s+)?([\w]+)")
+
+
+def diagram_metadata(code: str) -> Dict:
+    """
+    Derive summary metadata from mermaid code.
+
+    Flowcharts are parsed fully. For sequence, class, state and ER diagrams the
+    nodes are the declared participants/classes/states/entities plus the
+    endpoints of arrows, and the edges are the arrows. Other diagram types
+    only get a kind and a size.
+
+    Args:
+        code (str): The mermaid code
+
+    Returns:
+        Dict: The "kind", "node_count", "edge_count" and "byte_size" of the diagram
+    """
+    kind = detect_diagram_kind(code)
+    node_count = 0
+    edge_count = 0
+
+    if kind in FLOWCHART_KINDS:
+        parsed = parse_flowchart(code)
+        if parsed:
+            node_count = len(parsed["nodes"])
+            edge_count = len(parsed["edges"])
+    elif kind in ("sequenceDiagram", "classDiagram", "stateDiagram", "erDiagram"):
+        nodes: Set[str] = set()
+        for line in code.strip().split("\n")[1:]:
+            if line.strip().startswith("%%"):
+                continue
+            arrow = ARROW_RE.match(line)
+            if arrow:
+                nodes.add(arrow.group(1))
+                nodes.add(arrow.group(3))
+                edge_count += 1
+                continue
+            declaration = DECLARATION_RE.match(line)
+            if declaration:
+                nodes.add(declaration.group(1))
+        nodes.discard("[*]")
+        node_count = len(nodes)
+
+    return {
+        "kind": kind,
+        "node_count": node_count,
+        "edge_count": edge_count,
+        "byte_size": len(code.encode("utf-8"))
+    }
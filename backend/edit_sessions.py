@@ -0,0 +1,271 @@
+"""
+Server-side editing sessions for the Easy Diagram AI application.
+
+An editing session keeps the current content of a diagram in memory so that
+AI edits and delta saves can be applied without the client uploading the whole
+diagram on every turn. Sessions are kept in an LRU cache bounded both by the
+number of sessions and by the total size of the cached content.
+
+Delta saves only change the cached copy; the write to storage is debounced so
+that a burst of autosaves results in a single write. A failed write is retried
+with exponential backoff until it succeeds.
+"""
+import atexit
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from models import Diagram
+from text_delta import content_hash
+
+# Maximum number of diagrams kept in the session cache
+EDIT_SESSION_MAX_SESSIONS = int(os.getenv("EDIT_SESSION_MAX_SESSIONS", 256))
+
+# Maximum total size of the cached diagram content, in bytes
+EDIT_SESSION_MAX_BYTES = int(os.getenv("EDIT_SESSION_MAX_BYTES", 64 * 1024 * 1024))
+
+# Seconds without further changes before pending changes are written to storage
+SAVE_DEBOUNCE_SECONDS = float(os.getenv("SAVE_DEBOUNCE_SECONDS", 2))
+
+# Maximum seconds pending changes may wait before they are written, even while changes keep arriving
+SAVE_MAX_DELAY_SECONDS = float(os.getenv("SAVE_MAX_DELAY_SECONDS", 10))
+
+# Longest wait between retries of a failed save
+SAVE_RETRY_MAX_SECONDS = float(os.getenv("SAVE_RETRY_MAX_SECONDS", 60))
+
+
+class EditSession:
+    """
+    The cached state of a single diagram.
+    """
+
+    def __init__(self, diagram_id, content, last_updated):
+        self.diagram_id = diagram_id
+        self.content = content
+        self.version = content_hash(content)
+        self.size = len(content.encode("utf-8"))
+        self.last_updated = last_updated
+        # True while the cached content has changes that are not yet in storage
+        self.dirty = False
+        self.dirty_since = None
+        self.timer = None
+        # Number of failed saves since the last successful one
+        self.failed_saves = 0
+        # Serializes edits to the same diagram
+        self.lock = threading.RLock()
+
+    def set_content(self, content):
+        self.content = content
+        self.version = content_hash(content)
+        self.size = len(content.encode("utf-8"))
+
+    def cancel_save(self):
+        self.dirty = False
+        self.dirty_since = None
+        self.failed_saves = 0
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+
+
+class EditSessionCache:
+    """
+    LRU cache of editing sessions with a limit on the number of sessions and on memory use.
+    """
+
+    def __init__(self, loader: Callable, saver: Callable, max_sessions: int = EDIT_SESSION_MAX_SESSIONS,
+                 max_bytes: int = EDIT_SESSION_MAX_BYTES):
+        self._loader = loader
+        self._saver = saver
+        self._max_sessions = max_sessions
+        self._max_bytes = max_bytes
+        self._sessions = OrderedDict()
+        self._bytes = 0
+        self._save_errors = 0
+        self._lock = threading.Lock()
+
+    def get(self, diagram_id) -> Optional[EditSession]:
+        """
+        Get the session for a diagram, loading the diagram from storage on a cache miss.
+
+        A clean cached session is reloaded if the diagram has been changed in
+        storage since it was cached.
+        """
+        with self._lock:
+            session = self._sessions.get(diagram_id)
+            if session:
+                self._sessions.move_to_end(diagram_id)
+
+        if session and (session.dirty or session.last_updated == Diagram.get_last_updated(diagram_id)):
+            return session
+
+        diagram = self._loader(diagram_id)
+        if not diagram:
+            self.invalidate(diagram_id)
+            return None
+
+        session = EditSession(diagram_id, diagram.get("content") or "", diagram.get("last_updated"))
+        with self._lock:
+            self._remove(diagram_id)
+            self._sessions[diagram_id] = session
+            self._bytes += session.size
+            evicted = self._evict()
+        self._save_evicted(evicted)
+        return session
+
+    def peek(self, diagram_id) -> Optional[EditSession]:
+        """
+        Get the cached session for a diagram without loading or validating it.
+        """
+        with self._lock:
+            return self._sessions.get(diagram_id)
+
+    def update(self, diagram_id, content, last_updated):
+        """
+        Store content that has just been saved for a diagram, if it has a session.
+
+        Any pending debounced save is cancelled, since the saved content supersedes it.
+        """
+        with self._lock:
+            session = self._sessions.get(diagram_id)
+            if not session:
+                return
+            session.cancel_save()
+            self._bytes -= session.size
+            session.set_content(content)
+            session.last_updated = last_updated
+            self._bytes += session.size
+            self._sessions.move_to_end(diagram_id)
+            evicted = self._evict()
+        self._save_evicted(evicted)
+
+    def apply_change(self, session: EditSession, content):
+        """
+        Store unsaved content in a session and schedule a debounced save.
+
+        The caller must hold the session lock.
+        """
+        with self._lock:
+            in_cache = self._sessions.get(session.diagram_id) is session
+            if in_cache:
+                self._bytes -= session.size
+            session.set_content(content)
+            if in_cache:
+                self._bytes += session.size
+
+        now = time.monotonic()
+        if not session.dirty:
+            session.dirty = True
+            session.dirty_since = now
+
+        # Debounce, but never postpone the save beyond the maximum delay
+        self._schedule_save(session, min(SAVE_DEBOUNCE_SECONDS, max(session.dirty_since + SAVE_MAX_DELAY_SECONDS - now, 0)))
+
+        with self._lock:
+            evicted = self._evict()
+        self._save_evicted(evicted)
+
+    def save(self, session: EditSession):
+        """
+        Write the pending changes of a session to storage.
+
+        If the write fails, the changes stay pending and the save is retried
+        with exponential backoff. Returns whether the changes were written.
+        """
+        with session.lock:
+            if not session.dirty:
+                return True
+            try:
+                updated_diagram = self._saver(session.diagram_id, session.content)
+                session.cancel_save()
+                if updated_diagram:
+                    session.last_updated = updated_diagram.get("last_updated")
+                return True
+            except Exception as e:
+                session.failed_saves += 1
+                with self._lock:
+                    self._save_errors += 1
+                delay = min(SAVE_DEBOUNCE_SECONDS * 2 ** session.failed_saves, SAVE_RETRY_MAX_SECONDS)
+                print(f"Error saving diagram {session.diagram_id} (attempt {session.failed_saves}), retrying in {delay:.0f}s: {str(e)}")
+                self._schedule_save(session, delay)
+                return False
+
+    def save_all(self):
+        """
+        Write the pending changes of every session to storage.
+        """
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            self.save(session)
+
+    def invalidate(self, diagram_id):
+        """
+        Drop the session for a diagram, discarding any pending changes.
+        """
+        with self._lock:
+            session = self._remove(diagram_id)
+        if session:
+            session.cancel_save()
+
+    def stats(self):
+        """
+        Get the current size of the cache.
+        """
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self._bytes,
+                "pending_saves": sum(1 for session in self._sessions.values() if session.dirty),
+                "failing_saves": sum(1 for session in self._sessions.values() if session.failed_saves),
+                "save_errors": self._save_errors
+            }
+
+    def _remove(self, diagram_id):
+        session = self._sessions.pop(diagram_id, None)
+        if session:
+            self._bytes -= session.size
+        return session
+
+    def _evict(self):
+        # Always keep the most recently used session, even if it alone exceeds the memory cap
+        evicted = []
+        while len(self._sessions) > 1 and (
+            len(self._sessions) > self._max_sessions or self._bytes > self._max_bytes
+        ):
+            _, session = self._sessions.popitem(last=False)
+            self._bytes -= session.size
+            evicted.append(session)
+        return evicted
+
+    def _schedule_save(self, session, delay):
+        if session.timer:
+            session.timer.cancel()
+        session.timer = threading.Timer(delay, self.save, args=(session,))
+        session.timer.daemon = True
+        session.timer.start()
+
+    def _save_evicted(self, evicted):
+        # Evicted sessions must not lose their pending changes
+        for session in evicted:
+            if session.dirty and not self.save(session):
+                # Keep serving the unsaved content until a retry succeeds
+                with self._lock:
+                    if session.diagram_id not in self._sessions:
+                        self._sessions[session.diagram_id] = session
+                        self._bytes += session.size
+
+
+def save_diagram_content(diagram_id, content):
+    """
+    Write diagram content to storage.
+    """
+    return Diagram.update(diagram_id, {"content": content})
+
+
+edit_sessions = EditSessionCache(Diagram.get, save_diagram_content)
+
+# Do not lose debounced saves when the server shuts down
+atexit.register(edit_sessions.save_all)
@@ -0,0 +1,209 @@
+"""
+One AI edit request applied to every diagram in a folder.
+
+The diagrams are loaded with a single query, edited concurrently on a
+bounded thread pool, and the changed results are written in batches. The
+caller streams the progress events as NDJSON lines.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
+from typing import Dict, List, Optional, Tuple
+
+from edit_sessions import edit_sessions
+from langchain_service import process_diagram_request, estimate_diagram_request
+from models import Diagram
+from text_delta import content_hash
+from token_budget import MAX_REQUEST_INPUT_TOKENS, MAX_CHARS_PER_TOKEN
+
+# Maximum number of diagrams edited at the same time by one request
+FOLDER_AI_EDIT_MAX_CONCURRENCY = int(os.getenv("FOLDER_AI_EDIT_MAX_CONCURRENCY", 8))
+
+# Changed diagrams are written once this many have been collected
+FOLDER_AI_EDIT_WRITE_BATCH = int(os.getenv("FOLDER_AI_EDIT_WRITE_BATCH", 20))
+
+# Largest number of diagrams one request may edit
+FOLDER_AI_EDIT_MAX_DIAGRAMS = int(os.getenv("FOLDER_AI_EDIT_MAX_DIAGRAMS", 200))
+
+
+def load_folder_diagrams(folder_id) -> List[Dict]:
+    """
+    Load the diagrams of a folder, including edits that have not been saved yet.
+    """
+    diagrams = Diagram.get_by_folder(folder_id, "id, name, content, content_hash")
+    for diagram in diagrams:
+        diagram["content"] = diagram.get("content") or ""
+        # The write only goes through while the stored content is unchanged
+        diagram["stored_hash"] = diagram.get("content_hash")
+        session = edit_sessions.peek(diagram.get("id"))
+        if session and session.dirty:
+            diagram["content"] = session.content
+            diagram["unsaved"] = True
+        diagram["version"] = content_hash(diagram["content"])
+    return diagrams
+
+
+def plan_folder_edit(diagrams: List[Dict], user_request: str, chunked: bool) -> Dict:
+    """
+    Estimate the edit of every diagram and set aside the ones that are too large.
+
+    Returns:
+        Dict: The diagrams to edit as "planned", the diagrams that are too
+        large as "skipped", and the summed "input_tokens" and "output_tokens"
+    """
+    planned = []
+    skipped = []
+    input_tokens = 0
+    output_tokens = 0
+    for diagram in diagrams:
+        if len(diagram["content"]) > MAX_REQUEST_INPUT_TOKENS * MAX_CHARS_PER_TOKEN:
+            skipped.append(diagram)
+            continue
+        estimate = estimate_diagram_request(diagram["content"], user_request, chunked)
+        if estimate["input_tokens"] > MAX_REQUEST_INPUT_TOKENS:
+            skipped.append(diagram)
+            continue
+        planned.append(diagram)
+        input_tokens += estimate["input_tokens"]
+        output_tokens += estimate["output_tokens"]
+    return {
+        "planned": planned,
+        "skipped": skipped,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens
+    }
+
+
+def _write_batch(batch: List[Tuple[Dict, str]]) -> List[Dict]:
+    """
+    Write a batch of edited diagrams and get their progress events.
+
+    Diagrams whose content was changed (or that were deleted) by someone else
+    while they were being edited are left alone and reported as conflicts.
+    The editing sessions of the batch are locked from the check until their
+    content has been replaced, so delta saves cannot slip in between.
+    """
+    def conflict(diagram):
+        return {
+            "type": "diagram",
+            "id": diagram["id"],
+            "name": diagram.get("name"),
+            "status": "conflict",
+            "error": "Diagram was changed or deleted while it was being edited."
+        }
+
+    events = []
+    updates = []
+    with ExitStack() as stack:
+        # Lock in id order so concurrent batches cannot deadlock
+        sessions = {}
+        for diagram, _ in sorted(batch, key=lambda item: item[0]["id"]):
+            session = edit_sessions.peek(diagram["id"])
+            if session:
+                stack.enter_context(session.lock)
+                sessions[diagram["id"]] = session
+
+        pending = {}
+        for diagram, updated_code in batch:
+            session = sessions.get(diagram["id"])
+            if session and session.version != diagram["version"]:
+                events.append(conflict(diagram))
+                continue
+            expected_hash = diagram.get("stored_hash")
+            if diagram.get("unsaved") and session and not session.dirty:
+                # The unsaved content the edit started from has been saved since
+                expected_hash = diagram["version"]
+            pending[diagram["id"]] = (diagram, updated_code)
+            updates.append({"id": diagram["id"], "content": updated_code, "expected_hash": expected_hash})
+
+        # Only diagrams whose stored content is still the loaded content are written
+        for updated in Diagram.update_contents(updates):
+            diagram, updated_code = pending.pop(updated.get("id"))
+            # The session may hold unsaved edits the AI edit started from; the new content supersedes them
+            edit_sessions.update(diagram["id"], updated_code, updated.get("last_updated"))
+            events.append({
+                "type": "diagram",
+                "id": diagram["id"],
+                "name": diagram.get("name"),
+                "status": "changed",
+                "version": content_hash(updated_code)
+            })
+
+        for diagram, _ in pending.values():
+            events.append(conflict(diagram))
+    return events
+
+
+def run_folder_edit(plan: Dict, user_request: str, chunked: bool, concurrency: int,
+                    usage: Optional[Dict[str, int]] = None):
+    """
+    Edit the planned diagrams concurrently and yield a progress event for each.
+
+    Events are dicts with "type": "diagram", the diagram "id" and "name" and a
+    "status" of changed, unchanged, skipped, conflict or error, followed by
+    one "type": "summary" event with the count of each status. Changed
+    diagrams are reported once they have been written. The tokens of the
+    model calls are added to usage, if given.
+    """
+    counts = {"changed": 0, "unchanged": 0, "skipped": 0, "conflict": 0, "error": 0}
+
+    def report(event):
+        counts[event["status"]] += 1
+        return event
+
+    for diagram in plan["skipped"]:
+        yield report({
+            "type": "diagram",
+            "id": diagram["id"],
+            "name": diagram.get("name"),
+            "status": "skipped",
+            "error": "Diagram is too large to edit with AI."
+        })
+
+    def edit(diagram):
+        return process_diagram_request(diagram["content"], user_request, chunked=chunked, usage=usage)
+
+    def flush(pending):
+        try:
+            return _write_batch(pending)
+        except Exception as e:
+            print(f"Error saving folder AI edit: {str(e)}")
+            return [
+                {"type": "diagram", "id": diagram["id"], "name": diagram.get("name"), "status": "error"}
+                for diagram, _ in pending
+            ]
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, FOLDER_AI_EDIT_MAX_CONCURRENCY)))
+    batch = []
+    try:
+        futures = {executor.submit(edit, diagram): diagram for diagram in plan["planned"]}
+        for future in as_completed(futures):
+            diagram = futures[future]
+            try:
+                updated_code = future.result()
+            except Exception as e:
+                print(f"Error editing diagram {diagram['id']}: {str(e)}")
+                yield report({"type": "diagram", "id": diagram["id"], "name": diagram.get("name"), "status": "error"})
+                continue
+
+            if updated_code == diagram["content"]:
+                yield report({"type": "diagram", "id": diagram["id"], "name": diagram.get("name"), "status": "unchanged"})
+                continue
+
+            batch.append((diagram, updated_code))
+            if len(batch) >= FOLDER_AI_EDIT_WRITE_BATCH:
+                pending, batch = batch, []
+                for event in flush(pending):
+                    yield report(event)
+
+        if batch:
+            pending, batch = batch, []
+            for event in flush(pending):
+                yield report(event)
+
+        yield {"type": "summary", **counts}
+    finally:
+        # The client went away: stop queued edits and keep the finished ones
+        executor.shutdown(wait=False, cancel_futures=True)
+        if batch:
+            flush(batch)
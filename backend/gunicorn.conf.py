@@ -0,0 +1,88 @@
+"""
+Gunicorn configuration for production serving.
+
+Run with:
+    gunicorn -c gunicorn.conf.py app:app
+
+AI edits spend seconds waiting on the model API while CRUD requests take
+milliseconds, so the worker model is selectable with GUNICORN_WORKER_CLASS:
+
+    gthread (default)  threads per worker process; a slow AI request or an
+                       open change feed stream holds one thread, so the
+                       thread count is derived from the expected load
+    gevent             green threads; handles hundreds of concurrent slow
+                       requests per worker (needs: pip install gevent)
+    sync               one request per worker process; only suitable when AI
+                       edits are served by a separate deployment
+
+Editing sessions, the search index, the change feed and the client token
+budgets live in process memory, so a single worker process is the default
+and concurrency comes from threads or gevent connections. With several
+processes, requests for the same diagram can see different cached content,
+change feed clients miss events from the other processes and every client
+gets its token budget once per process.
+"""
+import os
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', 5000)}")
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+
+# One process, because the per-process state above must not be split
+workers = int(os.getenv("GUNICORN_WORKERS", 1))
+
+# Each request holds a gthread thread until it is done, so the default number
+# of threads covers the expected concurrent AI edits, the open /api/changes
+# streams (each held for up to CHANGE_FEED_MAX_SECONDS) and headroom for CRUD
+# requests, which would otherwise queue behind them
+expected_ai_requests = int(os.getenv("EXPECTED_AI_CONCURRENCY", 100))
+expected_change_feed_clients = int(os.getenv("EXPECTED_CHANGE_FEED_CLIENTS", 50))
+crud_threads = int(os.getenv("CRUD_THREADS", 32))
+threads = (
+    int(os.getenv("GUNICORN_THREADS", expected_ai_requests + expected_change_feed_clients + crud_threads))
+    if worker_class == "gthread" else 1
+)
+
+# Concurrent connections per gevent worker
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 1000))
+
+# Seconds a sync worker may spend on one request before it is killed and
+# restarted; must cover the slowest AI edit. For gthread and gevent workers
+# this is only the heartbeat timeout.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+
+# Seconds workers get to finish in-flight requests on shutdown or reload
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+
+# Seconds to keep idle client connections open, for clients behind a proxy
+# that reuses connections
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+
+# Restart workers after this many requests to bound memory growth (0 disables)
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+
+
+def on_starting(server):
+    """
+    Warn when the per-process state would be split across several workers.
+    """
+    if server.cfg.workers > 1:
+        server.log.warning(
+            "Running %d worker processes: editing sessions, the search index, the change feed "
+            "and token budgets are per process. Use one worker with more threads unless "
+            "requests for a diagram are routed to the same process.",
+            server.cfg.workers
+        )
+
+
+def worker_exit(server, worker):
+    """
+    Write debounced edits of the exiting worker to the database.
+    """
+    from edit_sessions import edit_sessions
+
+    edit_sessions.save_all()
@@ -0,0 +1,166 @@
+"""
+Negotiated HTTP response compression for the Flask app.
+
+Responses above a size threshold are compressed with brotli when the client
+accepts it and the brotli package is installed, and with gzip otherwise.
+Streamed responses are compressed incrementally.
+
+Run this module directly to measure bytes on the wire and serialization time
+on a synthetic diagram list.
+"""
+import gzip
+import os
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this are sent uncompressed
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", 1024))
+
+# gzip compression level (1-9)
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+
+# brotli quality (0-11); higher levels are too slow for dynamic responses
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 5))
+
+
+def _choose_encoding():
+    """
+    Pick the best encoding the client accepts, or None.
+    """
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def _gzip_stream(chunks):
+    """
+    Compress a stream of response chunks with gzip.
+    """
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def compress_response(response):
+    """
+    Compress a response if the client accepts it and it is worth compressing.
+    """
+    if (
+        response.status_code < 200
+        or response.status_code >= 300
+        or response.status_code == 204
+        or "Content-Encoding" in response.headers
+        or response.mimetype == "text/event-stream"
+        or "no-transform" in response.headers.get("Cache-Control", "")
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+
+    encoding = _choose_encoding()
+    if not encoding:
+        return response
+
+    if response.is_streamed:
+        # Streams are only compressed with gzip, which can be flushed incrementally
+        if not request.accept_encodings["gzip"]:
+            return response
+        response.response = _gzip_stream(response.response)
+        response.direct_passthrough = False
+        response.headers.pop("Content-Length", None)
+        response.headers["Content-Encoding"] = "gzip"
+        return response
+
+    if response.direct_passthrough:
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESSION_MIN_BYTES:
+        return response
+
+    if encoding == "br":
+        compressed = brotli.compress(data, quality=BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    response.headers["Content-Length"] = str(len(compressed))
+    return response
+
+
+def init_compression(app):
+    """
+    Register response compression on a Flask app.
+    """
+    app.after_request(compress_response)
+
+
+def _benchmark(count: int = 2000):
+    """
+    Compare payload sizes and serialization time with and without compression and orjson.
+    """
+    import json
+    import time
+
+    try:
+        import orjson
+    except ImportError:
+        orjson = None
+
+    content = "\n".join(["flowchart TD"] + [f"    N{i}[Step {i}] -->|next| N{i + 1}" for i in range(60)])
+    payload = [
+        {
+            "id": i,
+            "content": content,
+            "last_updated": "2023-10-03T12:34:56",
+            "name": f"Diagram {i}",
+            "folder_id": i % 10
+        }
+        for i in range(count)
+    ]
+
+    def measure(label, serialize):
+        start = time.perf_counter()
+        data = serialize(payload)
+        elapsed = time.perf_counter() - start
+        print(f"{label:<16} {elapsed * 1000:8.1f} ms")
+        return data
+
+    print(f"serializing {count} diagrams")
+    data = measure("json (sorted)", lambda obj: json.dumps(obj, sort_keys=True).encode("utf-8"))
+    measure("json", lambda obj: json.dumps(obj, separators=(",", ":")).encode("utf-8"))
+    if orjson is not None:
+        measure("orjson", orjson.dumps)
+    else:
+        print("orjson           not installed")
+
+    print("bytes on the wire")
+    print(f"{'identity':<16} {len(data):>10}")
+    start = time.perf_counter()
+    gzipped = gzip.compress(data, compresslevel=GZIP_LEVEL)
+    print(f"{'gzip':<16} {len(gzipped):>10} ({(time.perf_counter() - start) * 1000:.1f} ms)")
+    if brotli is not None:
+        start = time.perf_counter()
+        compressed = brotli.compress(data, quality=BROTLI_QUALITY)
+        print(f"{'br':<16} {len(compressed):>10} ({(time.perf_counter() - start) * 1000:.1f} ms)")
+    else:
+        print("br               not installed")
+
+
+if __name__ == "__main__":
+    _benchmark()
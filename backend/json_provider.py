@@ -0,0 +1,95 @@
+"""
+JSON serialization helpers for the Flask app.
+
+Uses orjson when it is installed and falls back to the standard library
+otherwise. Also provides streamed JSON array responses for large lists.
+"""
+import json
+import os
+from itertools import chain, islice
+from typing import Iterable
+
+from flask import Response, jsonify
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Lists with at least this many items are streamed instead of serialized in one go
+STREAM_MIN_ITEMS = int(os.getenv("STREAM_MIN_ITEMS", 1000))
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider that serializes with orjson when it is available.
+    """
+
+    # Sorting keys costs time on large payloads and clients do not rely on it
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            kwargs.setdefault("sort_keys", self.sort_keys)
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        data = orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(data, mimetype=self.mimetype)
+
+
+def dumps(obj) -> str:
+    """
+    Serialize an object to a JSON string with the fastest available encoder.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"))
+
+
+def stream_json_array(items: Iterable):
+    """
+    Create a response that streams a JSON array item by item.
+
+    Args:
+        items (Iterable): The items of the array, which may be a generator
+
+    Returns:
+        Response: A streamed application/json response
+    """
+    def generate():
+        yield "["
+        first = True
+        for item in items:
+            if not first:
+                yield ","
+            first = False
+            yield dumps(item)
+        yield "]\n"
+
+    return Response(generate(), mimetype="application/json")
+
+
+def json_list_response(items: Iterable):
+    """
+    Create a JSON response for a list, streaming it if it is large.
+
+    The items may be a generator, e.g. one that reads pages from the database.
+    Only the first STREAM_MIN_ITEMS items are read up front; if there are
+    more, the rest are serialized as they are read.
+    """
+    items = iter(items)
+    head = list(islice(items, STREAM_MIN_ITEMS))
+    if len(head) < STREAM_MIN_ITEMS:
+        return jsonify(head)
+    return stream_json_array(chain(head, items))
@@ -2,10 +2,17 @@
 LangChain service for processing mermaid diagram modification requests using Anthropic Claude.
 """
 import os
-from typing import Dict, Any
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
 from langchain_anthropic import ChatAnthropic
 from langchain.schema import HumanMessage, SystemMessage
 from dotenv import load_dotenv
+from diagram_context import build_trimmed_context, splice_excerpt
+from diagram_chunks import split_into_chunks, clean_edited_chunk, reassemble_chunks
+from diagram_parser import detect_diagram_kind
+from llm_cassette import llm_cassette, CassetteMiss
+from token_budget import estimate_call, estimate_seconds, estimate_tokens
 
 # Load environment variables
 load_dotenv()
@@ -13,6 +20,10 @@ load_dotenv()
 # Get API key from environment
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 
+# Model settings
+MODEL_NAME = "claude-3-7-sonnet-latest"
+MODEL_TEMPERATURE = 0.2
+
 # System prompt for diagram modification
 SYSTEM_PROMPT = """
 You are a diagram modification assistant that helps users update mermaid.js diagrams based on natural language requests.
@@ -47,6 +58,54 @@ D --> E[Error Handling]
 ```
 """
 
+# System prompt used when only an excerpt of a large diagram is sent
+EXCERPT_SYSTEM_PROMPT = """
+You are a diagram modification assistant that helps users update mermaid.js flowcharts based on natural language requests.
+
+The diagram is too large to send in full, so you are given an excerpt containing the lines relevant to the request,
+together with a summary of the other nodes that exist elsewhere in the diagram.
+
+Your task is to modify the excerpt according to the user's request.
+
+Guidelines:
+1. Return ONLY the modified excerpt lines, without the diagram header, explanations, markdown formatting, or code blocks.
+2. Do not redeclare or restyle nodes from the summary unless the request asks for it; you may connect edges to them by id.
+3. Do not add subgraphs.
+4. Use node ids that do not clash with the ids in the excerpt or the summary when adding new nodes.
+5. If the request cannot be implemented within the excerpt, return the excerpt unchanged.
+"""
+
+# Appended to the excerpt request when the first answer could not be spliced back
+EXCERPT_RETRY_NOTE = """
+
+Your previous answer could not be used. Return only the edited excerpt lines: no diagram header,
+no subgraph or end lines, and none of the other nodes of the diagram."""
+
+# System prompt used when a large diagram is edited one subgraph at a time
+CHUNK_SYSTEM_PROMPT = """
+You are a diagram modification assistant that helps users update mermaid.js flowcharts based on natural language requests.
+
+The diagram is large, so it is edited in parts: you are given one part of it, which is either a single subgraph block
+or the lines outside all subgraphs. The other parts are edited separately with the same request.
+
+Your task is to apply the user's request to this part only.
+
+Guidelines:
+1. Return ONLY the modified lines of this part, without the diagram header, explanations, markdown formatting, or code blocks.
+2. A subgraph block must stay one block: keep its first "subgraph" line's id and its final "end" line.
+3. Do not rename node ids; other parts of the diagram refer to them. Labels may change.
+4. Do not add subgraphs outside of an existing subgraph block.
+5. If the request does not apply to this part, return it unchanged.
+"""
+
+# Maximum number of chunk edits sent to the model at the same time, across all requests
+CHUNKED_MAX_WORKERS = int(os.getenv("CHUNKED_MAX_WORKERS", 8))
+
+chunk_executor = ThreadPoolExecutor(max_workers=CHUNKED_MAX_WORKERS, thread_name_prefix="chunk-edit")
+
+# Guards usage counters shared by the parallel calls of a chunked edit
+usage_lock = threading.Lock()
+
 
 def create_llm_client() -> ChatAnthropic:
     """
@@ -60,40 +119,268 @@ def create_llm_client() -> ChatAnthropic:
     
     # Create and configure the model
     llm = ChatAnthropic(
-        model="claude-3-7-sonnet-latest",
-        temperature=0.2,
+        model=MODEL_NAME,
+        temperature=MODEL_TEMPERATURE,
         anthropic_api_key=ANTHROPIC_API_KEY
     )
     
     return llm
 
 
-def process_diagram_request(current_code: str, user_request: str) -> str:
+def call_model(system_prompt: str, human_content: str) -> Dict[str, Any]:
     """
-    Process a diagram modification request using LangChain and Anthropic.
+    Send a single system/human message pair to the model.
+    
+    Args:
+        system_prompt (str): The system prompt
+        human_content (str): The content of the human message
+        
+    Returns:
+        Dict[str, Any]: The stripped text content of the model's response and
+        the input and output token counts, if the model reported them
+    """
+    # Create LLM client
+    llm = create_llm_client()
+    
+    # Prepare messages
+    messages = [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=human_content)
+    ]
+    
+    # Get response from the model
+    response = llm.invoke(messages)
+    usage = getattr(response, "usage_metadata", None) or {}
+    
+    return {
+        "content": response.content.strip(),
+        "input_tokens": usage.get("input_tokens"),
+        "output_tokens": usage.get("output_tokens")
+    }
+
+
+def new_usage() -> Dict[str, int]:
+    """
+    Create a counter of the tokens used by the model calls of a request.
+    """
+    return {"input_tokens": 0, "output_tokens": 0, "model_calls": 0}
+
+
+def invoke_model(system_prompt: str, human_content: str, usage: Optional[Dict[str, int]] = None) -> str:
+    """
+    Get the model's response to a system/human message pair, recording or
+    replaying it when LLM_CASSETTE_MODE is set (see llm_cassette.py).
+    
+    Args:
+        system_prompt (str): The system prompt
+        human_content (str): The content of the human message
+        usage (Optional[Dict[str, int]]): Counter from new_usage() to add the
+            tokens of the call to
+        
+    Returns:
+        str: The stripped text content of the model's response
+    """
+    response = llm_cassette.invoke(f"{MODEL_NAME}@{MODEL_TEMPERATURE}", system_prompt, human_content, call_model)
+    
+    if usage is not None:
+        # Estimate the counts the model (or an older recording) did not report
+        input_tokens = response.get("input_tokens")
+        if input_tokens is None:
+            input_tokens = estimate_call(system_prompt, human_content, "")["input_tokens"]
+        output_tokens = response.get("output_tokens")
+        if output_tokens is None:
+            output_tokens = estimate_tokens(response["content"])
+        with usage_lock:
+            usage["input_tokens"] += input_tokens
+            usage["output_tokens"] += output_tokens
+            usage["model_calls"] += 1
+    
+    return response["content"]
+
+
+def process_trimmed_request(current_code: str, user_request: str, usage: Optional[Dict[str, int]] = None) -> Optional[str]:
+    """
+    Process a request against only the relevant excerpt of a large diagram.
     
     Args:
         current_code (str): The current mermaid diagram code
         user_request (str): The user's natural language request
+        usage (Optional[Dict[str, int]]): Counter of the tokens used, see invoke_model
         
     Returns:
-        str: The updated mermaid diagram code
+        Optional[str]: The updated mermaid diagram code, or None if the full
+        diagram should be sent instead
+    
+    An edited excerpt that cannot be spliced back is requested once more
+    before giving up, since a second excerpt call is much cheaper than
+    sending the full diagram.
     """
-    try:
-        # Create LLM client
-        llm = create_llm_client()
+    context = build_trimmed_context(current_code, user_request)
+    if not context:
+        return None
+    
+    human_content = (
+        f"Diagram header: {context['header']}\n\n"
+        f"Other nodes in the diagram: {context['summary'] or 'none'}\n\n"
+        f"Here is the relevant excerpt of my diagram code:\n\n{context['excerpt']}\n\n"
+        f"Request: {user_request}"
+    )
+    
+    edited_excerpt = invoke_model(EXCERPT_SYSTEM_PROMPT, human_content, usage)
+    updated_code = splice_excerpt(current_code, context, edited_excerpt)
+    if updated_code is not None:
+        return updated_code
+    
+    edited_excerpt = invoke_model(EXCERPT_SYSTEM_PROMPT, human_content + EXCERPT_RETRY_NOTE, usage)
+    updated_code = splice_excerpt(current_code, context, edited_excerpt)
+    if updated_code is None:
+        print("Edited excerpt could not be spliced back twice, sending the full diagram")
+    return updated_code
+
+
+def process_chunked_request(current_code: str, user_request: str, usage: Optional[Dict[str, int]] = None) -> Optional[str]:
+    """
+    Process a request on every top-level subgraph of a diagram in parallel.
+    
+    Args:
+        current_code (str): The current mermaid diagram code
+        user_request (str): The user's natural language request
+        usage (Optional[Dict[str, int]]): Counter of the tokens used, see invoke_model
+        
+    Returns:
+        Optional[str]: The updated mermaid diagram code, or None if the diagram
+        cannot be split, a chunk call fails or an edited chunk does not fit
+        back, in which case the full diagram should be sent instead
+    """
+    split = split_into_chunks(current_code)
+    if not split:
+        return None
+    
+    def edit_chunk(chunk):
+        part = "\n".join(chunk["lines"])
+        human_content = (
+            f"Diagram header: {split['header']}\n\n"
+            f"Here is one part of my diagram code:\n\n{part}\n\n"
+            f"Request: {user_request}"
+        )
+        return invoke_model(CHUNK_SYSTEM_PROMPT, human_content, usage)
+    
+    futures = [chunk_executor.submit(edit_chunk, chunk) for chunk in split["chunks"]]
+    
+    edited_chunks = []
+    for chunk, future in zip(split["chunks"], futures):
+        try:
+            edited_lines = clean_edited_chunk(chunk, future.result(), split["shared_nodes"])
+        except CassetteMiss:
+            for pending in futures:
+                pending.cancel()
+            raise
+        except Exception as e:
+            # One failed chunk call should not fail the whole edit
+            print(f"Error editing diagram chunk, sending the full diagram: {str(e)}")
+            edited_lines = None
+        if edited_lines is None:
+            for pending in futures:
+                pending.cancel()
+            return None
+        edited_chunks.append(edited_lines)
+    
+    updated_code = reassemble_chunks(current_code, split, edited_chunks)
+    if not validate_mermaid_code(updated_code):
+        return None
+    return updated_code
+
+
+def full_request_content(current_code: str, user_request: str) -> str:
+    """
+    Build the human message that sends the full diagram.
+    """
+    return f"Here is my current diagram code:\n\n{current_code}\n\nRequest: {user_request}"
+
+
+def estimate_diagram_request(current_code: str, user_request: str, chunked: bool = False) -> Dict[str, Any]:
+    """
+    Estimate the tokens and duration of a diagram request without calling the model.
+    
+    The estimate follows the path process_diagram_request would take: an
+    excerpt of a large diagram, one call per chunk, or the full diagram.
+    
+    Args:
+        current_code (str): The current mermaid diagram code
+        user_request (str): The user's natural language request
+        chunked (bool): Whether the request would be processed in chunked mode
         
-        # Prepare messages
-        messages = [
-            SystemMessage(content=SYSTEM_PROMPT),
-            HumanMessage(content=f"Here is my current diagram code:\n\n{current_code}\n\nRequest: {user_request}")
+    Returns:
+        Dict[str, Any]: The estimated "input_tokens", "output_tokens",
+        "estimated_seconds", the number of "model_calls" and the "strategy"
+        (trimmed, chunked or full)
+    """
+    split = split_into_chunks(current_code) if chunked else None
+    context = None if chunked else build_trimmed_context(current_code, user_request)
+    
+    if split:
+        calls = [
+            estimate_call(CHUNK_SYSTEM_PROMPT, "\n".join(chunk["lines"]) + user_request, "\n".join(chunk["lines"]))
+            for chunk in split["chunks"]
         ]
+        # Chunks run in parallel, in batches of at most CHUNKED_MAX_WORKERS
+        rounds = -(-len(calls) // CHUNKED_MAX_WORKERS)
+        seconds = rounds * max(estimate_seconds(call["output_tokens"]) for call in calls)
+        strategy = "chunked"
+    elif context:
+        human_content = f"{context['header']}\n{context['summary']}\n{context['excerpt']}\n{user_request}"
+        calls = [estimate_call(EXCERPT_SYSTEM_PROMPT, human_content, context["excerpt"])]
+        seconds = estimate_seconds(calls[0]["output_tokens"])
+        strategy = "trimmed"
+    else:
+        calls = [estimate_call(SYSTEM_PROMPT, full_request_content(current_code, user_request), current_code)]
+        seconds = estimate_seconds(calls[0]["output_tokens"])
+        strategy = "full"
+    
+    return {
+        "input_tokens": sum(call["input_tokens"] for call in calls),
+        "output_tokens": sum(call["output_tokens"] for call in calls),
+        "estimated_seconds": round(seconds, 1),
+        "model_calls": len(calls),
+        "strategy": strategy
+    }
+
+
+def process_diagram_request(current_code: str, user_request: str, chunked: bool = False,
+                            usage: Optional[Dict[str, int]] = None) -> str:
+    """
+    Process a diagram modification request using LangChain and Anthropic.
+    
+    Large flowcharts are trimmed to the part relevant to the request first;
+    the full diagram is sent whenever trimming is not possible. In chunked
+    mode, diagrams with several subgraphs are instead edited one subgraph
+    at a time in parallel.
+    
+    Args:
+        current_code (str): The current mermaid diagram code
+        user_request (str): The user's natural language request
+        chunked (bool): Edit each top-level subgraph separately and in parallel
+        usage (Optional[Dict[str, int]]): Counter from new_usage() to add the
+            tokens of every model call made for the request to
         
-        # Get response from the model
-        response = llm.invoke(messages)
+    Returns:
+        str: The updated mermaid diagram code, or the original code if the
+        model call fails
+        
+    Raises:
+        CassetteMiss: In replay mode, if a model request was not recorded
+    """
+    try:
+        if chunked:
+            updated_code = process_chunked_request(current_code, user_request, usage)
+        else:
+            # Try to edit only the relevant part of a large diagram
+            updated_code = process_trimmed_request(current_code, user_request, usage)
+        if updated_code:
+            return updated_code
         
-        # Extract the updated code from the response
-        updated_code = response.content.strip()
+        # Send the full diagram and extract the updated code from the response
+        updated_code = invoke_model(SYSTEM_PROMPT, full_request_content(current_code, user_request), usage)
         
         # If the response is empty or seems invalid, return the original code
         if not updated_code or len(updated_code) < 10:  # Basic validation
@@ -101,6 +388,9 @@ def process_diagram_request(current_code: str, user_request: str) -> str:
             
         return updated_code
         
+    except CassetteMiss:
+        # A replay run must not pass off the unchanged diagram as a model response
+        raise
     except Exception as e:
         # Log the error (in a production environment, use proper logging)
         print(f"Error processing diagram request: {str(e)}")
@@ -122,19 +412,4 @@ def validate_mermaid_code(code: str) -> bool:
     # you might want to use a more sophisticated approach
     
     # Check if the code starts with a valid mermaid diagram type
-    valid_starts = [
-        "graph", "flowchart", "sequenceDiagram", "classDiagram",
-        "stateDiagram", "erDiagram", "journey", "gantt", "pie"
-    ]
-    
-    code_lines = code.strip().split('\n')
-    if not code_lines:
-        return False
-    
-    first_line = code_lines[0].strip()
-    
-    for start in valid_starts:
-        if first_line.startswith(start):
-            return True
-            
-    return False
+    return detect_diagram_kind(code) is not None
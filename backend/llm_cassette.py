@@ -0,0 +1,145 @@
+"""
+Record and replay of model calls, for deterministic offline load tests.
+
+LLM_CASSETTE_MODE selects the behaviour of every model call:
+
+    off (default)  call the model
+    record         call the model and store the request hash, response, token
+                   counts and observed latency in LLM_CASSETTE_DIR
+    replay         serve the stored response without calling the model,
+                   after sleeping for the recorded latency times
+                   LLM_CASSETTE_LATENCY_SCALE (0 disables the delay)
+
+Recordings are keyed by a hash of the model settings and the prompts, one
+JSON file per key. Recording the same request again appends another
+response, and replay cycles through them. Replay does not need an API key,
+so the whole AI edit path can run on a machine without network access.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict
+
+OFF = "off"
+RECORD = "record"
+REPLAY = "replay"
+
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", OFF).lower()
+
+LLM_CASSETTE_DIR = os.getenv("LLM_CASSETTE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cassettes"))
+
+# Multiplier for the recorded latency when replaying
+LLM_CASSETTE_LATENCY_SCALE = float(os.getenv("LLM_CASSETTE_LATENCY_SCALE", 1.0))
+
+
+class CassetteMiss(LookupError):
+    """
+    Raised in replay mode when a request has no recording.
+    """
+
+
+def request_hash(model: str, system_prompt: str, human_content: str) -> str:
+    """
+    Get the key of a model request.
+    """
+    payload = json.dumps([model, system_prompt, human_content], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCassette:
+    """
+    Stores and serves recorded model responses.
+    """
+
+    def __init__(self, mode: str = LLM_CASSETTE_MODE, directory: str = LLM_CASSETTE_DIR,
+                 latency_scale: float = LLM_CASSETTE_LATENCY_SCALE):
+        if mode not in (OFF, RECORD, REPLAY):
+            raise ValueError(f"Invalid LLM_CASSETTE_MODE: {mode}. Use off, record or replay")
+        self.mode = mode
+        self.directory = directory
+        self.latency_scale = latency_scale
+        self._recordings: Dict[str, list] = {}
+        self._replay_positions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def invoke(self, model: str, system_prompt: str, human_content: str, call: Callable) -> Dict:
+        """
+        Get the response to a model request, according to the cassette mode.
+
+        Args:
+            model (str): The model name and settings that affect the response
+            system_prompt (str): The system prompt
+            human_content (str): The content of the human message
+            call (Callable): Calls the model with the prompts and returns a dict
+                with "content", "input_tokens" and "output_tokens"
+
+        Returns:
+            Dict: The response, as returned by call
+
+        Raises:
+            CassetteMiss: In replay mode, if the request was not recorded
+        """
+        if self.mode == OFF:
+            return call(system_prompt, human_content)
+
+        key = request_hash(model, system_prompt, human_content)
+
+        if self.mode == REPLAY:
+            recording = self._next_recording(key)
+            if self.latency_scale > 0:
+                time.sleep(recording.get("latency_seconds", 0) * self.latency_scale)
+            return {
+                "content": recording["content"],
+                "input_tokens": recording.get("input_tokens"),
+                "output_tokens": recording.get("output_tokens")
+            }
+
+        start = time.perf_counter()
+        response = call(system_prompt, human_content)
+        latency = time.perf_counter() - start
+        self._record(key, model, {
+            "content": response["content"],
+            "input_tokens": response.get("input_tokens"),
+            "output_tokens": response.get("output_tokens"),
+            "latency_seconds": round(latency, 3),
+            "recorded_at": datetime.utcnow().isoformat()
+        })
+        return response
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load(self, key):
+        if key not in self._recordings:
+            try:
+                with open(self._path(key), encoding="utf-8") as cassette_file:
+                    self._recordings[key] = json.load(cassette_file)["responses"]
+            except FileNotFoundError:
+                self._recordings[key] = []
+        return self._recordings[key]
+
+    def _next_recording(self, key):
+        with self._lock:
+            recordings = self._load(key)
+            if not recordings:
+                raise CassetteMiss(f"No recorded model response for request {key[:12]} in {self.directory}")
+            position = self._replay_positions.get(key, 0)
+            self._replay_positions[key] = position + 1
+            return recordings[position % len(recordings)]
+
+    def _record(self, key, model, recording):
+        with self._lock:
+            recordings = self._load(key)
+            recordings.append(recording)
+            os.makedirs(self.directory, exist_ok=True)
+            # Write to a temporary file first so a crash never leaves a truncated cassette
+            temporary_path = f"{self._path(key)}.tmp"
+            with open(temporary_path, "w", encoding="utf-8") as cassette_file:
+                json.dump({"request_hash": key, "model": model, "responses": recordings}, cassette_file, ensure_ascii=False, indent=2)
+            os.replace(temporary_path, self._path(key))
+
+
+llm_cassette = LLMCassette()
@@ -0,0 +1,148 @@
+"""
+Load test of a running server with slow AI requests alongside CRUD traffic.
+
+Keeps a fixed number of AI edit requests in flight against
+/api/update-diagram while other clients list and read diagrams, and reports
+throughput and latency percentiles for both kinds of traffic. With a good
+worker setup the CRUD latencies stay low while the AI requests are waiting
+on the model.
+
+Usage:
+    python loadtest.py [--url http://localhost:5000] [--ai-concurrency 100]
+                       [--crud-concurrency 10] [--duration 60]
+
+Uses only the standard library. Run it against a server whose AI calls are
+replayed from recordings rather than sent to the model API, unless spending
+API credits is intended. All requests come from one client address, so start
+the server with CLIENT_TOKEN_BUDGET=0 (or a budget above the tokens of the
+run); requests refused by the budget with 429 are counted as rejected, not as
+errors or successes.
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+AI_REQUEST = {
+    "current_code": "\n".join(["flowchart TD"] + [f"    N{i}[Step {i}] --> N{i + 1}[Step {i + 1}]" for i in range(40)]),
+    "user_request": "Add a Review step between Step 10 and Step 11"
+}
+
+
+class Stats:
+    """
+    Latencies, errors and rate-limited requests of one kind of request.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def add(self, latency, ok):
+        with self.lock:
+            if ok:
+                self.latencies.append(latency)
+            else:
+                self.errors += 1
+
+    def add_rejected(self):
+        with self.lock:
+            self.rejected += 1
+
+    def report(self, elapsed):
+        latencies = sorted(self.latencies)
+
+        def percentile(fraction):
+            if not latencies:
+                return 0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000
+
+        print(
+            f"{self.name:<6} {len(latencies):>7} ok {self.errors:>5} errors {self.rejected:>5} rejected (429) "
+            f"{len(latencies) / elapsed:>8.1f} req/s   "
+            f"p50 {percentile(0.5):>8.1f} ms  p95 {percentile(0.95):>8.1f} ms  p99 {percentile(0.99):>8.1f} ms"
+        )
+
+
+def request(url, body=None, timeout=300):
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        return json.loads(response.read() or b"null")
+
+
+def timed(stats, function, *args):
+    start = time.perf_counter()
+    try:
+        result = function(*args)
+        stats.add(time.perf_counter() - start, True)
+        return result
+    except urllib.error.HTTPError as e:
+        if e.code == 429:
+            # Refused by the token budget; the server did no work
+            stats.add_rejected()
+        else:
+            stats.add(time.perf_counter() - start, False)
+        return None
+    except (urllib.error.URLError, OSError, ValueError):
+        stats.add(time.perf_counter() - start, False)
+        return None
+
+
+def ai_client(base_url, stats, deadline):
+    while time.monotonic() < deadline:
+        timed(stats, request, f"{base_url}/api/update-diagram", AI_REQUEST)
+
+
+def crud_client(base_url, stats, deadline, diagram_ids):
+    position = 0
+    while time.monotonic() < deadline:
+        timed(stats, request, f"{base_url}/api/diagrams")
+        timed(stats, request, f"{base_url}/api/folders")
+        if diagram_ids:
+            timed(stats, request, f"{base_url}/api/diagram/{diagram_ids[position % len(diagram_ids)]}")
+            position += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test with slow AI requests alongside CRUD traffic.")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--ai-concurrency", type=int, default=100)
+    parser.add_argument("--crud-concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=60)
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip("/")
+    diagrams = request(f"{base_url}/api/diagrams") or []
+    diagram_ids = [diagram["id"] for diagram in diagrams[:100]]
+
+    ai_stats = Stats("ai")
+    crud_stats = Stats("crud")
+    print(
+        f"{args.ai_concurrency} AI clients and {args.crud_concurrency} CRUD clients "
+        f"for {args.duration:.0f}s against {base_url}"
+    )
+
+    start = time.monotonic()
+    deadline = start + args.duration
+    with ThreadPoolExecutor(max_workers=args.ai_concurrency + args.crud_concurrency) as executor:
+        for _ in range(args.ai_concurrency):
+            executor.submit(ai_client, base_url, ai_stats, deadline)
+        for _ in range(args.crud_concurrency):
+            executor.submit(crud_client, base_url, crud_stats, deadline, diagram_ids)
+    elapsed = time.monotonic() - start
+
+    ai_stats.report(elapsed)
+    crud_stats.report(elapsed)
+    if ai_stats.rejected or crud_stats.rejected:
+        print("Requests were rejected by the token budget; restart the server with CLIENT_TOKEN_BUDGET=0 to measure the AI traffic")
+
+
+if __name__ == "__main__":
+    main()
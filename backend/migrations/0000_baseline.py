@@ -0,0 +1,306 @@
+"""
+Baseline schema: folders, diagrams, content blobs and version history.
+
+The Postgres script is a copy of supabase_tables.sql as it was when
+migrations were introduced. It only uses idempotent statements, so it can
+also be applied to a database that was set up by hand from that file. Later
+edits to supabase_tables.sql do not change this migration; schema changes
+go into new migrations.
+"""
+
+POSTGRES = """
+-- Folders table
+create table if not exists folders (
+  id bigint primary key generated by default as identity,
+  name varchar(255) not null,
+  parent_id bigint references folders(id),
+  is_root boolean default false not null,
+  created_at timestamp with time zone default timezone('utc'::text, now()) not null,
+  last_updated timestamp with time zone default timezone('utc'::text, now()) not null
+);
+
+-- Materialized path of each folder, e.g. '/1/4/9/' (ids from the root down)
+alter table folders add column if not exists path text;
+create index if not exists folders_path_idx on folders (path text_pattern_ops);
+
+-- Move a folder and rewrite the paths of its whole subtree in one statement
+create or replace function move_folder_subtree(p_folder_id bigint, p_new_parent_id bigint)
+returns integer
+language plpgsql
+as $$
+declare
+  old_path text;
+  new_path text;
+  moved integer;
+begin
+  select path into old_path from folders where id = p_folder_id for update;
+  if old_path is null then
+    raise exception 'Folder % not found', p_folder_id;
+  end if;
+
+  if p_new_parent_id is null then
+    new_path := '/' || p_folder_id || '/';
+  else
+    select path || p_folder_id || '/' into new_path from folders where id = p_new_parent_id;
+    if new_path is null then
+      raise exception 'Parent folder % not found', p_new_parent_id;
+    end if;
+    if new_path like old_path || '%' then
+      raise exception 'A folder cannot be moved into itself or one of its subfolders';
+    end if;
+  end if;
+
+  update folders
+  set path = new_path || substr(path, length(old_path) + 1),
+      parent_id = case when id = p_folder_id then p_new_parent_id else parent_id end,
+      last_updated = case when id = p_folder_id then timezone('utc'::text, now()) else last_updated end
+  where path like old_path || '%';
+
+  get diagnostics moved = row_count;
+  return moved;
+end;
+$$;
+
+-- Diagrams table
+create table if not exists diagrams (
+  id bigint primary key generated by default as identity,
+  content text not null,
+  last_updated timestamp with time zone default timezone('utc'::text, now()) not null,
+  name varchar(255),
+  folder_id bigint not null references folders(id)
+);
+
+-- Content-addressed diagram content, stored once per distinct content
+create table if not exists diagram_blobs (
+  hash varchar(64) primary key,
+  content text not null,
+  ref_count integer default 0 not null,
+  last_used timestamp with time zone default timezone('utc'::text, now()) not null
+);
+
+-- Diagrams point at their content blob; content stays inline only for rows
+-- written before blob storage until backfill_diagram_blobs() moves it
+alter table diagrams add column if not exists content_hash varchar(64) references diagram_blobs(hash);
+alter table diagrams alter column content drop not null;
+create index if not exists diagrams_content_hash_idx on diagrams (content_hash);
+
+-- Store blobs that do not exist yet; p_blobs is a JSON array of {"hash": ..., "content": ...}
+create or replace function put_diagram_blobs(p_blobs jsonb)
+returns integer
+language plpgsql
+as $$
+declare
+  stored integer;
+begin
+  insert into diagram_blobs (hash, content)
+  select b->>'hash', b->>'content'
+  from jsonb_array_elements(p_blobs) as b
+  on conflict (hash) do update set last_used = timezone('utc'::text, now());
+
+  get diagnostics stored = row_count;
+  return stored;
+end;
+$$;
+
+-- Keep blob reference counts in step with the diagrams pointing at them
+create or replace function count_diagram_blob_refs()
+returns trigger
+language plpgsql
+as $$
+begin
+  if tg_op <> 'DELETE' and new.content_hash is not null
+     and (tg_op = 'INSERT' or new.content_hash is distinct from old.content_hash) then
+    update diagram_blobs set ref_count = ref_count + 1 where hash = new.content_hash;
+  end if;
+  if tg_op <> 'INSERT' and old.content_hash is not null
+     and (tg_op = 'DELETE' or new.content_hash is distinct from old.content_hash) then
+    update diagram_blobs
+    set ref_count = ref_count - 1, last_used = timezone('utc'::text, now())
+    where hash = old.content_hash;
+  end if;
+  return null;
+end;
+$$;
+
+drop trigger if exists diagrams_blob_refs on diagrams;
+create trigger diagrams_blob_refs
+after insert or update of content_hash or delete on diagrams
+for each row execute function count_diagram_blob_refs();
+
+-- Delete unreferenced blobs; recently used ones are kept because a write may
+-- have stored a blob without having inserted the diagram pointing at it yet
+create or replace function collect_diagram_blobs()
+returns integer
+language plpgsql
+as $$
+declare
+  deleted integer;
+begin
+  delete from diagram_blobs
+  where ref_count <= 0
+    and last_used < timezone('utc'::text, now()) - interval '1 hour';
+
+  get diagnostics deleted = row_count;
+  return deleted;
+end;
+$$;
+
+-- Diagram metadata derived from the content on every write
+alter table diagrams add column if not exists kind varchar(32);
+alter table diagrams add column if not exists node_count integer;
+alter table diagrams add column if not exists edge_count integer;
+alter table diagrams add column if not exists byte_size integer;
+create index if not exists diagrams_folder_kind_idx on diagrams (folder_id, kind);
+
+-- Diagram counts and sizes per folder, for the folder tree
+create or replace view folder_diagram_stats as
+select folder_id,
+       count(*) as diagram_count,
+       coalesce(sum(byte_size), 0) as total_bytes,
+       coalesce(sum(node_count), 0) as total_nodes
+from diagrams
+group by folder_id;
+
+-- Diagram version history (snapshots and compressed line diffs)
+create table if not exists diagram_versions (
+  id bigint primary key generated by default as identity,
+  diagram_id bigint not null references diagrams(id) on delete cascade,
+  version_number integer not null,
+  kind varchar(16) not null,
+  payload text not null,
+  content_hash varchar(64) not null,
+  content_bytes integer not null,
+  stored_bytes integer not null,
+  created_at timestamp with time zone default timezone('utc'::text, now()) not null,
+  unique (diagram_id, version_number)
+);
+
+-- Delete a folder with all its subfolders and diagrams in one transaction
+create or replace function delete_folder_recursive(p_folder_id bigint)
+returns json
+language plpgsql
+as $$
+declare
+  folder_path text;
+  root_folder boolean;
+  diagram_ids bigint[];
+  deleted_folders integer;
+begin
+  select path, is_root into folder_path, root_folder from folders where id = p_folder_id for update;
+  if folder_path is null then
+    raise exception 'Folder % not found', p_folder_id;
+  end if;
+  if root_folder then
+    raise exception 'Cannot delete the root folder';
+  end if;
+
+  with deleted as (
+    delete from diagrams
+    where folder_id in (select id from folders where path like folder_path || '%')
+    returning id
+  )
+  select coalesce(array_agg(id), '{}') into diagram_ids from deleted;
+
+  delete from folders where path like folder_path || '%';
+  get diagnostics deleted_folders = row_count;
+
+  return json_build_object(
+    'folders_deleted', deleted_folders,
+    'diagrams_deleted', coalesce(array_length(diagram_ids, 1), 0),
+    'diagram_ids', diagram_ids
+  );
+end;
+$$;
+
+-- Update the name and/or folder of many diagrams in one statement
+-- p_updates is a JSON array of {"id": ..., "name": ..., "folder_id": ...} objects
+create or replace function bulk_update_diagrams(p_updates jsonb)
+returns integer
+language plpgsql
+as $$
+declare
+  updated integer;
+begin
+  update diagrams d
+  set name = case when u ? 'name' then u->>'name' else d.name end,
+      folder_id = coalesce((u->>'folder_id')::bigint, d.folder_id),
+      last_updated = timezone('utc'::text, now())
+  from jsonb_array_elements(p_updates) as u
+  where d.id = (u->>'id')::bigint;
+
+  get diagnostics updated = row_count;
+  return updated;
+end;
+$$;
+
+-- Create root folder if it doesn't exist
+insert into folders (name, parent_id, is_root)
+select 'Root', null, true
+where not exists (select 1 from folders where is_root = true);
+
+update folders set path = '/' || id || '/' where is_root = true and path is null;
+"""
+
+SQLITE = """
+create table if not exists folders (
+  id integer primary key autoincrement,
+  name varchar(255) not null,
+  parent_id integer references folders(id),
+  is_root boolean default 0 not null,
+  path text,
+  created_at timestamp default current_timestamp not null,
+  last_updated timestamp default current_timestamp not null
+);
+
+create index if not exists folders_path_idx on folders (path);
+
+create table if not exists diagram_blobs (
+  hash varchar(64) primary key,
+  content text not null,
+  ref_count integer default 0 not null,
+  last_used timestamp default current_timestamp not null
+);
+
+create table if not exists diagrams (
+  id integer primary key autoincrement,
+  content text,
+  content_hash varchar(64) references diagram_blobs(hash),
+  last_updated timestamp default current_timestamp not null,
+  name varchar(255),
+  folder_id integer not null references folders(id),
+  kind varchar(32),
+  node_count integer,
+  edge_count integer,
+  byte_size integer
+);
+
+create index if not exists diagrams_content_hash_idx on diagrams (content_hash);
+create index if not exists diagrams_folder_kind_idx on diagrams (folder_id, kind);
+
+create view if not exists folder_diagram_stats as
+select folder_id,
+       count(*) as diagram_count,
+       coalesce(sum(byte_size), 0) as total_bytes,
+       coalesce(sum(node_count), 0) as total_nodes
+from diagrams
+group by folder_id;
+
+create table if not exists diagram_versions (
+  id integer primary key autoincrement,
+  diagram_id integer not null references diagrams(id) on delete cascade,
+  version_number integer not null,
+  kind varchar(16) not null,
+  payload text not null,
+  content_hash varchar(64) not null,
+  content_bytes integer not null,
+  stored_bytes integer not null,
+  created_at timestamp default current_timestamp not null,
+  unique (diagram_id, version_number)
+);
+
+insert into folders (name, parent_id, is_root)
+select 'Root', null, 1
+where not exists (select 1 from folders where is_root = 1);
+
+update folders set path = '/' || id || '/' where is_root = 1 and path is null;
+"""
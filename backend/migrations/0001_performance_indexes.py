@@ -0,0 +1,22 @@
+"""
+Indexes for the hot lookups, and at most one root folder.
+
+- Diagram.get_by_folder filters by folder_id and sorts by last_updated
+- Diagram.get_latest and Diagram.get_all sort by last_updated
+- Folder.get_children filters by parent_id
+- Folder.get_root filters by is_root, which is also made unique
+"""
+
+POSTGRES = """
+create index if not exists diagrams_folder_updated_idx on diagrams (folder_id, last_updated desc);
+create index if not exists diagrams_last_updated_idx on diagrams (last_updated desc);
+create index if not exists folders_parent_id_idx on folders (parent_id);
+create unique index if not exists folders_single_root_idx on folders (is_root) where is_root;
+"""
+
+SQLITE = """
+create index if not exists diagrams_folder_updated_idx on diagrams (folder_id, last_updated desc);
+create index if not exists diagrams_last_updated_idx on diagrams (last_updated desc);
+create index if not exists folders_parent_id_idx on folders (parent_id);
+create unique index if not exists folders_single_root_idx on folders (is_root) where is_root = 1;
+"""
@@ -0,0 +1,35 @@
+"""
+Function for pointing many diagrams at new content in one statement.
+
+p_updates is a JSON array of {"id": ..., "content_hash": ..., "kind": ...,
+"node_count": ..., "edge_count": ..., "byte_size": ...} objects. Used by the
+folder AI edit to write all changed diagrams at once.
+"""
+
+POSTGRES = """
+create or replace function bulk_update_diagram_contents(p_updates jsonb)
+returns integer
+language plpgsql
+as $$
+declare
+  updated integer;
+begin
+  update diagrams d
+  set content = null,
+      content_hash = u->>'content_hash',
+      kind = u->>'kind',
+      node_count = (u->>'node_count')::integer,
+      edge_count = (u->>'edge_count')::integer,
+      byte_size = (u->>'byte_size')::integer,
+      last_updated = timezone('utc'::text, now())
+  from jsonb_array_elements(p_updates) as u
+  where d.id = (u->>'id')::bigint;
+
+  get diagnostics updated = row_count;
+  return updated;
+end;
+$$;
+"""
+
+# SQLite has no stored functions
+SQLITE = ""
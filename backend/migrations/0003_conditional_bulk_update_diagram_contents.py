@@ -0,0 +1,33 @@
+"""
+Only write new diagram content over the content it was derived from.
+
+Each object in p_updates also carries the "expected_hash" the edit started
+from, and a diagram is only updated while its content_hash still matches.
+The function returns the updated diagrams, so callers can report the others
+as conflicts (changed or deleted in the meantime).
+"""
+
+POSTGRES = """
+drop function if exists bulk_update_diagram_contents(jsonb);
+
+create function bulk_update_diagram_contents(p_updates jsonb)
+returns setof diagrams
+language sql
+as $$
+  update diagrams d
+  set content = null,
+      content_hash = u->>'content_hash',
+      kind = u->>'kind',
+      node_count = (u->>'node_count')::integer,
+      edge_count = (u->>'edge_count')::integer,
+      byte_size = (u->>'byte_size')::integer,
+      last_updated = timezone('utc'::text, now())
+  from jsonb_array_elements(p_updates) as u
+  where d.id = (u->>'id')::bigint
+    and d.content_hash is not distinct from u->>'expected_hash'
+  returning d.*;
+$$;
+"""
+
+# SQLite has no stored functions
+SQLITE = ""
@@ -0,0 +1,169 @@
+"""
+Per-folder diagram counters kept current by triggers on the diagrams table.
+
+The folder tree used to read folder_diagram_stats, a GROUP BY view over all
+diagrams that was recomputed on every request. folder_diagram_counters holds
+the same columns and is updated by the statements that change diagrams, so
+reading it costs one row per folder. Postgres uses statement-level triggers,
+so a batch insert or delete updates each folder's counter once.
+"""
+
+POSTGRES = """
+create table if not exists folder_diagram_counters (
+  folder_id bigint primary key references folders(id) on delete cascade,
+  diagram_count integer default 0 not null,
+  total_bytes bigint default 0 not null,
+  total_nodes bigint default 0 not null
+);
+
+-- Transition tables need one trigger per event, so each event has its own function
+create or replace function count_inserted_folder_diagrams()
+returns trigger
+language plpgsql
+as $$
+begin
+  insert into folder_diagram_counters as c (folder_id, diagram_count, total_bytes, total_nodes)
+  select folder_id, count(*), sum(coalesce(byte_size, 0)), sum(coalesce(node_count, 0))
+  from new_diagrams
+  group by folder_id
+  on conflict (folder_id) do update
+  set diagram_count = c.diagram_count + excluded.diagram_count,
+      total_bytes = c.total_bytes + excluded.total_bytes,
+      total_nodes = c.total_nodes + excluded.total_nodes;
+  return null;
+end;
+$$;
+
+create or replace function count_updated_folder_diagrams()
+returns trigger
+language plpgsql
+as $$
+begin
+  insert into folder_diagram_counters as c (folder_id, diagram_count, total_bytes, total_nodes)
+  select changes.folder_id, sum(changes.diagram_count), sum(changes.total_bytes), sum(changes.total_nodes)
+  from (
+    select n.folder_id as new_folder_id, coalesce(n.byte_size, 0) as new_bytes, coalesce(n.node_count, 0) as new_nodes,
+           o.folder_id as old_folder_id, coalesce(o.byte_size, 0) as old_bytes, coalesce(o.node_count, 0) as old_nodes
+    from new_diagrams n
+    join old_diagrams o on o.id = n.id
+    -- Content-only saves leave the counters alone
+    where n.folder_id is distinct from o.folder_id
+       or n.byte_size is distinct from o.byte_size
+       or n.node_count is distinct from o.node_count
+  ) moved
+  cross join lateral (
+    values (moved.new_folder_id, 1, moved.new_bytes, moved.new_nodes),
+           (moved.old_folder_id, -1, -moved.old_bytes, -moved.old_nodes)
+  ) as changes (folder_id, diagram_count, total_bytes, total_nodes)
+  group by changes.folder_id
+  on conflict (folder_id) do update
+  set diagram_count = c.diagram_count + excluded.diagram_count,
+      total_bytes = c.total_bytes + excluded.total_bytes,
+      total_nodes = c.total_nodes + excluded.total_nodes;
+  return null;
+end;
+$$;
+
+create or replace function count_deleted_folder_diagrams()
+returns trigger
+language plpgsql
+as $$
+begin
+  update folder_diagram_counters c
+  set diagram_count = c.diagram_count - d.diagram_count,
+      total_bytes = c.total_bytes - d.total_bytes,
+      total_nodes = c.total_nodes - d.total_nodes
+  from (
+    select folder_id, count(*) as diagram_count, sum(coalesce(byte_size, 0)) as total_bytes,
+           sum(coalesce(node_count, 0)) as total_nodes
+    from old_diagrams
+    group by folder_id
+  ) d
+  where c.folder_id = d.folder_id;
+  return null;
+end;
+$$;
+
+drop trigger if exists diagrams_count_inserts on diagrams;
+create trigger diagrams_count_inserts
+after insert on diagrams
+referencing new table as new_diagrams
+for each statement execute function count_inserted_folder_diagrams();
+
+drop trigger if exists diagrams_count_updates on diagrams;
+create trigger diagrams_count_updates
+after update on diagrams
+referencing old table as old_diagrams new table as new_diagrams
+for each statement execute function count_updated_folder_diagrams();
+
+drop trigger if exists diagrams_count_deletes on diagrams;
+create trigger diagrams_count_deletes
+after delete on diagrams
+referencing old table as old_diagrams
+for each statement execute function count_deleted_folder_diagrams();
+
+-- Start from the current diagrams; the triggers keep the counters current from here on
+lock table diagrams in share row exclusive mode;
+delete from folder_diagram_counters;
+insert into folder_diagram_counters (folder_id, diagram_count, total_bytes, total_nodes)
+select folder_id, count(*), coalesce(sum(byte_size), 0), coalesce(sum(node_count), 0)
+from diagrams
+group by folder_id;
+
+drop view if exists folder_diagram_stats;
+"""
+
+# SQLite has no statement-level triggers, so every changed row updates its folders
+SQLITE = """
+create table if not exists folder_diagram_counters (
+  folder_id integer primary key references folders(id) on delete cascade,
+  diagram_count integer default 0 not null,
+  total_bytes integer default 0 not null,
+  total_nodes integer default 0 not null
+);
+
+drop trigger if exists diagrams_count_inserts;
+create trigger diagrams_count_inserts after insert on diagrams
+begin
+  insert into folder_diagram_counters (folder_id, diagram_count, total_bytes, total_nodes)
+  values (new.folder_id, 1, coalesce(new.byte_size, 0), coalesce(new.node_count, 0))
+  on conflict (folder_id) do update
+  set diagram_count = diagram_count + 1,
+      total_bytes = total_bytes + excluded.total_bytes,
+      total_nodes = total_nodes + excluded.total_nodes;
+end;
+
+drop trigger if exists diagrams_count_updates;
+create trigger diagrams_count_updates after update of folder_id, byte_size, node_count on diagrams
+begin
+  update folder_diagram_counters
+  set diagram_count = diagram_count - 1,
+      total_bytes = total_bytes - coalesce(old.byte_size, 0),
+      total_nodes = total_nodes - coalesce(old.node_count, 0)
+  where folder_id = old.folder_id;
+  insert into folder_diagram_counters (folder_id, diagram_count, total_bytes, total_nodes)
+  values (new.folder_id, 1, coalesce(new.byte_size, 0), coalesce(new.node_count, 0))
+  on conflict (folder_id) do update
+  set diagram_count = diagram_count + 1,
+      total_bytes = total_bytes + excluded.total_bytes,
+      total_nodes = total_nodes + excluded.total_nodes;
+end;
+
+drop trigger if exists diagrams_count_deletes;
+create trigger diagrams_count_deletes after delete on diagrams
+begin
+  update folder_diagram_counters
+  set diagram_count = diagram_count - 1,
+      total_bytes = total_bytes - coalesce(old.byte_size, 0),
+      total_nodes = total_nodes - coalesce(old.node_count, 0)
+  where folder_id = old.folder_id;
+end;
+
+delete from folder_diagram_counters;
+insert into folder_diagram_counters (folder_id, diagram_count, total_bytes, total_nodes)
+select folder_id, count(*), coalesce(sum(byte_size), 0), coalesce(sum(node_count), 0)
+from diagrams
+group by folder_id;
+
+drop view if exists folder_diagram_stats;
+"""
@@ -0,0 +1,60 @@
+"""
+Metadata and blob storage for diagrams saved before either existed.
+
+Replaces the backfills the app used to run row by row in every worker on
+each start. Diagrams without metadata get it derived by the diagram parser,
+then diagrams that still hold their content inline are pointed at a
+content-addressed blob. Both passes read the diagrams in pages by ID.
+"""
+from diagram_parser import diagram_metadata
+from text_delta import content_hash
+
+POSTGRES = ""
+SQLITE = ""
+
+PAGE_SIZE = 500
+
+
+def backfill_metadata(database):
+    last_id = 0
+    while True:
+        rows = database.execute(
+            "select d.id, coalesce(d.content, b.content) from diagrams d "
+            "left join diagram_blobs b on b.hash = d.content_hash "
+            "where d.byte_size is null and d.id > ? order by d.id limit ?",
+            (last_id, PAGE_SIZE)
+        ).fetchall()
+        if not rows:
+            return
+        updates = []
+        for diagram_id, content in rows:
+            metadata = diagram_metadata(content or "")
+            updates.append((metadata["kind"], metadata["node_count"], metadata["edge_count"], metadata["byte_size"], diagram_id))
+        database.execute_many("update diagrams set kind = ?, node_count = ?, edge_count = ?, byte_size = ? where id = ?", updates)
+        last_id = rows[-1][0]
+
+
+def backfill_blobs(database):
+    last_id = 0
+    while True:
+        rows = database.execute(
+            "select id, content from diagrams where content_hash is null and id > ? order by id limit ?",
+            (last_id, PAGE_SIZE)
+        ).fetchall()
+        if not rows:
+            return
+        blobs = {}
+        updates = []
+        for diagram_id, content in rows:
+            hashed = content_hash(content or "")
+            blobs[hashed] = content or ""
+            updates.append((hashed, diagram_id))
+        database.execute_many("insert into diagram_blobs (hash, content) values (?, ?) on conflict (hash) do nothing", list(blobs.items()))
+        # The blob reference counts are maintained by a trigger on diagrams
+        database.execute_many("update diagrams set content_hash = ?, content = null where id = ?", updates)
+        last_id = rows[-1][0]
+
+
+def run(database):
+    backfill_metadata(database)
+    backfill_blobs(database)
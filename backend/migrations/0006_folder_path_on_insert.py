@@ -0,0 +1,78 @@
+"""
+Materialized folder paths set by the insert itself.
+
+Folder.create used to insert a folder and then store its path with a second
+update, leaving a window in which the folder had no path. A trigger now
+computes the path from the parent's path while the row is inserted, and the
+insert fails if the parent has no path. Folders created by older versions
+get their paths here instead of in a backfill at every start.
+"""
+
+POSTGRES = """
+create or replace function set_folder_path()
+returns trigger
+language plpgsql
+as $$
+declare
+  parent_path text;
+begin
+  if new.parent_id is null then
+    new.path := '/' || new.id || '/';
+  else
+    -- Waits for a concurrent move of the parent, then sees its new path
+    select path into parent_path from folders where id = new.parent_id for share;
+    if parent_path is null then
+      raise exception 'Parent folder % not found or has no path', new.parent_id;
+    end if;
+    new.path := parent_path || new.id || '/';
+  end if;
+  return new;
+end;
+$$;
+
+drop trigger if exists folders_set_path on folders;
+create trigger folders_set_path
+before insert on folders
+for each row execute function set_folder_path();
+
+-- Folders whose parent is missing start a tree of their own
+with recursive tree as (
+  select id, '/' || id || '/' as path
+  from folders f
+  where parent_id is null or not exists (select 1 from folders p where p.id = f.parent_id)
+  union all
+  select child.id, tree.path || child.id || '/'
+  from folders child
+  join tree on child.parent_id = tree.id
+)
+update folders
+set path = tree.path
+from tree
+where folders.id = tree.id and folders.path is null;
+"""
+
+# SQLite triggers cannot change the inserted row, so the path is set right after it
+SQLITE = """
+drop trigger if exists folders_set_path;
+create trigger folders_set_path after insert on folders
+begin
+  select raise(abort, 'Parent folder not found or has no path')
+  where new.parent_id is not null and (select path from folders where id = new.parent_id) is null;
+  update folders
+  set path = coalesce((select path from folders where id = new.parent_id), '/') || new.id || '/'
+  where id = new.id;
+end;
+
+with recursive tree as (
+  select id, '/' || id || '/' as path
+  from folders f
+  where parent_id is null or not exists (select 1 from folders p where p.id = f.parent_id)
+  union all
+  select child.id, tree.path || child.id || '/'
+  from folders child
+  join tree on child.parent_id = tree.id
+)
+update folders
+set path = (select path from tree where tree.id = folders.id)
+where path is null;
+"""
@@ -0,0 +1,68 @@
+"""
+Return what bulk diagram updates and recursive folder deletes changed.
+
+bulk_update_diagrams returned a row count, so the change feed could only
+repeat the request for each diagram; it now returns the updated diagrams.
+delete_folder_recursive also returns the ids of all deleted folders, deepest
+first, so a delete event can be published for every one of them.
+"""
+
+POSTGRES = """
+drop function if exists bulk_update_diagrams(jsonb);
+
+create function bulk_update_diagrams(p_updates jsonb)
+returns setof diagrams
+language sql
+as $$
+  update diagrams d
+  set name = case when u ? 'name' then u->>'name' else d.name end,
+      folder_id = coalesce((u->>'folder_id')::bigint, d.folder_id),
+      last_updated = timezone('utc'::text, now())
+  from jsonb_array_elements(p_updates) as u
+  where d.id = (u->>'id')::bigint
+  returning d.*;
+$$;
+
+create or replace function delete_folder_recursive(p_folder_id bigint)
+returns json
+language plpgsql
+as $$
+declare
+  folder_path text;
+  root_folder boolean;
+  diagram_ids bigint[];
+  folder_ids bigint[];
+begin
+  select path, is_root into folder_path, root_folder from folders where id = p_folder_id for update;
+  if folder_path is null then
+    raise exception 'Folder % not found', p_folder_id;
+  end if;
+  if root_folder then
+    raise exception 'Cannot delete the root folder';
+  end if;
+
+  with deleted as (
+    delete from diagrams
+    where folder_id in (select id from folders where path like folder_path || '%')
+    returning id
+  )
+  select coalesce(array_agg(id), '{}') into diagram_ids from deleted;
+
+  with deleted as (
+    delete from folders where path like folder_path || '%'
+    returning id, path
+  )
+  select coalesce(array_agg(id order by length(path) desc, id), '{}') into folder_ids from deleted;
+
+  return json_build_object(
+    'folders_deleted', coalesce(array_length(folder_ids, 1), 0),
+    'diagrams_deleted', coalesce(array_length(diagram_ids, 1), 0),
+    'diagram_ids', diagram_ids,
+    'folder_ids', folder_ids
+  );
+end;
+$$;
+"""
+
+# SQLite has no stored functions
+SQLITE = ""
@@ -0,0 +1,30 @@
+"""
+Indexes in the order of the keyset-paginated diagram lists.
+
+Diagram.list orders a folder's diagrams by the sort column with missing
+values last and then by ID, optionally filtered by kind. With only
+(folder_id, last_updated) and (folder_id, kind) to go on, every page sorted
+all matching rows again. These indexes hold the rows in list order for the
+default sort (last_updated) and for sorting by name, with and without the
+kind filter. The (folder_id, kind) index is a prefix of the new kind indexes
+and is dropped. Lists sorted by the count and size columns are rarer and
+still sort the diagrams of the folder.
+"""
+
+# Postgres sorts missing values first in descending order, so the indexes say "nulls last"
+POSTGRES = """
+create index if not exists diagrams_folder_list_updated_idx on diagrams (folder_id, last_updated desc nulls last, id desc);
+create index if not exists diagrams_folder_list_name_idx on diagrams (folder_id, name desc nulls last, id desc);
+create index if not exists diagrams_folder_kind_list_updated_idx on diagrams (folder_id, kind, last_updated desc nulls last, id desc);
+create index if not exists diagrams_folder_kind_list_name_idx on diagrams (folder_id, kind, name desc nulls last, id desc);
+drop index if exists diagrams_folder_kind_idx;
+"""
+
+# SQLite sorts missing values last in descending order and has no "nulls last" in indexes
+SQLITE = """
+create index if not exists diagrams_folder_list_updated_idx on diagrams (folder_id, last_updated desc, id desc);
+create index if not exists diagrams_folder_list_name_idx on diagrams (folder_id, name desc, id desc);
+create index if not exists diagrams_folder_kind_list_updated_idx on diagrams (folder_id, kind, last_updated desc, id desc);
+create index if not exists diagrams_folder_kind_list_name_idx on diagrams (folder_id, kind, name desc, id desc);
+drop index if exists diagrams_folder_kind_idx;
+"""
@@ -0,0 +1,8 @@
+"""
+Versioned database schema migrations, applied in order by migrate.py.
+
+Each migration is a module named NNNN_description.py that defines a
+docstring and two SQL scripts: POSTGRES for Supabase/Postgres and SQLITE for
+a local SQLite database. A script may be empty if the change does not apply
+to that backend.
+"""
@@ -5,6 +5,11 @@ Using Supabase as the backend.
 import os
 from datetime import datetime
 from supabase import create_client, Client
+from text_delta import content_hash
+from search_index import SearchIndex
+from change_feed import change_feed
+from diagram_parser import diagram_metadata
+from diagram_history import HISTORY_SNAPSHOT_INTERVAL, HISTORY_MAX_VERSIONS, SNAPSHOT, encode_version, encode_snapshot, reconstruct
 
 # Initialize Supabase client
 supabase_url = os.getenv("SUPABASE_URL")
@@ -27,7 +32,7 @@ class Folder:
             if existing_root.data and len(existing_root.data) > 0:
                 raise ValueError("Only one root folder can exist in the system")
 
-        # Create the folder
+        # Create the folder; its materialized path is set by the insert itself (migration 0006)
         result = supabase.table("folders").insert({
             "name": name,
             "parent_id": parent_id,
@@ -36,9 +41,32 @@ class Folder:
             "last_updated": datetime.utcnow().isoformat()
         }).execute()
         
-        if result.data and len(result.data) > 0:
-            return result.data[0]
-        return None
+        if not result.data or len(result.data) == 0:
+            return None
+        
+        folder = result.data[0]
+        change_feed.publish("folder", "created", Folder.to_dict(folder))
+        return folder
+    
+    @staticmethod
+    def path_ids(folder):
+        """
+        Get the ids of a folder and all its ancestors, from the root down.
+        """
+        path = folder.get("path") or ""
+        return [int(part) for part in path.strip("/").split("/") if part]
+    
+    @staticmethod
+    def is_in_subtree(folder, ancestor):
+        """
+        Check whether a folder is the given ancestor or one of its descendants.
+        
+        Raises ValueError if either folder has no materialized path, since the
+        answer cannot be known and guessing could allow a cycle.
+        """
+        if not folder.get("path") or not ancestor.get("path"):
+            raise ValueError("Folder has no materialized path. Run python migrate.py up")
+        return folder["path"].startswith(ancestor["path"])
     
     @staticmethod
     def get(folder_id):
@@ -50,6 +78,52 @@ class Folder:
             return result.data[0]
         return None
     
+    @staticmethod
+    def create_many(folders):
+        """
+        Create several folders whose parents already exist.
+        
+        Each item needs a "name" and a "parent_id". The folders are inserted,
+        with their materialized paths, in a single insert. Returns the created
+        folders in the same order.
+        """
+        if not folders:
+            return []
+        
+        now = datetime.utcnow().isoformat()
+        result = supabase.table("folders").insert([
+            {
+                "name": folder["name"],
+                "parent_id": folder["parent_id"],
+                "is_root": False,
+                "created_at": now,
+                "last_updated": now
+            }
+            for folder in folders
+        ]).execute()
+        created = result.data or []
+        for folder in created:
+            change_feed.publish("folder", "created", Folder.to_dict(folder))
+        return created
+    
+    @staticmethod
+    def get_page(after_id=0, limit=500):
+        """
+        Get a page of folders ordered by ID, starting after the given ID.
+        """
+        result = supabase.table("folders").select("*").gt("id", after_id).order("id").limit(limit).execute()
+        return result.data
+    
+    @staticmethod
+    def get_many(folder_ids, columns="*"):
+        """
+        Get several folders by ID in a single query.
+        """
+        if not folder_ids:
+            return []
+        result = supabase.table("folders").select(columns).in_("id", list(folder_ids)).execute()
+        return result.data
+    
     @staticmethod
     def get_root():
         """
@@ -68,6 +142,16 @@ class Folder:
         result = supabase.table("folders").select("*").execute()
         return result.data
     
+    @staticmethod
+    def get_diagram_stats():
+        """
+        Get the number of diagrams and their total size per folder.
+        Returns a dictionary keyed by folder id.
+        """
+        # Kept current by triggers on the diagrams table (migration 0004)
+        result = supabase.table("folder_diagram_counters").select("*").execute()
+        return {stats.get("folder_id"): stats for stats in result.data or []}
+    
     @staticmethod
     def get_children(parent_id):
         """
@@ -76,33 +160,116 @@ class Folder:
         result = supabase.table("folders").select("*").eq("parent_id", parent_id).execute()
         return result.data
     
+    @staticmethod
+    def get_descendants(folder_id):
+        """
+        Get all folders below a folder, at any depth.
+        """
+        folder = Folder.get(folder_id)
+        if not folder or not folder.get("path"):
+            return []
+        result = supabase.table("folders").select("*").like("path", f"{folder['path']}%").neq("id", folder_id).execute()
+        return result.data
+    
+    @staticmethod
+    def get_ancestors(folder_id):
+        """
+        Get a folder and all its ancestors, from the root down.
+        """
+        folder = Folder.get(folder_id)
+        if not folder:
+            return []
+        ids = Folder.path_ids(folder)
+        if not ids:
+            return [folder]
+        result = supabase.table("folders").select("*").in_("id", ids).execute()
+        by_id = {ancestor.get("id"): ancestor for ancestor in result.data or []}
+        return [by_id[ancestor_id] for ancestor_id in ids if ancestor_id in by_id]
+    
+    @staticmethod
+    def move(folder_id, new_parent_id):
+        """
+        Move a folder and its whole subtree under a new parent in a single database operation.
+        Returns the number of folders whose path was rewritten.
+        
+        The folder.moved event carries the moved folder as stored after the move
+        and its "old_path". The paths of all folders in the subtree changed from
+        that prefix to the new "path" of the moved folder.
+        """
+        folder = Folder.get(folder_id)
+        if not folder:
+            raise ValueError(f"Folder with id {folder_id} not found")
+        if folder.get("is_root") and new_parent_id is not None:
+            raise ValueError("Root folder cannot have a parent")
+        if new_parent_id is not None:
+            new_parent = Folder.get(new_parent_id)
+            if not new_parent:
+                raise ValueError(f"Parent folder with id {new_parent_id} not found")
+            if Folder.is_in_subtree(new_parent, folder):
+                raise ValueError("A folder cannot be moved into itself or one of its subfolders")
+        
+        result = supabase.rpc("move_folder_subtree", {
+            "p_folder_id": folder_id,
+            "p_new_parent_id": new_parent_id
+        }).execute()
+        moved = Folder.get(folder_id) or dict(folder, parent_id=new_parent_id)
+        change_feed.publish("folder", "moved", {
+            **Folder.to_dict(moved),
+            "old_path": folder.get("path"),
+            "folders_moved": result.data or 0
+        })
+        return result.data or 0
+    
     @staticmethod
     def update(folder_id, data):
         """
         Update a folder.
+        
+        Moving a folder rewrites the paths of its whole subtree in a single statement.
         """
         # Check if we're updating a root folder
         folder = Folder.get(folder_id)
         if folder and folder.get("is_root") and "parent_id" in data and data["parent_id"] is not None:
             raise ValueError("Root folder cannot have a parent")
+        
+        # Move the folder and its subtree
+        if folder and "parent_id" in data and data["parent_id"] != folder.get("parent_id"):
+            Folder.move(folder_id, data.pop("parent_id"))
             
         # Update the folder
         data["last_updated"] = datetime.utcnow().isoformat()
         result = supabase.table("folders").update(data).eq("id", folder_id).execute()
         
         if result.data and len(result.data) > 0:
+            if "name" in data:
+                change_feed.publish("folder", "updated", Folder.to_dict(result.data[0]))
             return result.data[0]
         return None
     
     @staticmethod
-    def delete(folder_id):
+    def delete(folder_id, recursive=False):
         """
         Delete a folder.
+        
+        With recursive=True the folder, all its subfolders and all diagrams in
+        them are deleted in a single database operation, and the counts of
+        deleted rows and the ids of the deleted diagrams and folders are returned.
         """
         # Check if we're deleting a root folder
         folder = Folder.get(folder_id)
         if folder and folder.get("is_root"):
             raise ValueError("Cannot delete the root folder")
+        
+        if recursive:
+            result = supabase.rpc("delete_folder_recursive", {"p_folder_id": folder_id}).execute()
+            deleted = result.data or {}
+            for diagram_id in deleted.get("diagram_ids") or []:
+                search_index.remove(diagram_id)
+                change_feed.publish("diagram", "deleted", {"id": diagram_id})
+            # One event per removed folder, subfolders before their parents
+            for deleted_id in deleted.get("folder_ids") or []:
+                change_feed.publish("folder", "deleted", {"id": deleted_id, "recursive": True})
+            return result.data
             
         # Check if the folder has children
         children = Folder.get_children(folder_id)
@@ -110,12 +277,13 @@ class Folder:
             raise ValueError("Cannot delete folder with subfolders. Delete subfolders first.")
             
         # Check if the folder contains diagrams
-        diagrams = Diagram.get_by_folder(folder_id)
+        diagrams = Diagram.get_by_folder(folder_id, "id")
         if diagrams and len(diagrams) > 0:
             raise ValueError("Cannot delete folder containing diagrams. Move or delete diagrams first.")
             
         # Delete the folder
         result = supabase.table("folders").delete().eq("id", folder_id).execute()
+        change_feed.publish("folder", "deleted", {"id": folder_id, "recursive": False})
         return result.data
     
     @staticmethod
@@ -131,6 +299,7 @@ class Folder:
             'name': folder.get('name'),
             'parent_id': folder.get('parent_id'),
             'is_root': folder.get('is_root'),
+            'path': folder.get('path'),
             'created_at': folder.get('created_at'),
             'last_updated': folder.get('last_updated')
         }
@@ -141,6 +310,60 @@ class Diagram:
     Model for diagram operations.
     """
     
+    # Columns returned by list queries, leaving out the content
+    LIST_COLUMNS = "id, name, last_updated, folder_id, kind, node_count, edge_count, byte_size"
+    
+    # Columns list queries can be sorted by
+    SORT_COLUMNS = ("last_updated", "name", "node_count", "edge_count", "byte_size")
+    
+    # Number of rows read per query when listing diagrams
+    LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", 1000))
+    
+    # Embedded select of the content blob a diagram references
+    BLOB_COLUMNS = "diagram_blobs(content)"
+    
+    @staticmethod
+    def _select_columns(columns):
+        """
+        Add the content blob to a select if it asks for the content.
+        """
+        names = [name.strip() for name in columns.split(",")]
+        if "*" in names or "content" in names:
+            return f"{columns}, {Diagram.BLOB_COLUMNS}"
+        return columns
+    
+    @staticmethod
+    def _resolve_content(diagrams):
+        """
+        Fill in the content of diagrams from their embedded content blobs.
+        
+        Rows written before content-addressed storage keep their content inline.
+        """
+        for diagram in diagrams or []:
+            blob = diagram.pop("diagram_blobs", None)
+            if blob and blob.get("content") is not None:
+                diagram["content"] = blob["content"]
+        return diagrams
+    
+    @staticmethod
+    def store_blobs(contents):
+        """
+        Store diagram contents in the content-addressed blob table.
+        
+        Identical contents are stored once. Reference counts are maintained by a
+        trigger on the diagrams table, so a blob only needs to exist before a
+        diagram row points at it.
+        
+        Returns the content hashes in the same order as the contents.
+        """
+        hashes = [content_hash(content) for content in contents]
+        blobs = {}
+        for hashed, content in zip(hashes, contents):
+            blobs[hashed] = {"hash": hashed, "content": content}
+        if blobs:
+            supabase.rpc("put_diagram_blobs", {"p_blobs": list(blobs.values())}).execute()
+        return hashes
+    
     @staticmethod
     def create(content, name=None, folder_id=None):
         """
@@ -154,15 +377,22 @@ class Diagram:
                 root_folder = Folder.create("Root", None, True)
             folder_id = root_folder.get('id')
         
-        # Create the diagram
+        # Store the content once, then create the diagram pointing at it
+        hashed = Diagram.store_blobs([content])[0]
         result = supabase.table("diagrams").insert({
-            "content": content,
+            "content": None,
+            "content_hash": hashed,
             "name": name,
             "folder_id": folder_id,
-            "last_updated": datetime.utcnow().isoformat()
+            "last_updated": datetime.utcnow().isoformat(),
+            **diagram_metadata(content)
         }).execute()
         
         if result.data and len(result.data) > 0:
+            result.data[0]["content"] = content
+            DiagramVersion.record(result.data[0].get('id'), content)
+            search_index.update(result.data[0].get('id'), name, folder_id, content)
+            change_feed.publish("diagram", "created", Diagram.to_summary(result.data[0]))
             return result.data[0]
         return None
     
@@ -171,9 +401,71 @@ class Diagram:
         """
         Get a diagram by ID.
         """
-        result = supabase.table("diagrams").select("*").eq("id", diagram_id).execute()
+        result = supabase.table("diagrams").select(Diagram._select_columns("*")).eq("id", diagram_id).execute()
         if result.data and len(result.data) > 0:
-            return result.data[0]
+            return Diagram._resolve_content(result.data)[0]
+        return None
+    
+    @staticmethod
+    def create_many(diagrams):
+        """
+        Create several diagrams with a single insert.
+        
+        Each item needs "content" and "folder_id" and may have a "name".
+        Returns the created diagrams in the same order.
+        """
+        if not diagrams:
+            return []
+        
+        now = datetime.utcnow().isoformat()
+        hashes = Diagram.store_blobs([diagram["content"] for diagram in diagrams])
+        result = supabase.table("diagrams").insert([
+            {
+                "content": None,
+                "content_hash": hashed,
+                "name": diagram.get("name"),
+                "folder_id": diagram["folder_id"],
+                "last_updated": now,
+                **diagram_metadata(diagram["content"])
+            }
+            for diagram, hashed in zip(diagrams, hashes)
+        ]).execute()
+        
+        created = result.data or []
+        for diagram, new_diagram in zip(diagrams, created):
+            new_diagram["content"] = diagram["content"]
+        DiagramVersion.record_initial(created)
+        for diagram in created:
+            search_index.update(diagram.get('id'), diagram.get('name'), diagram.get('folder_id'), diagram.get('content'))
+            change_feed.publish("diagram", "created", Diagram.to_summary(diagram))
+        return created
+    
+    @staticmethod
+    def get_many(diagram_ids, columns="*"):
+        """
+        Get several diagrams by ID in a single query.
+        """
+        if not diagram_ids:
+            return []
+        result = supabase.table("diagrams").select(Diagram._select_columns(columns)).in_("id", list(diagram_ids)).execute()
+        return Diagram._resolve_content(result.data)
+    
+    @staticmethod
+    def get_page(after_id=0, limit=500, columns="*"):
+        """
+        Get a page of diagrams ordered by ID, starting after the given ID.
+        """
+        result = supabase.table("diagrams").select(Diagram._select_columns(columns)).gt("id", after_id).order("id").limit(limit).execute()
+        return Diagram._resolve_content(result.data)
+    
+    @staticmethod
+    def get_last_updated(diagram_id):
+        """
+        Get the last_updated timestamp of a diagram without loading its content.
+        """
+        result = supabase.table("diagrams").select("last_updated").eq("id", diagram_id).execute()
+        if result.data and len(result.data) > 0:
+            return result.data[0].get('last_updated')
         return None
     
     @staticmethod
@@ -181,36 +473,116 @@ class Diagram:
         """
         Get all diagrams.
         """
-        result = supabase.table("diagrams").select("*").order("last_updated.desc").execute()
-        return result.data
+        result = supabase.table("diagrams").select(Diagram._select_columns("*")).order("last_updated.desc").execute()
+        return Diagram._resolve_content(result.data)
+    
+    @staticmethod
+    def list(folder_id=None, kind=None, sort="last_updated", descending=True, page_size=None):
+        """
+        List diagrams without their content, optionally filtered by folder and
+        diagram kind and sorted by one of SORT_COLUMNS.
+        
+        Returns a generator that reads the diagrams in keyset-paginated pages
+        of LIST_PAGE_SIZE rows. Rows are ordered by the sort column, with
+        missing values last, and then by ID, so every page starts right
+        after the last row of the previous one. The sort column is checked
+        before the first page is read.
+        """
+        if sort not in Diagram.SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by {sort}. Use one of: {', '.join(Diagram.SORT_COLUMNS)}")
+        page_size = page_size or Diagram.LIST_PAGE_SIZE
+        
+        def pages():
+            last = None
+            while True:
+                query = supabase.table("diagrams").select(Diagram.LIST_COLUMNS)
+                if folder_id is not None:
+                    query = query.eq("folder_id", folder_id)
+                if kind:
+                    query = query.eq("kind", kind)
+                if last is not None:
+                    query = query.or_(Diagram._after_filter(sort, descending, last))
+                result = query.order(sort, desc=descending, nullsfirst=False).order("id", desc=descending).limit(page_size).execute()
+                rows = result.data or []
+                yield from rows
+                if len(rows) < page_size:
+                    return
+                last = rows[-1]
+        
+        return pages()
+    
+    @staticmethod
+    def _after_filter(sort, descending, last):
+        """
+        Build the PostgREST "or" filter that selects the rows after a row in list order.
+        """
+        operator = "lt" if descending else "gt"
+        value = last.get(sort)
+        if value is None:
+            # Missing values come last, ordered by ID only
+            return f"and({sort}.is.null,id.{operator}.{last.get('id')})"
+        quoted = '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+        return f"{sort}.{operator}.{quoted},and({sort}.eq.{quoted},id.{operator}.{last.get('id')}),{sort}.is.null"
     
     @staticmethod
     def get_latest():
         """
         Get the latest diagram.
         """
-        result = supabase.table("diagrams").select("*").order("last_updated.desc").limit(1).execute()
+        result = supabase.table("diagrams").select(Diagram._select_columns("*")).order("last_updated.desc").limit(1).execute()
         if result.data and len(result.data) > 0:
-            return result.data[0]
+            return Diagram._resolve_content(result.data)[0]
         return None
     
     @staticmethod
-    def get_by_folder(folder_id):
+    def get_by_folder(folder_id, columns="*"):
         """
         Get all diagrams in a folder.
         """
-        result = supabase.table("diagrams").select("*").eq("folder_id", folder_id).order("last_updated.desc").execute()
-        return result.data
+        result = supabase.table("diagrams").select(Diagram._select_columns(columns)).eq("folder_id", folder_id).order("last_updated.desc").execute()
+        return Diagram._resolve_content(result.data)
     
     @staticmethod
     def update(diagram_id, data):
         """
         Update a diagram.
+        
+        Content identical to the stored content is not written again, and an
+        update that changes nothing returns the diagram as stored.
         """
+        data = dict(data)
+        content = data.pop("content", None)
+        content_changed = False
+        
+        if content is not None:
+            current = supabase.table("diagrams").select(f"{Diagram.LIST_COLUMNS}, content_hash").eq("id", diagram_id).execute()
+            if not current.data:
+                return None
+            current = current.data[0]
+            
+            if current.get("content_hash") == content_hash(content):
+                # Only write the fields that actually change
+                data = {key: value for key, value in data.items() if current.get(key) != value}
+                if not data:
+                    current["content"] = content
+                    return current
+            else:
+                content_changed = True
+                data["content"] = None
+                data["content_hash"] = Diagram.store_blobs([content])[0]
+                data.update(diagram_metadata(content))
+        
         data["last_updated"] = datetime.utcnow().isoformat()
         result = supabase.table("diagrams").update(data).eq("id", diagram_id).execute()
         
         if result.data and len(result.data) > 0:
+            if content is not None:
+                result.data[0]["content"] = content
+            if content_changed:
+                DiagramVersion.record(diagram_id, content)
+            search_index.update(diagram_id, result.data[0].get("name"), result.data[0].get("folder_id"), content if content_changed else None)
+            action = "moved" if set(data) == {"folder_id", "last_updated"} else "updated"
+            change_feed.publish("diagram", action, Diagram.to_summary(result.data[0]))
             return result.data[0]
         return None
     
@@ -220,8 +592,99 @@ class Diagram:
         Delete a diagram.
         """
         result = supabase.table("diagrams").delete().eq("id", diagram_id).execute()
+        search_index.remove(diagram_id)
+        change_feed.publish("diagram", "deleted", {"id": diagram_id})
         return result.data
     
+    @staticmethod
+    def update_many(updates):
+        """
+        Update the name and/or folder of several diagrams in a single database operation.
+        
+        Each item needs an "id" and may have a "name" and a "folder_id".
+        Returns the updated diagrams, without their content.
+        """
+        if not updates:
+            return []
+        result = supabase.rpc("bulk_update_diagrams", {"p_updates": updates}).execute()
+        
+        renamed = {update["id"] for update in updates if "name" in update}
+        updated = result.data or []
+        for diagram in updated:
+            search_index.update(diagram.get('id'), diagram.get('name'), diagram.get('folder_id'))
+            action = "updated" if diagram.get('id') in renamed else "moved"
+            change_feed.publish("diagram", action, Diagram.to_summary(diagram))
+        return updated
+    
+    @staticmethod
+    def update_contents(updates):
+        """
+        Write new content for several diagrams in a single database operation.
+        
+        Each item needs an "id", the new "content" and the "expected_hash" of
+        the stored content the new content was derived from. A diagram whose
+        stored content no longer has that hash (or that was deleted) is left
+        alone. Only the content and its metadata are written, so concurrent
+        renames and moves are kept.
+        Returns the updated diagrams, with their new content.
+        """
+        if not updates:
+            return []
+        
+        hashes = Diagram.store_blobs([update["content"] for update in updates])
+        rows = [
+            {
+                "id": update["id"],
+                "expected_hash": update.get("expected_hash"),
+                "content_hash": hashed,
+                **diagram_metadata(update["content"])
+            }
+            for update, hashed in zip(updates, hashes)
+        ]
+        result = supabase.rpc("bulk_update_diagram_contents", {"p_updates": rows}).execute()
+        
+        contents = {update["id"]: update["content"] for update in updates}
+        updated = result.data or []
+        for diagram in updated:
+            diagram["content"] = contents.get(diagram.get('id'))
+            DiagramVersion.record(diagram.get('id'), diagram["content"])
+            search_index.update(diagram.get('id'), diagram.get('name'), diagram.get('folder_id'), diagram["content"])
+            change_feed.publish("diagram", "updated", Diagram.to_summary(diagram))
+        return updated
+    
+    @staticmethod
+    def delete_many(diagram_ids):
+        """
+        Delete several diagrams with a single delete.
+        """
+        if not diagram_ids:
+            return []
+        result = supabase.table("diagrams").delete().in_("id", list(diagram_ids)).execute()
+        for diagram_id in diagram_ids:
+            search_index.remove(diagram_id)
+            change_feed.publish("diagram", "deleted", {"id": diagram_id})
+        return result.data
+    
+    @staticmethod
+    def to_summary(diagram):
+        """
+        Convert the diagram to a dictionary without its content, for lists and events.
+        """
+        if not diagram:
+            return None
+            
+        return {
+            'id': diagram.get('id'),
+            'name': diagram.get('name'),
+            'last_updated': diagram.get('last_updated'),
+            'folder_id': diagram.get('folder_id'),
+            'kind': diagram.get('kind'),
+            'node_count': diagram.get('node_count'),
+            'edge_count': diagram.get('edge_count'),
+            'byte_size': diagram.get('byte_size'),
+            'version': diagram.get('content_hash') or (content_hash(diagram['content']) if diagram.get('content') is not None else None)
+        }
+    
     @staticmethod
     def to_dict(diagram):
         """
@@ -235,8 +698,185 @@ class Diagram:
             'content': diagram.get('content'),
             'last_updated': diagram.get('last_updated'),
             'name': diagram.get('name'),
-            'folder_id': diagram.get('folder_id')
+            'folder_id': diagram.get('folder_id'),
+            'kind': diagram.get('kind'),
+            'node_count': diagram.get('node_count'),
+            'edge_count': diagram.get('edge_count'),
+            'byte_size': diagram.get('byte_size'),
+            'version': content_hash(diagram.get('content') or '')
+        }
+
+class DiagramVersion:
+    """
+    Model for diagram version history.
+    
+    Versions are stored as periodic full snapshots with compressed line diffs
+    in between (see diagram_history.py).
+    """
+    
+    # Columns returned when listing versions, leaving out the payload
+    LIST_COLUMNS = "version_number, kind, content_bytes, stored_bytes, content_hash, created_at"
+    
+    @staticmethod
+    def _get_chain(diagram_id, version_number=None):
+        """
+        Get the versions from the nearest snapshot up to a version, in ascending order.
+        """
+        def query():
+            builder = supabase.table("diagram_versions").select("*").eq("diagram_id", diagram_id)
+            if version_number is not None:
+                builder = builder.lte("version_number", version_number)
+            return builder.order("version_number.desc")
+        
+        versions = query().limit(HISTORY_SNAPSHOT_INTERVAL).execute().data or []
+        
+        # Chains written with a larger snapshot interval can be longer
+        if len(versions) == HISTORY_SNAPSHOT_INTERVAL and not any(v.get("kind") == SNAPSHOT for v in versions):
+            versions = query().execute().data or []
+        
+        chain = []
+        for version in versions:
+            chain.insert(0, version)
+            if version.get("kind") == SNAPSHOT:
+                return chain
+        return []
+    
+    @staticmethod
+    def record(diagram_id, content):
+        """
+        Record a new version of a diagram, unless its content is unchanged.
+        
+        Errors are logged rather than raised so that history never blocks a save.
+        """
+        try:
+            chain = DiagramVersion._get_chain(diagram_id)
+            hashed = content_hash(content)
+            
+            if chain and chain[-1].get("content_hash") == hashed:
+                return None
+            
+            if chain:
+                previous = reconstruct(chain)
+                version_number = chain[-1].get("version_number") + 1
+                deltas_since_snapshot = len(chain) - 1
+            else:
+                previous = None
+                version_number = 1
+                deltas_since_snapshot = 0
+            
+            version = encode_version(previous, content, deltas_since_snapshot)
+            
+            result = supabase.table("diagram_versions").insert({
+                "diagram_id": diagram_id,
+                "version_number": version_number,
+                "kind": version["kind"],
+                "payload": version["payload"],
+                "content_hash": hashed,
+                "content_bytes": len(content.encode("utf-8")),
+                "stored_bytes": len(version["payload"]),
+                "created_at": datetime.utcnow().isoformat()
+            }).execute()
+            
+            if result.data and len(result.data) > 0:
+                return result.data[0]
+        except Exception as e:
+            print(f"Error recording version of diagram {diagram_id}: {str(e)}")
+        return None
+    
+    @staticmethod
+    def record_initial(diagrams):
+        """
+        Record the first version of several newly created diagrams with a single insert.
+        """
+        if not diagrams:
+            return
+        try:
+            now = datetime.utcnow().isoformat()
+            rows = []
+            for diagram in diagrams:
+                content = diagram.get("content") or ""
+                payload = encode_snapshot(content)
+                rows.append({
+                    "diagram_id": diagram.get("id"),
+                    "version_number": 1,
+                    "kind": SNAPSHOT,
+                    "payload": payload,
+                    "content_hash": content_hash(content),
+                    "content_bytes": len(content.encode("utf-8")),
+                    "stored_bytes": len(payload),
+                    "created_at": now
+                })
+            supabase.table("diagram_versions").insert(rows).execute()
+        except Exception as e:
+            print(f"Error recording initial versions: {str(e)}")
+    
+    @staticmethod
+    def get_all(diagram_id):
+        """
+        Get all versions of a diagram, newest first, without their content.
+        """
+        result = supabase.table("diagram_versions").select(DiagramVersion.LIST_COLUMNS).eq("diagram_id", diagram_id).order("version_number.desc").execute()
+        return result.data
+    
+    @staticmethod
+    def get_content(diagram_id, version_number):
+        """
+        Reconstruct the content of a version of a diagram.
+        """
+        chain = DiagramVersion._get_chain(diagram_id, version_number)
+        if not chain or chain[-1].get("version_number") != version_number:
+            return None
+        
+        version = chain[-1]
+        return {
+            'version_number': version.get('version_number'),
+            'content': reconstruct(chain),
+            'content_hash': version.get('content_hash'),
+            'created_at': version.get('created_at')
         }
+    
+    @staticmethod
+    def compact(diagram_id, keep=HISTORY_MAX_VERSIONS):
+        """
+        Drop all but the newest versions of a diagram.
+        
+        The oldest kept version is rewritten as a snapshot so the remaining
+        versions can still be reconstructed. Returns the number of deleted versions.
+        """
+        result = supabase.table("diagram_versions").select("version_number").eq("diagram_id", diagram_id).order("version_number.desc").range(keep - 1, keep - 1).execute()
+        if not result.data:
+            return 0
+        
+        oldest_kept = result.data[0].get("version_number")
+        oldest = DiagramVersion.get_content(diagram_id, oldest_kept)
+        if not oldest:
+            return 0
+        
+        payload = encode_snapshot(oldest["content"])
+        supabase.table("diagram_versions").update({
+            "kind": SNAPSHOT,
+            "payload": payload,
+            "stored_bytes": len(payload)
+        }).eq("diagram_id", diagram_id).eq("version_number", oldest_kept).execute()
+        
+        deleted = supabase.table("diagram_versions").delete().eq("diagram_id", diagram_id).lt("version_number", oldest_kept).execute()
+        return len(deleted.data or [])
+
+# Function to iterate over all diagrams without loading them all at once
+def iter_all_diagrams(columns="id, name, folder_id, content", page_size=500):
+    """
+    Yields every diagram, reading keyset-paginated pages from the database.
+    """
+    last_id = 0
+    while True:
+        diagrams = Diagram.get_page(last_id, page_size, columns)
+        yield from diagrams
+        if len(diagrams) < page_size:
+            break
+        last_id = diagrams[-1].get('id')
+
+# Full-text index over diagram names and labels, kept in sync by the Diagram write paths
+search_index = SearchIndex(iter_all_diagrams)
 
 # Function to initialize database schema
 def initialize_schema():
@@ -310,6 +950,33 @@ def ensure_root_folder_exists():
     
     return root_folder
 
+# Function to delete content blobs no diagram references anymore
+def collect_diagram_blobs():
+    """
+    Deletes unreferenced content blobs.
+    Returns the number of deleted blobs.
+    """
+    result = supabase.rpc("collect_diagram_blobs", {}).execute()
+    deleted = result.data or 0
+    if deleted:
+        print(f"Deleted {deleted} unreferenced diagram blobs")
+    return deleted
+
+# Function to compact the version history of all diagrams
+def compact_diagram_history(keep=HISTORY_MAX_VERSIONS):
+    """
+    Runs version history compaction for every diagram.
+    Returns the total number of deleted versions.
+    """
+    diagrams = supabase.table("diagrams").select("id").execute()
+    
+    deleted = 0
+    for diagram in diagrams.data or []:
+        deleted += DiagramVersion.compact(diagram.get('id'), keep)
+    
+    print(f"Compacted diagram history, deleted {deleted} versions")
+    return deleted
+
 # Function to migrate existing diagrams to the root folder
 def migrate_diagrams_to_root_folder(root_folder_id):
     """
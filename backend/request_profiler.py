@@ -0,0 +1,228 @@
+"""
+Opt-in cProfile profiling of individual requests.
+
+Profiling is off unless PROFILER_ENABLED=1. A request is then profiled when
+it carries a valid signed X-Profile header, or at random with probability
+PROFILER_SAMPLE_RATE. Each profile is written to PROFILER_DIR as a .pstats
+file (for pstats or snakeviz) or as collapsed stacks (for flamegraph tools).
+
+Overhead is capped so profiling can be left enabled in production: at most
+one request per process is profiled at a time, at most PROFILER_ROUTE_LIMIT
+profiles are taken per route and PROFILER_TOTAL_LIMIT in total per
+PROFILER_WINDOW_SECONDS.
+
+The X-Profile header is "<unix timestamp>.<signature>", where the signature
+is the hex HMAC-SHA256 of "<timestamp>:<METHOD>:<path>" with PROFILER_SECRET.
+Run this module to print a header for a request:
+
+    python request_profiler.py GET /api/folders
+"""
+import cProfile
+import hashlib
+import hmac
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from flask import g, request
+
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") == "1"
+
+# Key for signing X-Profile headers; signed requests are disabled without it
+PROFILER_SECRET = os.getenv("PROFILER_SECRET", "")
+
+# Fraction of requests profiled without a signed header
+PROFILER_SAMPLE_RATE = float(os.getenv("PROFILER_SAMPLE_RATE", 0))
+
+PROFILER_DIR = os.getenv("PROFILER_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+
+# pstats or collapsed
+PROFILER_FORMAT = os.getenv("PROFILER_FORMAT", "pstats")
+
+# Maximum number of profiles per route and in total per window
+PROFILER_ROUTE_LIMIT = int(os.getenv("PROFILER_ROUTE_LIMIT", 5))
+PROFILER_TOTAL_LIMIT = int(os.getenv("PROFILER_TOTAL_LIMIT", 30))
+PROFILER_WINDOW_SECONDS = int(os.getenv("PROFILER_WINDOW_SECONDS", 3600))
+
+# Signed headers older than this are rejected
+SIGNATURE_MAX_AGE_SECONDS = 300
+
+# Depth limit of the collapsed stacks
+COLLAPSED_MAX_DEPTH = 64
+
+
+def sign(method: str, path: str, timestamp: int = None) -> str:
+    """
+    Create the X-Profile header value for a request.
+    """
+    timestamp = int(timestamp if timestamp is not None else time.time())
+    message = f"{timestamp}:{method.upper()}:{path}".encode("utf-8")
+    signature = hmac.new(PROFILER_SECRET.encode("utf-8"), message, hashlib.sha256).hexdigest()
+    return f"{timestamp}.{signature}"
+
+
+def verify(header: str, method: str, path: str) -> bool:
+    """
+    Check an X-Profile header value against the request it was sent with.
+    """
+    if not PROFILER_SECRET or not header:
+        return False
+    timestamp, _, signature = header.partition(".")
+    if not timestamp.isdigit() or abs(time.time() - int(timestamp)) > SIGNATURE_MAX_AGE_SECONDS:
+        return False
+    expected = sign(method, path, int(timestamp)).partition(".")[2]
+    return hmac.compare_digest(signature, expected)
+
+
+def collapsed_stacks(stats: pstats.Stats) -> list:
+    """
+    Convert profile statistics to collapsed stack lines ("a;b;c microseconds").
+
+    cProfile only records direct callers, so each function is attributed to
+    the chain of its most expensive callers.
+    """
+    def name(function):
+        filename, line, function_name = function
+        return f"{os.path.basename(filename)}:{function_name}:{line}"
+
+    lines = []
+    for function, (_, _, own_time, _, callers) in stats.stats.items():
+        if own_time <= 0:
+            continue
+        stack = [name(function)]
+        seen = {function}
+        current_callers = callers
+        while current_callers and len(stack) < COLLAPSED_MAX_DEPTH:
+            # callers maps each caller to (calls, primitive calls, own time, cumulative time)
+            caller = max(current_callers, key=lambda item: current_callers[item][3])
+            if caller in seen:
+                break
+            seen.add(caller)
+            stack.append(name(caller))
+            current_callers = stats.stats.get(caller, (0, 0, 0, 0, {}))[4]
+        lines.append(f"{';'.join(reversed(stack))} {int(own_time * 1_000_000)}")
+    return lines
+
+
+class RequestProfiler:
+    """
+    Decides which requests to profile and writes their profiles.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = False
+        self._window_start = time.monotonic()
+        self._route_counts = defaultdict(int)
+        self._total_count = 0
+
+    def _acquire(self, route):
+        """
+        Reserve the profiler for a request on a route, if the caps allow it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= PROFILER_WINDOW_SECONDS:
+                self._window_start = now
+                self._route_counts.clear()
+                self._total_count = 0
+            if (
+                self._active
+                or self._total_count >= PROFILER_TOTAL_LIMIT
+                or self._route_counts[route] >= PROFILER_ROUTE_LIMIT
+            ):
+                return False
+            self._active = True
+            self._route_counts[route] += 1
+            self._total_count += 1
+            return True
+
+    def _release(self):
+        with self._lock:
+            self._active = False
+
+    def start(self):
+        """
+        Start profiling the current request if it asks for it or is sampled.
+        """
+        signed = verify(request.headers.get("X-Profile"), request.method, request.path)
+        if not signed and (PROFILER_SAMPLE_RATE <= 0 or random.random() >= PROFILER_SAMPLE_RATE):
+            return
+
+        route = request.url_rule.rule if request.url_rule else request.path
+        if not self._acquire(route):
+            return
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active in this process
+            self._release()
+            return
+        g.profile = profile
+        g.profile_route = route
+        g.profile_start = time.perf_counter()
+
+    def stop(self, response=None):
+        """
+        Stop profiling the current request and write its profile.
+        """
+        profile = g.pop("profile", None)
+        if profile is None:
+            return response
+        try:
+            profile.disable()
+            elapsed_ms = (time.perf_counter() - g.pop("profile_start")) * 1000
+            path = self._write(profile, g.pop("profile_route"), elapsed_ms)
+            if response is not None:
+                response.headers["X-Profile-File"] = os.path.basename(path)
+        except Exception as e:
+            print(f"Error writing request profile: {str(e)}")
+        finally:
+            self._release()
+        return response
+
+    def _write(self, profile, route, elapsed_ms):
+        os.makedirs(PROFILER_DIR, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", f"{request.method} {route}").strip("_")
+        timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        base = os.path.join(PROFILER_DIR, f"{timestamp}_{slug}_{elapsed_ms:.0f}ms")
+
+        if PROFILER_FORMAT == "collapsed":
+            path = f"{base}.collapsed"
+            with open(path, "w", encoding="utf-8") as profile_file:
+                profile_file.write("\n".join(collapsed_stacks(pstats.Stats(profile))) + "\n")
+        else:
+            path = f"{base}.pstats"
+            profile.dump_stats(path)
+        return path
+
+
+def init_profiler(app):
+    """
+    Register request profiling on a Flask app, if PROFILER_ENABLED is set.
+    """
+    if not PROFILER_ENABLED:
+        return
+
+    profiler = RequestProfiler()
+    app.before_request(profiler.start)
+    app.after_request(profiler.stop)
+
+    # Requests that fail with an exception skip after_request
+    app.teardown_request(lambda exception: profiler.stop())
+
+
+if __name__ == "__main__":
+    import sys
+
+    if not PROFILER_SECRET or len(sys.argv) != 3:
+        print("Usage: PROFILER_SECRET=... python request_profiler.py METHOD PATH")
+        sys.exit(1)
+    print(f"X-Profile: {sign(sys.argv[1], sys.argv[2])}")
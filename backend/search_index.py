@@ -0,0 +1,277 @@
+"""
+In-memory inverted index over diagram names and mermaid labels.
+
+The index is built once from the database on first use and is then kept in
+sync by the Diagram write paths, so searching never scans the diagrams table.
+Each server process keeps its own index.
+"""
+import bisect
+import math
+import re
+import threading
+from typing import Callable, Dict, List, Optional
+
+from diagram_parser import parse_flowchart
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Generic label syntax for diagram types the flowchart parser does not understand
+LABEL_RE = re.compile(r'"([^"]+)"|\[([^\]]+)\]|\(([^)]+)\)|\{([^}]+)\}|:\s*(.+)$', re.MULTILINE)
+
+# Weight of a token occurrence in the diagram name relative to one in a label
+NAME_WEIGHT = 3
+
+MAX_SNIPPETS = 3
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase search tokens.
+    """
+    return [token for token in TOKEN_RE.findall(text.lower()) if len(token) > 1 or token.isdigit()]
+
+
+def extract_labels(content: str) -> List[str]:
+    """
+    Extract the human readable labels from mermaid code.
+
+    Args:
+        content (str): The mermaid code
+
+    Returns:
+        List[str]: The node labels of a flowchart, or the bracketed, quoted and
+        colon-separated texts of other diagram types
+    """
+    parsed = parse_flowchart(content)
+    if parsed:
+        return [label or node_id for node_id, label in parsed["nodes"].items()]
+
+    labels = []
+    for match in LABEL_RE.finditer(content):
+        label = next(group for group in match.groups() if group is not None).strip()
+        if label:
+            labels.append(label)
+    return labels
+
+
+class SearchIndex:
+    """
+    Inverted index from tokens to diagrams, with tf-idf ranking.
+    """
+
+    def __init__(self, loader: Callable):
+        # Called with no arguments, yields every diagram as a dict with id, name, folder_id and content
+        self._loader = loader
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._documents: Dict[int, Dict] = {}
+        self._vocabulary: List[str] = []
+        self._vocabulary_dirty = False
+        self._loaded = False
+        self._loading = False
+        self._removed_while_loading = set()
+        self._updated_while_loading: Dict[int, Dict] = {}
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+
+    def ensure_loaded(self):
+        """
+        Build the index from the database if it has not been built yet.
+        """
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            with self._lock:
+                self._loading = True
+                self._removed_while_loading = set()
+                self._updated_while_loading = {}
+            try:
+                for diagram in self._loader():
+                    with self._lock:
+                        diagram_id = diagram.get("id")
+                        # Changes made while loading are newer than what was loaded
+                        if diagram_id in self._documents or diagram_id in self._removed_while_loading:
+                            continue
+                        diagram = {**diagram, **self._updated_while_loading.pop(diagram_id, {})}
+                        self._add(diagram_id, diagram.get("name"), diagram.get("folder_id"), diagram.get("content") or "")
+                with self._lock:
+                    self._loaded = True
+            finally:
+                with self._lock:
+                    self._loading = False
+                    self._removed_while_loading = set()
+                    self._updated_while_loading = {}
+
+    def update(self, diagram_id, name=None, folder_id=None, content=None):
+        """
+        Add a diagram to the index or update the fields of an indexed diagram.
+
+        Fields passed as None keep their indexed value. A diagram that is not
+        indexed yet is only added when its folder and content are given;
+        otherwise it is left to the initial load, which reads it from the database.
+        """
+        with self._lock:
+            document = self._documents.get(diagram_id)
+            if not document and (content is None or folder_id is None):
+                if self._loading:
+                    # The loader may already have read the older row; apply the change when it is added
+                    changes = {"name": name, "folder_id": folder_id, "content": content}
+                    self._updated_while_loading.setdefault(diagram_id, {}).update(
+                        {key: value for key, value in changes.items() if value is not None}
+                    )
+                return
+            if document:
+                name = name if name is not None else document["name"]
+                folder_id = folder_id if folder_id is not None else document["folder_id"]
+                if content is None:
+                    # Only the name or folder changed; keep the indexed labels
+                    labels = document["labels"]
+                    self._remove(diagram_id)
+                    self._add(diagram_id, name, folder_id, None, labels)
+                    return
+                self._remove(diagram_id)
+            self._add(diagram_id, name, folder_id, content)
+
+    def remove(self, diagram_id):
+        """
+        Remove a diagram from the index.
+        """
+        with self._lock:
+            if self._loading:
+                self._removed_while_loading.add(diagram_id)
+            self._remove(diagram_id)
+
+    def search(self, query: str, limit: int = 20, folder_id: Optional[int] = None) -> List[Dict]:
+        """
+        Find the diagrams matching all tokens of a query, best matches first.
+
+        The last query token also matches as a prefix, so results appear while typing.
+
+        Args:
+            query (str): The search query
+            limit (int): Maximum number of results
+            folder_id (Optional[int]): Only return diagrams in this folder
+
+        Returns:
+            List[Dict]: The id, name, folder_id, score and matching label snippets of each result
+        """
+        self.ensure_loaded()
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        with self._lock:
+            document_count = max(len(self._documents), 1)
+            scores: Optional[Dict[int, float]] = None
+            matched_terms = set()
+
+            for position, token in enumerate(tokens):
+                terms = [token]
+                if position == len(tokens) - 1:
+                    terms = self._prefix_terms(token) or terms
+
+                token_scores: Dict[int, float] = {}
+                for term in terms:
+                    postings = self._postings.get(term)
+                    if not postings:
+                        continue
+                    matched_terms.add(term)
+                    idf = math.log(1 + document_count / len(postings))
+                    for diagram_id, weight in postings.items():
+                        token_scores[diagram_id] = max(token_scores.get(diagram_id, 0), weight * idf)
+
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {
+                        diagram_id: score + token_scores[diagram_id]
+                        for diagram_id, score in scores.items()
+                        if diagram_id in token_scores
+                    }
+                if not scores:
+                    return []
+
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            results = []
+            for diagram_id, score in ranked:
+                document = self._documents[diagram_id]
+                if folder_id is not None and document["folder_id"] != folder_id:
+                    continue
+                results.append({
+                    "id": diagram_id,
+                    "name": document["name"],
+                    "folder_id": document["folder_id"],
+                    "score": round(score, 4),
+                    "snippets": self._snippets(document, matched_terms)
+                })
+                if len(results) >= limit:
+                    break
+            return results
+
+    def stats(self):
+        """
+        Get the size of the index.
+        """
+        with self._lock:
+            return {"loaded": self._loaded, "diagrams": len(self._documents), "tokens": len(self._postings)}
+
+    def _add(self, diagram_id, name, folder_id, content, labels=None):
+        if labels is None:
+            labels = extract_labels(content or "")
+
+        weights: Dict[str, float] = {}
+        for token in tokenize(name or ""):
+            weights[token] = weights.get(token, 0) + NAME_WEIGHT
+        for label in labels:
+            for token in tokenize(label):
+                weights[token] = weights.get(token, 0) + 1
+
+        # Dampen repeated tokens so large diagrams do not dominate the ranking
+        for token, weight in weights.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                self._vocabulary_dirty = True
+            postings[diagram_id] = 1 + math.log(weight)
+
+        self._documents[diagram_id] = {
+            "name": name,
+            "folder_id": folder_id,
+            "labels": labels,
+            "tokens": list(weights)
+        }
+
+    def _remove(self, diagram_id):
+        document = self._documents.pop(diagram_id, None)
+        if not document:
+            return
+        for token in document["tokens"]:
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(diagram_id, None)
+            if not postings:
+                del self._postings[token]
+                self._vocabulary_dirty = True
+
+    def _prefix_terms(self, prefix):
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        terms = []
+        for term in self._vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def _snippets(self, document, terms):
+        snippets = []
+        for label in document["labels"]:
+            if any(token in terms for token in tokenize(label)):
+                snippets.append(label)
+                if len(snippets) >= MAX_SNIPPETS:
+                    break
+        return snippets
@@ -0,0 +1,16 @@
+"""
+Shared setup for the backend tests.
+
+The tests import the backend modules directly, so the backend directory is put
+on the import path. models.py creates its Supabase client at import time,
+which needs a URL and key but does not connect; tests replace the model
+methods they use and never reach the database.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("LLM_CASSETTE_MODE", "off")
@@ -0,0 +1,149 @@
+import pytest
+
+import bulk_operations
+from bulk_operations import apply_bulk_operations
+from models import Diagram, Folder
+
+
+class FakeDiagrams:
+    """
+    Stands in for the Diagram and Folder queries and batched writes of a bulk request.
+    """
+
+    def __init__(self, diagram_ids, folder_ids):
+        self.diagram_ids = set(diagram_ids)
+        self.folder_ids = set(folder_ids)
+        self.writes = []
+        self.failing = set()
+
+    def get_many(self, ids, columns):
+        return [{"id": diagram_id} for diagram_id in ids if diagram_id in self.diagram_ids]
+
+    def get_folders(self, ids, columns):
+        return [{"id": folder_id} for folder_id in ids if folder_id in self.folder_ids]
+
+    def write(self, kind, items):
+        self.writes.append((kind, items))
+        if kind in self.failing:
+            raise RuntimeError(f"{kind} failed")
+
+    def delete_many(self, diagram_ids):
+        self.write("delete", list(diagram_ids))
+        self.diagram_ids -= set(diagram_ids)
+        return [{"id": diagram_id} for diagram_id in diagram_ids]
+
+    def update_many(self, updates):
+        self.write("update", updates)
+        return [dict(update) for update in updates if update["id"] in self.diagram_ids]
+
+    def create_many(self, diagrams):
+        self.write("create", diagrams)
+        return [dict(diagram, id=100 + index) for index, diagram in enumerate(diagrams)]
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDiagrams(diagram_ids=[1, 2, 3, 4], folder_ids=[1, 7])
+    monkeypatch.setattr(Diagram, "get_many", staticmethod(database.get_many))
+    monkeypatch.setattr(Folder, "get_many", staticmethod(database.get_folders))
+    monkeypatch.setattr(Diagram, "delete_many", staticmethod(database.delete_many))
+    monkeypatch.setattr(Diagram, "update_many", staticmethod(database.update_many))
+    monkeypatch.setattr(Diagram, "create_many", staticmethod(database.create_many))
+    monkeypatch.setattr(bulk_operations, "ensure_root_folder_exists", lambda: {"id": 1})
+    return database
+
+
+def errors(response):
+    return {result["index"]: result.get("error") for result in response["results"] if not result["success"]}
+
+
+def test_mixed_batch_is_written_once_per_operation_type(database):
+    response = apply_bulk_operations([
+        {"op": "move", "id": 1, "folder_id": 7},
+        {"op": "rename", "id": 1, "name": "Checkout"},
+        {"op": "delete", "id": 2},
+        {"op": "create", "content": "graph TD\nA --> B", "name": "New"},
+    ])
+
+    assert response["succeeded"] == 4 and response["failed"] == 0
+    assert [result["id"] for result in response["results"]] == [1, 1, 2, 100]
+    assert database.writes == [
+        ("delete", [2]),
+        ("update", [{"id": 1, "folder_id": 7, "name": "Checkout"}]),
+        ("create", [{"content": "graph TD\nA --> B", "name": "New", "folder_id": 1}]),
+    ]
+
+
+def test_invalid_operations_are_reported_and_not_written(database):
+    response = apply_bulk_operations([
+        {"op": "rename", "id": 1, "name": 42},
+        {"op": "rename", "id": 1, "name": "x" * 256},
+        {"op": "rename", "id": 1, "name": ""},
+        {"op": "create", "content": {"graph": "TD"}},
+        {"op": "create", "content": "graph TD", "name": ["New"]},
+        {"op": "create", "content": "graph TD", "name": "x" * 256},
+        {"op": "create", "content": ""},
+        {"op": "move", "id": 9, "folder_id": 7},
+        {"op": "move", "id": 3, "folder_id": 8},
+        {"op": "copy", "id": 3},
+        "delete 3",
+        {"op": "rename", "id": 4, "name": "x" * 255},
+    ])
+
+    assert sorted(errors(response)) == list(range(11))
+    assert "name must be a string" in errors(response)[0]
+    assert "longer than 255" in errors(response)[1]
+    assert "content must be a non-empty string" in errors(response)[3]
+    assert response["succeeded"] == 1
+    assert database.writes == [("update", [{"id": 4, "name": "x" * 255}])]
+
+
+def test_a_failed_write_only_fails_its_own_operations(database):
+    database.failing.add("update")
+
+    response = apply_bulk_operations([
+        {"op": "delete", "id": 2},
+        {"op": "move", "id": 1, "folder_id": 7},
+        {"op": "rename", "id": 3, "name": "Renamed"},
+        {"op": "create", "content": "graph TD\nA --> B"},
+    ])
+
+    assert errors(response) == {1: "Failed to update diagram", 2: "Failed to update diagram"}
+    assert response["results"][0]["success"] and response["results"][3]["success"]
+    assert [kind for kind, _ in database.writes] == ["delete", "update", "create"]
+
+
+def test_failed_create_is_reported_per_operation(database):
+    database.failing.add("create")
+
+    response = apply_bulk_operations([
+        {"op": "create", "content": "graph TD\nA --> B"},
+        {"op": "delete", "id": 4},
+    ])
+
+    assert errors(response) == {0: "Failed to create diagram"}
+    assert response["succeeded"] == 1
+
+
+def test_diagrams_deleted_after_validation_are_reported(database, monkeypatch):
+    # Diagram 3 still exists when the batch is validated and is gone when it is written
+    monkeypatch.setattr(Diagram, "get_many", staticmethod(lambda ids, columns: [{"id": diagram_id} for diagram_id in ids]))
+    database.diagram_ids.discard(3)
+
+    response = apply_bulk_operations([{"op": "rename", "id": 3, "name": "Gone"}])
+
+    assert errors(response) == {0: "Diagram with id 3 not found"}
+
+
+def test_operations_on_a_deleted_diagram_are_refused(database):
+    response = apply_bulk_operations([
+        {"op": "delete", "id": 1},
+        {"op": "move", "id": 1, "folder_id": 7},
+        {"op": "rename", "id": 2, "name": "Kept"},
+        {"op": "delete", "id": 2},
+    ])
+
+    assert errors(response) == {
+        1: "Diagram with id 1 is deleted in the same batch",
+        3: "Diagram with id 2 is updated in the same batch",
+    }
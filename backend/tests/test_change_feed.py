@@ -0,0 +1,48 @@
+import threading
+
+from change_feed import ChangeFeed
+
+
+def test_cursor_resumes_after_the_last_seen_event():
+    feed = ChangeFeed()
+    feed.publish("diagram", "created", {"id": 1})
+    feed.publish("diagram", "moved", {"id": 1, "folder_id": 2})
+
+    events, missed = feed.events_after(feed.parse_cursor(f"{feed.epoch}-1"))
+
+    assert not missed
+    assert [event["type"] for event in events] == ["diagram.moved"]
+    assert events[0]["id"] == f"{feed.epoch}-2"
+
+
+def test_cursor_from_another_process_cannot_be_resumed():
+    feed = ChangeFeed()
+    feed.publish("folder", "created", {"id": 2})
+
+    assert feed.parse_cursor(None) is None
+    assert feed.parse_cursor("0000beef-1") is None
+    assert feed.parse_cursor(f"{feed.epoch}-x") is None
+
+
+def test_dropped_events_are_reported_as_missed():
+    feed = ChangeFeed(capacity=2)
+    for diagram_id in range(1, 5):
+        feed.publish("diagram", "deleted", {"id": diagram_id})
+
+    events, missed = feed.events_after(1)
+    assert missed
+    assert [event["data"]["id"] for event in events] == [3, 4]
+
+    events, missed = feed.events_after(2)
+    assert not missed
+    assert feed.events_after(feed.latest()) == ([], False)
+
+
+def test_wait_returns_when_an_event_is_published():
+    feed = ChangeFeed()
+    assert not feed.wait(feed.latest(), timeout=0.01)
+
+    timer = threading.Timer(0.05, feed.publish, ("diagram", "created", {"id": 1}))
+    timer.start()
+    assert feed.wait(0, timeout=5)
+    timer.join()
@@ -0,0 +1,63 @@
+from diagram_chunks import clean_edited_chunk, reassemble_chunks, split_into_chunks
+
+DIAGRAM = "\n".join([
+    "graph TD",
+    "subgraph Billing",
+    "A[Invoice] --> B[Payment]",
+    "end",
+    "subgraph Shipping",
+    "C[Pack] --> D[Ship]",
+    "end",
+    "B --> C",
+])
+
+
+def test_split_into_subgraphs_and_remainder():
+    split = split_into_chunks(DIAGRAM)
+
+    assert split["header"] == "graph TD"
+    assert [chunk["line_indices"] for chunk in split["chunks"]] == [[1, 2, 3], [4, 5, 6], [7]]
+    assert [chunk["is_subgraph"] for chunk in split["chunks"]] == [True, True, False]
+    assert split["shared_nodes"] == {"B", "C"}
+
+
+def test_diagrams_with_one_subgraph_or_link_styles_are_not_split():
+    assert split_into_chunks("graph TD\nsubgraph One\nA --> B\nend") is None
+    assert split_into_chunks(DIAGRAM + "\nlinkStyle 0 stroke:red") is None
+
+
+def test_clean_edited_chunk_strips_fences_and_header():
+    split = split_into_chunks(DIAGRAM)
+
+    lines = clean_edited_chunk(split["chunks"][0], "```\ngraph TD\nsubgraph Billing\nA[Rechnung] --> B[Zahlung]\nend\n```", split["shared_nodes"])
+
+    assert lines == ["subgraph Billing", "A[Rechnung] --> B[Zahlung]", "end"]
+
+
+def test_clean_edited_chunk_rejects_renamed_block_or_missing_shared_node():
+    split = split_into_chunks(DIAGRAM)
+    billing = split["chunks"][0]
+
+    assert clean_edited_chunk(billing, "subgraph Invoices\nA --> B\nend", split["shared_nodes"]) is None
+    assert clean_edited_chunk(billing, "subgraph Billing\nA --> X\nend", split["shared_nodes"]) is None
+    assert clean_edited_chunk(split["chunks"][2], "subgraph New\nB --> C\nend", split["shared_nodes"]) is None
+
+
+def test_reassemble_puts_edited_chunks_back_in_place():
+    split = split_into_chunks(DIAGRAM)
+    edited = [
+        ["subgraph Billing", "A[Rechnung] --> B[Zahlung]", "end"],
+        ["subgraph Shipping", "C[Packen] --> D[Versand]", "end"],
+        ["B --> C"],
+    ]
+
+    assert reassemble_chunks(DIAGRAM, split, edited) == "\n".join([
+        "graph TD",
+        "subgraph Billing",
+        "A[Rechnung] --> B[Zahlung]",
+        "end",
+        "subgraph Shipping",
+        "C[Packen] --> D[Versand]",
+        "end",
+        "B --> C",
+    ])
@@ -0,0 +1,48 @@
+from diagram_context import CONTEXT_TRIM_MIN_LINES, build_trimmed_context, splice_excerpt
+
+
+def chain_diagram(length=CONTEXT_TRIM_MIN_LINES + 50):
+    lines = ["graph TD"]
+    for index in range(length):
+        lines.append(f"N{index}[Step {index}] --> N{index + 1}[Step {index + 1}]")
+    return "\n".join(lines)
+
+
+def test_small_diagrams_are_not_trimmed():
+    assert build_trimmed_context("graph TD\nA[Payment] --> B", "Rename Payment") is None
+
+
+def test_excerpt_covers_the_neighbourhood_of_named_nodes():
+    code = chain_diagram()
+
+    context = build_trimmed_context(code, "Add a retry after Step 100", hops=1)
+
+    assert context["header"] == "graph TD"
+    assert context["line_indices"] == [100, 101]
+    assert "N100[Step 100]" in context["excerpt"]
+    assert "N0[Step 0]" in context["summary"]
+
+
+def test_requests_about_the_whole_diagram_are_not_trimmed():
+    assert build_trimmed_context(chain_diagram(), "Make every node of Step 100 blue") is None
+
+
+def test_splice_replaces_the_excerpt_lines():
+    code = chain_diagram()
+    context = build_trimmed_context(code, "Add a retry after Step 100", hops=1)
+
+    updated = splice_excerpt(code, context, "graph TD\nN99 --> N100\nN100 --> R[Retry]\nR --> N101")
+
+    lines = updated.split("\n")
+    assert lines[100:103] == ["N99 --> N100", "N100 --> R[Retry]", "R --> N101"]
+    assert lines[103] == code.split("\n")[102]
+    assert len(lines) == len(code.split("\n")) + 1
+
+
+def test_splice_rejects_answers_that_are_not_an_excerpt():
+    code = chain_diagram()
+    context = build_trimmed_context(code, "Add a retry after Step 100", hops=1)
+
+    assert splice_excerpt(code, context, "") is None
+    assert splice_excerpt(code, context, "subgraph Retry\nN100 --> R\nend") is None
+    assert splice_excerpt(code, context, code) is None
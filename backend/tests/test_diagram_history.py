@@ -0,0 +1,70 @@
+import pytest
+
+import diagram_history
+from diagram_history import DELTA, SNAPSHOT, apply_delta, encode_delta, encode_snapshot, encode_version, reconstruct
+
+
+def edit_history(count):
+    diagram = ["flowchart TD"] + [f"    N{i}[Step {i}] --> N{i + 1}" for i in range(50)]
+    for edit in range(count):
+        if edit % 3 == 0:
+            diagram.insert(edit % 40 + 1, f"    N{edit} --> X{edit}[Retry {edit}]")
+        else:
+            diagram[edit % 40 + 1] = diagram[edit % 40 + 1].replace("Step", "Stage", 1)
+        yield "\n".join(diagram)
+
+
+def encode_history(contents):
+    previous = None
+    deltas_since_snapshot = 0
+    versions = []
+    for content in contents:
+        version = encode_version(previous, content, deltas_since_snapshot)
+        deltas_since_snapshot = 0 if version["kind"] == SNAPSHOT else deltas_since_snapshot + 1
+        versions.append(version)
+        previous = content
+    return versions
+
+
+def test_every_version_can_be_reconstructed():
+    contents = list(edit_history(45))
+    versions = encode_history(contents)
+
+    for index, content in enumerate(contents):
+        assert reconstruct(versions[:index + 1]) == content
+
+
+def test_snapshots_are_stored_at_the_interval(monkeypatch):
+    monkeypatch.setattr(diagram_history, "HISTORY_SNAPSHOT_INTERVAL", 5)
+
+    versions = encode_history(edit_history(12))
+
+    assert [version["kind"] == SNAPSHOT for version in versions] == [True, False, False, False, False] * 2 + [True, False]
+
+
+def test_unrelated_content_is_stored_as_a_snapshot():
+    version = encode_version("graph TD\nA --> B", "sequenceDiagram\nAlice->>Bob: Hi", 0)
+
+    assert version["kind"] == SNAPSHOT
+
+
+def test_delta_replaces_lines_of_the_previous_version():
+    previous = "graph TD\nA --> B\nB --> C\n"
+    content = "graph TD\nA --> B\nB --> D\nD --> C\n"
+
+    assert apply_delta(previous, encode_delta(previous, content)) == content
+    assert apply_delta(previous, encode_delta(previous, "")) == ""
+
+
+def test_chain_must_start_with_a_snapshot():
+    with pytest.raises(ValueError):
+        reconstruct([])
+    with pytest.raises(ValueError):
+        reconstruct([{"kind": DELTA, "payload": encode_delta("a\n", "b\n")}])
+
+
+def test_payloads_are_text():
+    payload = encode_snapshot("graph TD\nA[Größe] --> B")
+
+    assert payload.isascii()
+    assert reconstruct([{"kind": SNAPSHOT, "payload": payload}]) == "graph TD\nA[Größe] --> B"
@@ -0,0 +1,61 @@
+from diagram_parser import detect_diagram_kind, diagram_metadata, get_neighbourhood, parse_flowchart
+
+
+def test_detect_diagram_kind():
+    assert detect_diagram_kind("graph TD\nA --> B") == "graph"
+    assert detect_diagram_kind("sequenceDiagram\nA->>B: hi") == "sequenceDiagram"
+    assert detect_diagram_kind("hello") is None
+
+
+def test_parse_flowchart_nodes_edges_and_labels():
+    parsed = parse_flowchart("graph TD\nA[Start] -->|go| B{Ready?}\nB -- yes --> C(Done)\nstyle C fill:#f9f")
+
+    assert parsed["header"] == "graph TD"
+    assert parsed["nodes"] == {"A": "Start", "B": "Ready?", "C": "Done"}
+    assert parsed["edges"] == [("A", "B"), ("B", "C")]
+    assert [statement.kind for statement in parsed["statements"]] == ["header", "edge", "edge", "directive"]
+
+
+def test_parse_flowchart_tracks_subgraph_depth():
+    parsed = parse_flowchart("flowchart LR\nsubgraph One\nA --> B\nend\nB --> C")
+
+    assert [statement.depth for statement in parsed["statements"]] == [0, 0, 1, 0, 0]
+
+
+def test_parse_flowchart_rejects_other_diagram_types():
+    assert parse_flowchart("sequenceDiagram\nA->>B: hi") is None
+
+
+def test_get_neighbourhood_ignores_direction_and_stops_after_hops():
+    edges = [("A", "B"), ("C", "B"), ("C", "D"), ("D", "E")]
+
+    assert get_neighbourhood(edges, {"B"}, 1) == {"A", "B", "C"}
+    assert get_neighbourhood(edges, {"B"}, 2) == {"A", "B", "C", "D"}
+
+
+def test_diagram_metadata_of_sequence_diagram():
+    metadata = diagram_metadata("sequenceDiagram\nparticipant Alice\nAlice->>Bob: Hello\nBob-->>Alice: Hi")
+
+    assert metadata["kind"] == "sequenceDiagram"
+    assert metadata["node_count"] == 2
+    assert metadata["edge_count"] == 2
+
+
+def test_diagram_metadata_of_flowchart_skips_comments():
+    metadata = diagram_metadata("graph TD\nA[Start] --> B{Ok?}\nB -->|yes| C\n%% note\nB --> A")
+
+    assert metadata == {"kind": "graph", "node_count": 3, "edge_count": 3, "byte_size": 57}
+
+
+def test_diagram_metadata_counts_classes_and_entities():
+    assert diagram_metadata("classDiagram\nclass Animal\nAnimal <|-- Duck\nAnimal <|-- Fish")["node_count"] == 3
+    assert diagram_metadata("erDiagram\nCUSTOMER ||--o{ ORDER : places")["edge_count"] == 1
+
+
+def test_diagram_metadata_of_other_kinds_only_has_a_size():
+    assert diagram_metadata('pie title Pets\n"Dogs" : 3') == {"kind": "pie", "node_count": 0, "edge_count": 0, "byte_size": 25}
+    assert diagram_metadata("") == {"kind": None, "node_count": 0, "edge_count": 0, "byte_size": 0}
+
+
+def test_diagram_metadata_size_is_in_utf8_bytes():
+    assert diagram_metadata("graph TD\nA[Größe] --> B")["byte_size"] == len("graph TD\nA[Größe] --> B".encode("utf-8"))
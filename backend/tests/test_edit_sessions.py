@@ -0,0 +1,133 @@
+import threading
+import time
+
+import pytest
+
+import edit_sessions
+from edit_sessions import EditSessionCache
+
+
+class FakeStore:
+    """
+    Records saves and can be told to fail the next few of them.
+    """
+
+    def __init__(self, contents):
+        self.contents = dict(contents)
+        self.saves = []
+        self.failures = 0
+        self.saved = threading.Event()
+
+    def load(self, diagram_id):
+        if diagram_id not in self.contents:
+            return None
+        return {"id": diagram_id, "content": self.contents[diagram_id], "last_updated": "t0"}
+
+    def save(self, diagram_id, content):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("database unavailable")
+        self.contents[diagram_id] = content
+        self.saves.append((time.monotonic(), diagram_id, content))
+        self.saved.set()
+        return {"id": diagram_id, "last_updated": f"t{len(self.saves)}"}
+
+
+@pytest.fixture
+def timings(monkeypatch):
+    monkeypatch.setattr(edit_sessions, "SAVE_DEBOUNCE_SECONDS", 0.05)
+    monkeypatch.setattr(edit_sessions, "SAVE_MAX_DELAY_SECONDS", 0.3)
+    monkeypatch.setattr(edit_sessions, "SAVE_RETRY_MAX_SECONDS", 0.2)
+
+
+def edit(cache, session, content):
+    with session.lock:
+        cache.apply_change(session, content)
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_burst_of_changes_is_saved_once(timings):
+    store = FakeStore({1: "graph TD"})
+    cache = EditSessionCache(store.load, store.save)
+    session = cache.get(1)
+
+    for step in range(5):
+        edit(cache, session, f"graph TD\nA --> N{step}")
+
+    assert store.saves == []
+    assert wait_for(lambda: not session.dirty)
+    time.sleep(0.1)
+    assert [content for _, _, content in store.saves] == ["graph TD\nA --> N4"]
+    assert session.last_updated == "t1"
+
+
+def test_steady_changes_are_flushed_after_the_maximum_delay(timings):
+    store = FakeStore({1: "graph TD"})
+    cache = EditSessionCache(store.load, store.save)
+    session = cache.get(1)
+
+    started = time.monotonic()
+    step = 0
+    # Keep changing faster than the debounce interval
+    while not store.saves and time.monotonic() - started < 2:
+        edit(cache, session, f"graph TD\nA --> N{step}")
+        step += 1
+        time.sleep(0.01)
+
+    assert store.saves
+    assert store.saves[0][0] - started < 0.3 + 0.2
+
+
+def test_evicted_session_is_saved(timings):
+    store = FakeStore({1: "graph TD", 2: "graph LR"})
+    cache = EditSessionCache(store.load, store.save, max_sessions=1)
+    session = cache.get(1)
+    edit(cache, session, "graph TD\nA --> B")
+
+    cache.get(2)
+
+    assert store.contents[1] == "graph TD\nA --> B"
+    assert not session.dirty
+    assert cache.peek(1) is None
+
+
+def test_failed_save_is_retried_and_reported(timings):
+    store = FakeStore({1: "graph TD"})
+    cache = EditSessionCache(store.load, store.save)
+    session = cache.get(1)
+    store.failures = 2
+
+    edit(cache, session, "graph TD\nA --> B")
+
+    assert wait_for(lambda: cache.stats()["save_errors"] >= 1)
+    assert session.dirty
+    assert cache.stats()["failing_saves"] == 1
+
+    assert store.saved.wait(2)
+    assert wait_for(lambda: not session.dirty)
+    assert store.contents[1] == "graph TD\nA --> B"
+    assert cache.stats()["save_errors"] == 2
+    assert cache.stats()["failing_saves"] == 0
+
+
+def test_evicted_session_is_kept_while_its_save_fails(timings):
+    store = FakeStore({1: "graph TD", 2: "graph LR"})
+    cache = EditSessionCache(store.load, store.save, max_sessions=1)
+    session = cache.get(1)
+    edit(cache, session, "graph TD\nA --> B")
+    store.failures = 1
+
+    cache.get(2)
+
+    # The unsaved content is still served instead of the stale stored copy
+    assert cache.peek(1) is session
+    assert wait_for(lambda: not session.dirty)
+    assert store.contents[1] == "graph TD\nA --> B"
@@ -0,0 +1,141 @@
+import threading
+
+import pytest
+
+import folder_ai_edit
+from edit_sessions import EditSession, EditSessionCache
+from text_delta import content_hash
+
+
+class FakeDiagrams:
+    """
+    In-memory stand-in for the conditional bulk content write.
+    """
+
+    def __init__(self, contents):
+        self.hashes = {diagram_id: content_hash(content) for diagram_id, content in contents.items()}
+        self.writes = []
+        self.during_write = None
+
+    def update_contents(self, updates):
+        if self.during_write:
+            self.during_write()
+        updated = []
+        for update in updates:
+            if update["id"] in self.hashes and self.hashes[update["id"]] == update["expected_hash"]:
+                self.hashes[update["id"]] = content_hash(update["content"])
+                self.writes.append(update["id"])
+                updated.append({"id": update["id"], "last_updated": "2024-01-01T00:00:00", "content": update["content"]})
+        return updated
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    cache = EditSessionCache(loader=lambda diagram_id: None, saver=lambda diagram_id, content: None)
+    monkeypatch.setattr(folder_ai_edit, "edit_sessions", cache)
+    return cache
+
+
+def add_session(cache, diagram_id, content):
+    session = cache._sessions[diagram_id] = EditSession(diagram_id, content, "t0")
+    return session
+
+
+def loaded(diagram_id, content):
+    return {
+        "id": diagram_id,
+        "name": f"Diagram {diagram_id}",
+        "content": content,
+        "stored_hash": content_hash(content),
+        "version": content_hash(content)
+    }
+
+
+def test_write_batch_writes_diagrams_unchanged_since_loading(monkeypatch, sessions):
+    store = FakeDiagrams({1: "graph TD\nA --> B"})
+    monkeypatch.setattr(folder_ai_edit.Diagram, "update_contents", store.update_contents)
+
+    events = folder_ai_edit._write_batch([(loaded(1, "graph TD\nA --> B"), "graph TD\nA --> C")])
+
+    assert [event["status"] for event in events] == ["changed"]
+    assert events[0]["version"] == content_hash("graph TD\nA --> C")
+    assert store.writes == [1]
+
+
+def test_write_batch_reports_conflict_when_stored_content_changed(monkeypatch, sessions):
+    store = FakeDiagrams({1: "graph TD\nA --> B"})
+    store.hashes[1] = content_hash("graph TD\nA --> X")
+    monkeypatch.setattr(folder_ai_edit.Diagram, "update_contents", store.update_contents)
+
+    events = folder_ai_edit._write_batch([(loaded(1, "graph TD\nA --> B"), "graph TD\nA --> C")])
+
+    assert [event["status"] for event in events] == ["conflict"]
+    assert store.writes == []
+
+
+def test_write_batch_reports_deleted_diagram_as_conflict(monkeypatch, sessions):
+    store = FakeDiagrams({})
+    monkeypatch.setattr(folder_ai_edit.Diagram, "update_contents", store.update_contents)
+
+    events = folder_ai_edit._write_batch([(loaded(1, "graph TD\nA --> B"), "graph TD\nA --> C")])
+
+    assert [event["status"] for event in events] == ["conflict"]
+
+
+def test_write_batch_refreshes_session_instead_of_dropping_it(monkeypatch, sessions):
+    store = FakeDiagrams({1: "graph TD\nA --> B"})
+    monkeypatch.setattr(folder_ai_edit.Diagram, "update_contents", store.update_contents)
+    session = add_session(sessions, 1, "graph TD\nA --> B")
+
+    folder_ai_edit._write_batch([(loaded(1, "graph TD\nA --> B"), "graph TD\nA --> C")])
+
+    assert sessions.peek(1) is session
+    assert session.content == "graph TD\nA --> C"
+    assert session.last_updated == "2024-01-01T00:00:00"
+    assert not session.dirty
+
+
+def test_write_batch_reports_conflict_for_session_edited_during_ai_edit(monkeypatch, sessions):
+    store = FakeDiagrams({1: "graph TD\nA --> B"})
+    monkeypatch.setattr(folder_ai_edit.Diagram, "update_contents", store.update_contents)
+    session = add_session(sessions, 1, "graph TD\nA --> B")
+    session.set_content("graph TD\nA --> B\nB --> D")
+
+    events = folder_ai_edit._write_batch([(loaded(1, "graph TD\nA --> B"), "graph TD\nA --> C")])
+
+    assert [event["status"] for event in events] == ["conflict"]
+    assert store.writes == []
+    assert session.content == "graph TD\nA --> B\nB --> D"
+
+
+def test_write_batch_holds_session_lock_during_write(monkeypatch, sessions):
+    store = FakeDiagrams({1: "graph TD\nA --> B"})
+    monkeypatch.setattr(folder_ai_edit.Diagram, "update_contents", store.update_contents)
+    session = add_session(sessions, 1, "graph TD\nA --> B")
+
+    acquired = []
+
+    def try_lock_from_other_thread():
+        thread = threading.Thread(target=lambda: acquired.append(session.lock.acquire(timeout=0.05)))
+        thread.start()
+        thread.join()
+
+    store.during_write = try_lock_from_other_thread
+    folder_ai_edit._write_batch([(loaded(1, "graph TD\nA --> B"), "graph TD\nA --> C")])
+
+    assert acquired == [False]
+
+
+def test_write_batch_accepts_unsaved_content_saved_in_the_meantime(monkeypatch, sessions):
+    unsaved = "graph TD\nA --> B\nB --> D"
+    store = FakeDiagrams({1: unsaved})
+    monkeypatch.setattr(folder_ai_edit.Diagram, "update_contents", store.update_contents)
+    session = add_session(sessions, 1, unsaved)
+    diagram = loaded(1, unsaved)
+    diagram["stored_hash"] = content_hash("graph TD\nA --> B")
+    diagram["unsaved"] = True
+
+    events = folder_ai_edit._write_batch([(diagram, unsaved + "\nD --> E")])
+
+    assert [event["status"] for event in events] == ["changed"]
+    assert session.content == unsaved + "\nD --> E"
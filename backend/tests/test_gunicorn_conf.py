@@ -0,0 +1,49 @@
+import os
+import runpy
+from types import SimpleNamespace
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gunicorn.conf.py")
+
+
+def load_config(monkeypatch, **env):
+    for name in ("GUNICORN_WORKERS", "GUNICORN_WORKER_CLASS", "GUNICORN_THREADS", "EXPECTED_AI_CONCURRENCY", "EXPECTED_CHANGE_FEED_CLIENTS", "CRUD_THREADS"):
+        monkeypatch.delenv(name, raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    return runpy.run_path(CONFIG_PATH)
+
+
+def test_defaults_to_one_threaded_process(monkeypatch):
+    config = load_config(monkeypatch)
+
+    assert config["worker_class"] == "gthread"
+    assert config["workers"] == 1
+    assert config["threads"] == 100 + 50 + 32
+
+
+def test_threads_cover_the_expected_load(monkeypatch):
+    config = load_config(monkeypatch, EXPECTED_AI_CONCURRENCY="300", EXPECTED_CHANGE_FEED_CLIENTS="20", CRUD_THREADS="16")
+
+    assert config["threads"] == 336
+    assert load_config(monkeypatch, EXPECTED_AI_CONCURRENCY="300", GUNICORN_THREADS="8")["threads"] == 8
+    assert load_config(monkeypatch, GUNICORN_WORKER_CLASS="gevent")["threads"] == 1
+
+
+def test_warns_when_state_is_split_across_processes(monkeypatch):
+    config = load_config(monkeypatch, GUNICORN_WORKERS="4")
+    warnings = []
+    server = SimpleNamespace(cfg=SimpleNamespace(workers=config["workers"]), log=SimpleNamespace(warning=lambda *args: warnings.append(args)))
+
+    config["on_starting"](server)
+
+    assert len(warnings) == 1
+
+
+def test_does_not_warn_for_a_single_process(monkeypatch):
+    config = load_config(monkeypatch)
+    warnings = []
+    server = SimpleNamespace(cfg=SimpleNamespace(workers=config["workers"]), log=SimpleNamespace(warning=lambda *args: warnings.append(args)))
+
+    config["on_starting"](server)
+
+    assert warnings == []
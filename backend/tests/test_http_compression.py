@@ -0,0 +1,87 @@
+import gzip
+import types
+
+import pytest
+from flask import Flask, Response, stream_with_context
+
+import http_compression
+from http_compression import init_compression
+
+LARGE = [{"id": i, "name": f"Diagram {i}"} for i in range(200)]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(http_compression, "brotli", None)
+    app = Flask(__name__)
+
+    @app.route("/large")
+    def large():
+        return {"diagrams": LARGE}
+
+    @app.route("/small")
+    def small():
+        return {"id": 1}
+
+    @app.route("/missing")
+    def missing():
+        return {"error": "x" * 5000}, 404
+
+    @app.route("/stream")
+    def stream():
+        return Response(stream_with_context(f"{i}\n" for i in range(1000)), mimetype="text/plain")
+
+    @app.route("/events")
+    def events():
+        return Response(iter(["data: 1\n\n"]), mimetype="text/event-stream")
+
+    init_compression(app)
+    return app.test_client()
+
+
+def test_large_responses_are_gzipped(client):
+    response = client.get("/large", headers={"Accept-Encoding": "gzip, deflate"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Content-Length"] == str(len(response.data))
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.data).startswith(b'{"diagrams":')
+
+
+def test_small_and_error_responses_are_sent_as_is(client):
+    assert "Content-Encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "Content-Encoding" not in client.get("/missing", headers={"Accept-Encoding": "gzip"}).headers
+
+
+def test_clients_without_accept_encoding_get_identity(client):
+    response = client.get("/large")
+
+    assert "Content-Encoding" not in response.headers
+    assert response.get_json() == {"diagrams": LARGE}
+
+
+def test_streams_are_gzipped_incrementally(client):
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert gzip.decompress(response.data) == "".join(f"{i}\n" for i in range(1000)).encode("utf-8")
+
+
+def test_event_streams_are_never_compressed(client):
+    response = client.get("/events", headers={"Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in response.headers
+    assert response.data == b"data: 1\n\n"
+
+
+def test_brotli_is_preferred_when_installed(client, monkeypatch):
+    monkeypatch.setattr(http_compression, "brotli", types.SimpleNamespace(compress=lambda data, quality: b"br:" + data[:8]))
+
+    response = client.get("/large", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert response.data.startswith(b"br:")
+
+    # Streams stay on gzip, which can be flushed as the body is produced
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "gzip"
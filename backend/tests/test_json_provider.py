@@ -0,0 +1,41 @@
+import json
+
+import pytest
+from flask import Flask
+
+import json_provider
+from json_provider import FastJSONProvider, json_list_response
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    with app.app_context():
+        yield app
+
+
+def test_short_lists_are_sent_in_one_piece(app, monkeypatch):
+    monkeypatch.setattr(json_provider, "STREAM_MIN_ITEMS", 3)
+
+    response = json_list_response(iter([{"id": 1}, {"id": 2}]))
+
+    assert not response.is_streamed
+    assert response.get_json() == [{"id": 1}, {"id": 2}]
+
+
+def test_long_lists_are_streamed_while_they_are_read(app, monkeypatch):
+    monkeypatch.setattr(json_provider, "STREAM_MIN_ITEMS", 3)
+    read = []
+
+    def rows():
+        for index in range(10):
+            read.append(index)
+            yield {"id": index}
+
+    response = json_list_response(rows())
+
+    assert response.is_streamed
+    assert read == [0, 1, 2]
+    assert json.loads(response.get_data()) == [{"id": index} for index in range(10)]
+    assert len(read) == 10
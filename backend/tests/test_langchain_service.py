@@ -0,0 +1,160 @@
+import pytest
+
+import langchain_service
+from langchain_service import estimate_diagram_request, process_diagram_request, new_usage
+from llm_cassette import LLMCassette, CassetteMiss
+from token_budget import estimate_tokens
+
+DIAGRAM = "graph TD\nA[Start] --> B[End]"
+EDITED = "graph TD\nA[Start] --> B[End]\nB --> C[Done]"
+
+
+@pytest.fixture
+def model_calls(monkeypatch):
+    calls = []
+
+    def call_model(system_prompt, human_content):
+        calls.append(human_content)
+        return {"content": EDITED, "input_tokens": 120, "output_tokens": 30}
+
+    monkeypatch.setattr(langchain_service, "call_model", call_model)
+    return calls
+
+
+def use_cassette(monkeypatch, tmp_path, mode):
+    cassette = LLMCassette(mode=mode, directory=str(tmp_path), latency_scale=0)
+    monkeypatch.setattr(langchain_service, "llm_cassette", cassette)
+    return cassette
+
+
+def test_replays_a_recorded_request_without_calling_the_model(monkeypatch, tmp_path, model_calls):
+    use_cassette(monkeypatch, tmp_path, "record")
+    assert process_diagram_request(DIAGRAM, "Add a done node") == EDITED
+    assert len(model_calls) == 1
+
+    use_cassette(monkeypatch, tmp_path, "replay")
+    assert process_diagram_request(DIAGRAM, "Add a done node") == EDITED
+    assert len(model_calls) == 1
+
+
+def test_replay_miss_is_raised_instead_of_returning_the_original_code(monkeypatch, tmp_path, model_calls):
+    use_cassette(monkeypatch, tmp_path, "replay")
+
+    with pytest.raises(CassetteMiss):
+        process_diagram_request(DIAGRAM, "Add a done node")
+    assert model_calls == []
+
+
+def test_model_error_returns_the_original_code(monkeypatch, tmp_path):
+    use_cassette(monkeypatch, tmp_path, "off")
+
+    def call_model(system_prompt, human_content):
+        raise RuntimeError("overloaded")
+
+    monkeypatch.setattr(langchain_service, "call_model", call_model)
+
+    assert process_diagram_request(DIAGRAM, "Add a done node") == DIAGRAM
+
+
+def test_usage_counts_reported_tokens_of_every_call(monkeypatch, tmp_path, model_calls):
+    use_cassette(monkeypatch, tmp_path, "off")
+    usage = new_usage()
+
+    process_diagram_request(DIAGRAM, "Add a done node", usage=usage)
+
+    assert usage == {"input_tokens": 120, "output_tokens": 30, "model_calls": 1}
+
+
+def test_usage_estimates_counts_the_model_did_not_report(monkeypatch, tmp_path):
+    use_cassette(monkeypatch, tmp_path, "off")
+    monkeypatch.setattr(langchain_service, "call_model", lambda system_prompt, human_content: {
+        "content": EDITED, "input_tokens": None, "output_tokens": None
+    })
+    usage = new_usage()
+
+    process_diagram_request(DIAGRAM, "Add a done node", usage=usage)
+
+    assert usage["model_calls"] == 1
+    assert usage["input_tokens"] > 0
+    assert usage["output_tokens"] == estimate_tokens(EDITED)
+
+
+def large_diagram():
+    lines = ["graph TD"] + [f"N{index}[Step {index}] --> N{index + 1}[Step {index + 1}]" for index in range(200)]
+    return "\n".join(lines)
+
+
+def test_excerpt_is_requested_again_before_sending_the_full_diagram(monkeypatch, tmp_path):
+    use_cassette(monkeypatch, tmp_path, "off")
+    answers = ["subgraph Oops\nN100 --> R\nend", "N99 --> N100\nN100 --> R[Retry]\nR --> N101"]
+    prompts = []
+
+    def call_model(system_prompt, human_content):
+        prompts.append(system_prompt)
+        return {"content": answers.pop(0), "input_tokens": 10, "output_tokens": 5}
+
+    monkeypatch.setattr(langchain_service, "call_model", call_model)
+    usage = new_usage()
+
+    updated = process_diagram_request(large_diagram(), "Add a retry after Step 100", usage=usage)
+
+    assert "N100 --> R[Retry]" in updated
+    assert prompts == [langchain_service.EXCERPT_SYSTEM_PROMPT] * 2
+    assert usage["model_calls"] == 2
+
+
+def test_full_diagram_is_sent_after_two_unusable_excerpts(monkeypatch, tmp_path):
+    use_cassette(monkeypatch, tmp_path, "off")
+    code = large_diagram()
+    prompts = []
+
+    def call_model(system_prompt, human_content):
+        prompts.append(system_prompt)
+        if system_prompt == langchain_service.SYSTEM_PROMPT:
+            return {"content": code + "\nN200 --> Z[End]", "input_tokens": 4000, "output_tokens": 4000}
+        return {"content": "", "input_tokens": 10, "output_tokens": 0}
+
+    monkeypatch.setattr(langchain_service, "call_model", call_model)
+    usage = new_usage()
+
+    updated = process_diagram_request(code, "Add a retry after Step 100", usage=usage)
+
+    assert updated.endswith("N200 --> Z[End]")
+    assert prompts[-1] == langchain_service.SYSTEM_PROMPT
+    assert usage["model_calls"] == 3
+    assert usage["input_tokens"] == 4020
+
+
+CHUNKED = "graph TD\nsubgraph Billing\nA[Invoice] --> B[Payment]\nend\nsubgraph Shipping\nC[Pack] --> D[Ship]\nend\nB --> C"
+
+
+def test_failed_chunk_call_falls_back_to_the_full_diagram(monkeypatch, tmp_path):
+    use_cassette(monkeypatch, tmp_path, "off")
+    edited = CHUNKED.replace("Invoice", "Rechnung")
+
+    def call_model(system_prompt, human_content):
+        if system_prompt == langchain_service.SYSTEM_PROMPT:
+            return {"content": edited, "input_tokens": 50, "output_tokens": 50}
+        if "Shipping" in human_content:
+            raise RuntimeError("overloaded")
+        return {"content": human_content.split("\n\n")[2], "input_tokens": 10, "output_tokens": 10}
+
+    monkeypatch.setattr(langchain_service, "call_model", call_model)
+
+    assert process_diagram_request(CHUNKED, "Translate to German", chunked=True) == edited
+
+
+def test_chunked_replay_miss_is_raised(monkeypatch, tmp_path, model_calls):
+    use_cassette(monkeypatch, tmp_path, "replay")
+
+    with pytest.raises(CassetteMiss):
+        process_diagram_request(CHUNKED, "Translate to German", chunked=True)
+
+
+def test_estimate_follows_the_request_path():
+    assert estimate_diagram_request(DIAGRAM, "Add a node")["strategy"] == "full"
+
+    chunked = estimate_diagram_request(CHUNKED, "Translate to German", chunked=True)
+    assert chunked["strategy"] == "chunked"
+    assert chunked["model_calls"] == 3
+    assert chunked["input_tokens"] > 3 * estimate_tokens(langchain_service.CHUNK_SYSTEM_PROMPT)
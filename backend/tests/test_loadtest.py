@@ -0,0 +1,32 @@
+import io
+import urllib.error
+
+from loadtest import Stats, timed
+
+
+def fail_with(code):
+    def function():
+        raise urllib.error.HTTPError("http://localhost/api/update-diagram", code, "error", {}, io.BytesIO(b"{}"))
+    return function
+
+
+def test_rate_limited_requests_are_counted_apart_from_errors():
+    stats = Stats("ai")
+
+    timed(stats, fail_with(429))
+    timed(stats, fail_with(500))
+    assert timed(stats, lambda: {"ok": True}) == {"ok": True}
+
+    assert stats.rejected == 1
+    assert stats.errors == 1
+    assert len(stats.latencies) == 1
+
+
+def test_report_shows_rejected_requests(capsys):
+    stats = Stats("ai")
+    stats.add(0.5, True)
+    stats.add_rejected()
+
+    stats.report(elapsed=1)
+
+    assert "1 rejected (429)" in capsys.readouterr().out
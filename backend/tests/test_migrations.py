@@ -0,0 +1,153 @@
+import builtins
+import os
+import re
+import sqlite3
+
+import pytest
+
+import migrate
+from migrate import HOT_QUERIES, Database, load_migrations, scans_table
+from text_delta import content_hash
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = Database(f"sqlite:///{tmp_path / 'diagrams.db'}")
+    database.ensure_migrations_table()
+    return database
+
+
+def apply_until(database, version):
+    applied = database.applied_versions()
+    for migration in load_migrations():
+        if migration["version"] not in applied and migration["version"] <= version:
+            database.apply(migration)
+
+
+def folder_counters(database):
+    rows = database.execute("select folder_id, diagram_count, total_bytes, total_nodes from folder_diagram_counters order by folder_id").fetchall()
+    return {row[0]: row[1:] for row in rows}
+
+
+def test_all_migrations_apply_to_sqlite(database):
+    apply_until(database, "9999")
+
+    assert database.applied_versions() == {migration["version"] for migration in load_migrations()}
+
+
+def test_baseline_does_not_read_the_live_schema_file(monkeypatch):
+    real_open = builtins.open
+
+    def guarded_open(file, *args, **kwargs):
+        assert not str(file).endswith("supabase_tables.sql")
+        return real_open(file, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "open", guarded_open)
+    baseline = load_migrations()[0]
+
+    assert baseline["version"] == "0000"
+    assert "create table if not exists folders" in baseline["postgres"]
+
+
+def test_folder_counters_follow_diagram_changes(database):
+    apply_until(database, "9999")
+    database.execute("insert into folders (name, parent_id) values ('Plans', 1)")
+    database.execute("insert into diagrams (folder_id, byte_size, node_count) values (1, 100, 3), (1, 50, 2), (2, 10, 1)")
+
+    assert folder_counters(database) == {1: (2, 150, 5), 2: (1, 10, 1)}
+
+    database.execute("update diagrams set folder_id = 2, byte_size = 60 where byte_size = 50")
+    database.execute("update diagrams set name = 'Renamed' where folder_id = 1")
+    assert folder_counters(database) == {1: (1, 100, 3), 2: (2, 70, 3)}
+
+    database.execute("delete from diagrams where folder_id = 2")
+    assert folder_counters(database) == {1: (1, 100, 3), 2: (0, 0, 0)}
+
+
+def test_folder_counters_start_from_existing_diagrams(database):
+    apply_until(database, "0003")
+    database.execute("insert into diagrams (folder_id, byte_size, node_count) values (1, 100, 3), (1, null, null)")
+
+    apply_until(database, "0004")
+
+    assert folder_counters(database) == {1: (2, 100, 3)}
+
+
+def test_old_diagrams_get_metadata_and_blobs(database):
+    apply_until(database, "0004")
+    content = "graph TD\nA --> B\nB --> C"
+    database.execute("insert into diagrams (folder_id, content) values (1, ?), (1, ?)", (content, content))
+
+    apply_until(database, "0005")
+
+    rows = database.execute("select content, content_hash, kind, node_count, edge_count, byte_size from diagrams").fetchall()
+    assert rows == [(None, content_hash(content), "graph", 3, 2, len(content))] * 2
+    assert database.execute("select hash, content from diagram_blobs").fetchall() == [(content_hash(content), content)]
+    assert folder_counters(database) == {1: (2, 2 * len(content), 6)}
+
+
+def test_folder_path_is_set_by_the_insert(database):
+    apply_until(database, "9999")
+    database.execute("insert into folders (name, parent_id) values ('Plans', 1)")
+    database.execute("insert into folders (name, parent_id) values ('Q3', 2)")
+
+    assert database.execute("select id, path from folders order by id").fetchall() == [(1, "/1/"), (2, "/1/2/"), (3, "/1/2/3/")]
+
+
+def test_folder_insert_fails_without_a_parent_path(database):
+    apply_until(database, "9999")
+
+    with pytest.raises(sqlite3.IntegrityError):
+        database.execute("insert into folders (name, parent_id) values ('Orphan', 42)")
+
+
+def test_paths_of_older_folders_are_filled_in(database):
+    apply_until(database, "0005")
+    database.execute("insert into folders (name, parent_id) values ('Plans', 1), ('Q3', 2), ('Lost', 42)")
+
+    apply_until(database, "0006")
+
+    assert database.execute("select id, path from folders order by id").fetchall() == [
+        (1, "/1/"), (2, "/1/2/"), (3, "/1/2/3/"), (4, "/4/")
+    ]
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_queries_use_indexes(database, name):
+    apply_until(database, "9999")
+
+    plan = database.query_plan(HOT_QUERIES[name])
+
+    assert not scans_table(plan), f"{name}: {plan}"
+
+
+def test_check_passes_after_all_migrations(database):
+    apply_until(database, "9999")
+
+    assert migrate.check(database)
+
+
+def test_check_fails_without_the_list_indexes(database):
+    apply_until(database, "0007")
+
+    assert not migrate.check(database)
+
+
+def test_scans_and_sorts_are_detected():
+    assert scans_table(["SCAN diagrams"])
+    assert scans_table(["SEARCH diagrams USING INDEX diagrams_folder_updated_idx (folder_id=?)", "USE TEMP B-TREE FOR RIGHT PART OF ORDER BY"])
+    assert scans_table(["Limit", "->  Sort  (cost=1.1..1.2 rows=1 width=8)", "->  Seq Scan on diagrams"])
+    assert not scans_table(["SEARCH diagrams USING COVERING INDEX diagrams_folder_list_name_idx (folder_id=?)"])
+    assert not scans_table(["Index Scan using diagrams_folder_list_updated_idx on diagrams"])
+
+
+def test_setup_script_leaves_migrated_objects_alone():
+    with open(os.path.join(os.path.dirname(migrate.MIGRATIONS_DIR), "supabase_tables.sql")) as sql_file:
+        setup_sql = sql_file.read().lower()
+    owned = set()
+    for migration in load_migrations()[1:]:
+        owned |= set(re.findall(r"(?:create|create or replace|drop) (?:function|view|index)(?: if (?:not )?exists)? (\w+)", migration["postgres"].lower()))
+
+    assert owned
+    for name in owned:
+        assert not re.search(rf"\b{name}\b", setup_sql), name
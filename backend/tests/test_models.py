@@ -0,0 +1,314 @@
+import pytest
+
+import models
+from models import Diagram, DiagramVersion, Folder
+from change_feed import ChangeFeed
+from text_delta import content_hash
+
+
+class FakeResult:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeCall:
+    def __init__(self, data):
+        self._data = data
+
+    def execute(self):
+        return FakeResult(self._data)
+
+
+class FakeRPC:
+    """
+    Records RPC calls and answers them with canned results.
+    """
+
+    def __init__(self, results):
+        self.results = results
+        self.calls = []
+
+    def rpc(self, name, params):
+        self.calls.append((name, params))
+        result = self.results.get(name)
+        return FakeCall(result(params) if callable(result) else result)
+
+
+class FakeQuery:
+    """
+    Records a chained query and answers it with the next canned page.
+    """
+
+    def __init__(self, pages, queries):
+        self.pages = pages
+        self.calls = []
+        queries.append(self.calls)
+
+    def __getattr__(self, name):
+        def method(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return method
+
+    def execute(self):
+        return FakeResult(self.pages.pop(0))
+
+
+class FakeTables:
+    def __init__(self, pages):
+        self.pages = pages
+        self.queries = []
+
+    def table(self, name):
+        return FakeQuery(self.pages, self.queries)
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    feed = ChangeFeed()
+    monkeypatch.setattr(models, "change_feed", feed)
+    return feed
+
+
+@pytest.fixture(autouse=True)
+def no_history(monkeypatch):
+    monkeypatch.setattr(DiagramVersion, "record", staticmethod(lambda diagram_id, content: None))
+
+
+def test_update_contents_only_reports_rows_the_database_updated(monkeypatch, feed):
+    def bulk_update(params):
+        # Diagram 2 was changed by someone else, so its expected hash no longer matches
+        row = params["p_updates"][0]
+        return [{
+            "id": row["id"], "name": "Checkout", "folder_id": 3, "last_updated": "2024-01-01T00:00:00",
+            "content_hash": row["content_hash"], "kind": row["kind"], "node_count": row["node_count"],
+            "edge_count": row["edge_count"], "byte_size": row["byte_size"]
+        }]
+
+    fake = FakeRPC({"put_diagram_blobs": 2, "bulk_update_diagram_contents": bulk_update})
+    monkeypatch.setattr(models, "supabase", fake)
+
+    updated = Diagram.update_contents([
+        {"id": 1, "content": "graph TD\nA --> B", "expected_hash": "old-1"},
+        {"id": 2, "content": "graph TD\nA --> C", "expected_hash": "old-2"},
+    ])
+
+    sent = fake.calls[1][1]["p_updates"]
+    assert [row["expected_hash"] for row in sent] == ["old-1", "old-2"]
+    assert [diagram["id"] for diagram in updated] == [1]
+    assert updated[0]["content"] == "graph TD\nA --> B"
+
+    events, _ = feed.events_after(0)
+    assert [event["type"] for event in events] == ["diagram.updated"]
+    assert events[0]["data"] == Diagram.to_summary(updated[0])
+
+
+def test_list_reads_pages_after_the_last_row(monkeypatch):
+    pages = [
+        [{"id": 9, "name": 'Q3 "final"'}, {"id": 4, "name": "Checkout"}],
+        [{"id": 7, "name": None}, {"id": 2, "name": None}],
+        [{"id": 1, "name": None}],
+    ]
+    fake = FakeTables(pages)
+    monkeypatch.setattr(models, "supabase", fake)
+
+    diagrams = Diagram.list(folder_id=3, sort="name", page_size=2)
+    assert fake.queries == []
+
+    assert [diagram["id"] for diagram in diagrams] == [9, 4, 7, 2, 1]
+    assert len(fake.queries) == 3
+    assert ("eq", ("folder_id", 3), {}) in fake.queries[0]
+    assert ("order", ("name",), {"desc": True, "nullsfirst": False}) in fake.queries[0]
+    assert not any(call[0] == "or_" for call in fake.queries[0])
+    assert ("or_", ('name.lt."Checkout",and(name.eq."Checkout",id.lt.4),name.is.null',), {}) in fake.queries[1]
+    assert ("or_", ("and(name.is.null,id.lt.2)",), {}) in fake.queries[2]
+
+
+def test_list_escapes_quotes_in_the_cursor():
+    assert Diagram._after_filter("name", False, {"id": 9, "name": 'Q3 "final"'}) == (
+        'name.gt."Q3 \\"final\\"",and(name.eq."Q3 \\"final\\"",id.gt.9),name.is.null'
+    )
+
+
+def test_list_rejects_unknown_sort_before_reading():
+    with pytest.raises(ValueError):
+        Diagram.list(sort="content")
+
+
+def test_create_folder_is_a_single_insert(monkeypatch, feed):
+    fake = FakeTables([[{"id": 5, "name": "Plans", "parent_id": 1, "is_root": False, "path": "/1/5/"}]])
+    monkeypatch.setattr(models, "supabase", fake)
+
+    folder = Folder.create("Plans", 1)
+
+    assert folder["path"] == "/1/5/"
+    assert len(fake.queries) == 1
+    assert fake.queries[0][0][0] == "insert"
+    events, _ = feed.events_after(0)
+    assert events[0]["data"]["path"] == "/1/5/"
+
+
+def test_subtree_check_refuses_folders_without_a_path():
+    assert Folder.is_in_subtree({"path": "/1/4/9/"}, {"path": "/1/4/"})
+    assert not Folder.is_in_subtree({"path": "/1/7/"}, {"path": "/1/4/"})
+    with pytest.raises(ValueError):
+        Folder.is_in_subtree({"path": None}, {"path": "/1/4/"})
+
+
+def test_move_is_refused_when_the_target_has_no_path(monkeypatch, feed):
+    folders = {4: {"id": 4, "parent_id": 1, "path": "/1/4/"}, 9: {"id": 9, "parent_id": 4, "path": None}}
+    monkeypatch.setattr(Folder, "get", staticmethod(lambda folder_id: folders.get(folder_id)))
+    fake = FakeRPC({})
+    monkeypatch.setattr(models, "supabase", fake)
+
+    with pytest.raises(ValueError):
+        Folder.move(4, 9)
+    assert fake.calls == []
+
+
+def test_update_many_publishes_the_updated_diagrams(monkeypatch, feed):
+    row = {
+        "id": 4, "name": "Checkout", "folder_id": 3, "last_updated": "2024-01-01T00:00:00", "content": None,
+        "content_hash": "abc", "kind": "graph", "node_count": 2, "edge_count": 1, "byte_size": 16
+    }
+    fake = FakeRPC({"bulk_update_diagrams": [row, dict(row, id=5, name="Refund")]})
+    monkeypatch.setattr(models, "supabase", fake)
+
+    # Diagram 6 was deleted in the meantime, so the database did not return it
+    updated = Diagram.update_many([{"id": 4, "folder_id": 3}, {"id": 5, "name": "Refund"}, {"id": 6, "folder_id": 3}])
+
+    assert [diagram["id"] for diagram in updated] == [4, 5]
+    events, _ = feed.events_after(0)
+    assert [event["type"] for event in events] == ["diagram.moved", "diagram.updated"]
+    assert [event["data"] for event in events] == [Diagram.to_summary(diagram) for diagram in updated]
+
+
+def test_recursive_delete_publishes_every_removed_folder(monkeypatch, feed):
+    monkeypatch.setattr(Folder, "get", staticmethod(lambda folder_id: {"id": folder_id, "is_root": False}))
+    fake = FakeRPC({"delete_folder_recursive": {
+        "folders_deleted": 3, "diagrams_deleted": 1, "diagram_ids": [12], "folder_ids": [9, 8, 4]
+    }})
+    monkeypatch.setattr(models, "supabase", fake)
+
+    Folder.delete(4, recursive=True)
+
+    events, _ = feed.events_after(0)
+    assert [(event["type"], event["data"]["id"]) for event in events] == [
+        ("diagram.deleted", 12), ("folder.deleted", 9), ("folder.deleted", 8), ("folder.deleted", 4)
+    ]
+
+
+def test_store_blobs_sends_identical_contents_once(monkeypatch):
+    fake = FakeRPC({"put_diagram_blobs": 2})
+    monkeypatch.setattr(models, "supabase", fake)
+    contents = ["graph TD\nA --> B", "graph TD\nA --> C", "graph TD\nA --> B"]
+
+    hashes = Diagram.store_blobs(contents)
+
+    assert hashes == [content_hash(content) for content in contents]
+    assert fake.calls == [("put_diagram_blobs", {"p_blobs": [
+        {"hash": hashes[0], "content": contents[0]},
+        {"hash": hashes[1], "content": contents[1]},
+    ]})]
+
+
+def test_store_blobs_of_nothing_makes_no_call(monkeypatch):
+    fake = FakeRPC({})
+    monkeypatch.setattr(models, "supabase", fake)
+
+    assert Diagram.store_blobs([]) == []
+    assert fake.calls == []
+
+
+def test_content_blob_is_only_selected_with_the_content():
+    assert Diagram._select_columns("*") == "*, diagram_blobs(content)"
+    assert Diagram._select_columns("id, content") == "id, content, diagram_blobs(content)"
+    assert Diagram._select_columns("id, name, content_hash") == "id, name, content_hash"
+
+
+def test_content_is_read_from_the_blob_or_kept_inline():
+    diagrams = Diagram._resolve_content([
+        {"id": 1, "content": None, "diagram_blobs": {"content": "graph TD\nA --> B"}},
+        {"id": 2, "content": "graph TD\nB --> C", "diagram_blobs": None},
+    ])
+
+    assert diagrams == [{"id": 1, "content": "graph TD\nA --> B"}, {"id": 2, "content": "graph TD\nB --> C"}]
+
+
+class FakeDatabase(FakeTables):
+    def __init__(self, pages, results):
+        super().__init__(pages)
+        self.rpcs = FakeRPC(results)
+
+    def rpc(self, name, params):
+        return self.rpcs.rpc(name, params)
+
+
+def test_create_many_is_one_blob_call_and_one_insert(monkeypatch, feed):
+    monkeypatch.setattr(DiagramVersion, "record_initial", staticmethod(lambda diagrams: None))
+    rows = [{"id": 7, "name": "A", "folder_id": 1}, {"id": 8, "name": None, "folder_id": 2}]
+    fake = FakeDatabase([rows], {"put_diagram_blobs": 1})
+    monkeypatch.setattr(models, "supabase", fake)
+
+    created = Diagram.create_many([
+        {"content": "graph TD\nA --> B", "name": "A", "folder_id": 1},
+        {"content": "graph TD\nA --> B", "folder_id": 2},
+    ])
+
+    assert [name for name, _ in fake.rpcs.calls] == ["put_diagram_blobs"]
+    assert len(fake.rpcs.calls[0][1]["p_blobs"]) == 1
+    assert len(fake.queries) == 1
+    inserted = fake.queries[0][0][1][0]
+    assert [row["content_hash"] for row in inserted] == [content_hash("graph TD\nA --> B")] * 2
+    assert all(row["content"] is None and row["node_count"] == 2 for row in inserted)
+    assert [diagram["content"] for diagram in created] == ["graph TD\nA --> B"] * 2
+    events, _ = feed.events_after(0)
+    assert [(event["type"], event["data"]["id"]) for event in events] == [("diagram.created", 7), ("diagram.created", 8)]
+
+
+def test_delete_many_is_one_delete(monkeypatch, feed):
+    fake = FakeTables([[{"id": 3}, {"id": 5}]])
+    monkeypatch.setattr(models, "supabase", fake)
+
+    Diagram.delete_many([3, 5])
+
+    assert len(fake.queries) == 1
+    assert ("in_", ("id", [3, 5]), {}) in fake.queries[0]
+    events, _ = feed.events_after(0)
+    assert [event["data"] for event in events] == [{"id": 3}, {"id": 5}]
+
+
+def test_bulk_helpers_skip_empty_batches(monkeypatch):
+    fake = FakeDatabase([], {})
+    monkeypatch.setattr(models, "supabase", fake)
+
+    assert Diagram.create_many([]) == []
+    assert Diagram.delete_many([]) == []
+    assert Diagram.update_many([]) == []
+    assert Diagram.update_contents([]) == []
+    assert fake.queries == [] and fake.rpcs.calls == []
+
+
+def test_move_publishes_the_new_path_of_the_subtree(monkeypatch, feed):
+    folders = {
+        4: {"id": 4, "name": "Plans", "parent_id": 1, "is_root": False, "path": "/1/4/"},
+        7: {"id": 7, "name": "Archive", "parent_id": 1, "is_root": False, "path": "/1/7/"},
+    }
+    monkeypatch.setattr(Folder, "get", staticmethod(lambda folder_id: dict(folders[folder_id]) if folder_id in folders else None))
+
+    def move_subtree(params):
+        # The database rewrites the paths of the folder and its two subfolders
+        folders[4].update(parent_id=7, path="/1/7/4/", last_updated="2024-01-02T00:00:00")
+        return 3
+
+    monkeypatch.setattr(models, "supabase", FakeRPC({"move_folder_subtree": move_subtree}))
+
+    assert Folder.move(4, 7) == 3
+
+    events, _ = feed.events_after(0)
+    assert [event["type"] for event in events] == ["folder.moved"]
+    assert events[0]["data"] == {
+        **Folder.to_dict(folders[4]),
+        "old_path": "/1/4/",
+        "folders_moved": 3
+    }
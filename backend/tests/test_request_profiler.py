@@ -0,0 +1,104 @@
+import os
+import time
+
+import pytest
+from flask import Flask
+
+import request_profiler
+from request_profiler import RequestProfiler, init_profiler, sign, verify
+
+
+@pytest.fixture
+def secret(monkeypatch):
+    monkeypatch.setattr(request_profiler, "PROFILER_SECRET", "s3cret")
+
+
+@pytest.fixture
+def profiled_app(monkeypatch, tmp_path, secret):
+    monkeypatch.setattr(request_profiler, "PROFILER_ENABLED", True)
+    monkeypatch.setattr(request_profiler, "PROFILER_DIR", str(tmp_path))
+    app = Flask(__name__)
+
+    @app.route("/api/folders/<int:folder_id>")
+    def folder(folder_id):
+        return {"id": folder_id}
+
+    init_profiler(app)
+    return app
+
+
+def test_signed_header_is_bound_to_the_request(secret):
+    header = sign("get", "/api/folders")
+
+    assert verify(header, "GET", "/api/folders")
+    assert not verify(header, "POST", "/api/folders")
+    assert not verify(header, "GET", "/api/diagrams")
+    assert not verify(header.replace(".", ".0", 1), "GET", "/api/folders")
+
+
+def test_old_or_unsigned_headers_are_rejected(monkeypatch, secret):
+    assert not verify(sign("GET", "/", int(time.time()) - 3600), "GET", "/")
+    assert not verify(None, "GET", "/")
+    assert not verify("now.abc", "GET", "/")
+
+    header = sign("GET", "/")
+    monkeypatch.setattr(request_profiler, "PROFILER_SECRET", "")
+    assert not verify(header, "GET", "/")
+
+
+def test_caps_limit_profiles_per_route_and_in_total(monkeypatch):
+    monkeypatch.setattr(request_profiler, "PROFILER_ROUTE_LIMIT", 2)
+    monkeypatch.setattr(request_profiler, "PROFILER_TOTAL_LIMIT", 3)
+    profiler = RequestProfiler()
+
+    assert profiler._acquire("/a")
+    assert not profiler._acquire("/b"), "only one request is profiled at a time"
+    profiler._release()
+    assert profiler._acquire("/a")
+    profiler._release()
+    assert not profiler._acquire("/a")
+    assert profiler._acquire("/b")
+    profiler._release()
+    assert not profiler._acquire("/c")
+
+
+def test_window_resets_the_caps(monkeypatch):
+    monkeypatch.setattr(request_profiler, "PROFILER_TOTAL_LIMIT", 1)
+    monkeypatch.setattr(request_profiler, "PROFILER_WINDOW_SECONDS", 0)
+    profiler = RequestProfiler()
+
+    assert profiler._acquire("/a")
+    profiler._release()
+    assert profiler._acquire("/a")
+
+
+def test_signed_request_writes_a_profile(profiled_app, tmp_path):
+    client = profiled_app.test_client()
+
+    response = client.get("/api/folders/3", headers={"X-Profile": sign("GET", "/api/folders/3")})
+
+    assert response.status_code == 200
+    if "X-Profile-File" not in response.headers:
+        pytest.skip("Another profiler is active in this process")
+    assert os.listdir(tmp_path) == [response.headers["X-Profile-File"]]
+    assert "_GET_api_folders_int_folder_id_" in response.headers["X-Profile-File"]
+
+
+def test_collapsed_profile_lists_stacks(profiled_app, monkeypatch, tmp_path):
+    monkeypatch.setattr(request_profiler, "PROFILER_FORMAT", "collapsed")
+    client = profiled_app.test_client()
+
+    response = client.get("/api/folders/3", headers={"X-Profile": sign("GET", "/api/folders/3")})
+
+    if "X-Profile-File" not in response.headers:
+        pytest.skip("Another profiler is active in this process")
+    with open(tmp_path / response.headers["X-Profile-File"], encoding="utf-8") as profile_file:
+        lines = profile_file.read().splitlines()
+    assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+def test_unsigned_requests_are_not_profiled(profiled_app, tmp_path):
+    response = profiled_app.test_client().get("/api/folders/3")
+
+    assert "X-Profile-File" not in response.headers
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,100 @@
+from search_index import SearchIndex, extract_labels, tokenize
+
+CHECKOUT = "graph TD\nA[Cart] --> B[Payment Gateway]\nB --> C[Order Confirmed]"
+LOGIN = "graph TD\nA[Login Form] --> B{Valid?}\nB -->|Yes| C[Dashboard]"
+
+
+def make_index(rows):
+    return SearchIndex(lambda: iter(rows))
+
+
+def test_tokenize_lowercases_and_drops_single_letters():
+    assert tokenize("Payment Gateway: A v2 9") == ["payment", "gateway", "v2", "9"]
+
+
+def test_extract_labels_uses_node_labels_of_flowcharts():
+    assert extract_labels(CHECKOUT) == ["Cart", "Payment Gateway", "Order Confirmed"]
+
+
+def test_extract_labels_of_other_diagram_types():
+    labels = extract_labels("sequenceDiagram\nAlice->>Bob: Hello there")
+    assert labels == ["Hello there"]
+
+
+def test_search_ranks_name_matches_first_and_returns_snippets():
+    index = make_index([
+        {"id": 1, "name": "Checkout", "folder_id": 1, "content": CHECKOUT},
+        {"id": 2, "name": "Payment notes", "folder_id": 1, "content": LOGIN},
+    ])
+
+    results = index.search("payment")
+
+    assert [result["id"] for result in results] == [2, 1]
+    assert results[1]["snippets"] == ["Payment Gateway"]
+
+
+def test_search_matches_last_token_as_prefix():
+    index = make_index([{"id": 1, "name": "Checkout", "folder_id": 1, "content": CHECKOUT}])
+
+    assert [result["id"] for result in index.search("order conf")] == [1]
+    assert index.search("confirmed refund") == []
+
+
+def test_search_filters_by_folder():
+    index = make_index([
+        {"id": 1, "name": "Checkout", "folder_id": 1, "content": CHECKOUT},
+        {"id": 2, "name": "Checkout v2", "folder_id": 2, "content": CHECKOUT},
+    ])
+
+    assert [result["id"] for result in index.search("checkout", folder_id=2)] == [2]
+
+
+def test_rename_keeps_indexed_labels():
+    index = make_index([{"id": 1, "name": "Checkout", "folder_id": 1, "content": CHECKOUT}])
+    index.ensure_loaded()
+
+    index.update(1, name="Purchase")
+
+    assert index.search("checkout") == []
+    assert [result["id"] for result in index.search("purchase gateway")] == [1]
+
+
+def test_content_only_update_before_load_keeps_name_and_folder():
+    rows = [{"id": 1, "name": "Checkout", "folder_id": 7, "content": CHECKOUT}]
+    index = make_index(rows)
+
+    # A save without a name or folder arrives before the first search
+    rows[0]["content"] = CHECKOUT + "\nC --> D[Invoice]"
+    index.update(1, content=rows[0]["content"])
+
+    results = index.search("checkout")
+    assert [(result["id"], result["name"], result["folder_id"]) for result in results] == [(1, "Checkout", 7)]
+    assert [result["id"] for result in index.search("invoice", folder_id=7)] == [1]
+
+
+def test_content_only_update_while_loading_is_applied_to_the_loaded_row():
+    index = None
+
+    def loader():
+        # The row was read before the save below reached the index
+        row = {"id": 1, "name": "Checkout", "folder_id": 7, "content": CHECKOUT}
+        index.update(1, content=CHECKOUT + "\nC --> D[Invoice]")
+        yield row
+
+    index = SearchIndex(loader)
+
+    assert [result["name"] for result in index.search("invoice")] == ["Checkout"]
+
+
+def test_remove_while_loading_wins_over_loaded_row():
+    index = None
+
+    def loader():
+        row = {"id": 1, "name": "Checkout", "folder_id": 1, "content": CHECKOUT}
+        index.remove(1)
+        yield row
+
+    index = SearchIndex(loader)
+
+    assert index.search("checkout") == []
+    assert index.stats()["diagrams"] == 0
@@ -0,0 +1,46 @@
+import pytest
+
+from text_delta import apply_text_ops, compute_text_delta, content_hash
+
+
+@pytest.mark.parametrize("old, new", [
+    ("", ""),
+    ("", "graph TD\nA --> B\n"),
+    ("graph TD\nA --> B\n", ""),
+    ("graph TD\nA --> B\nB --> C\n", "graph TD\nA --> B\nB --> D\nD --> C\n"),
+    ("graph TD\nA --> B", "graph LR\nA --> B\nB --> C"),
+    ("flowchart TD\nA[Start] --> B{Ok?}\nB -->|yes| C\n", "flowchart TD\nB -->|yes| C\nA[Start] --> B{Ok?}\n"),
+])
+def test_delta_round_trips(old, new):
+    assert apply_text_ops(old, compute_text_delta(old, new)) == new
+
+
+def test_equal_texts_have_no_operations():
+    assert compute_text_delta("graph TD\nA --> B\n", "graph TD\nA --> B\n") == []
+
+
+def test_offsets_refer_to_the_text_after_earlier_operations():
+    operations = compute_text_delta("a\nb\nc\nd\n", "x\nb\ny\nz\nd\n")
+
+    assert operations == [
+        {"offset": 0, "delete": 2, "insert": "x\n"},
+        {"offset": 4, "delete": 2, "insert": "y\nz\n"},
+    ]
+
+
+@pytest.mark.parametrize("operation", [
+    "insert",
+    {"offset": "0", "delete": 0, "insert": ""},
+    {"offset": 0, "delete": 1, "insert": None},
+    {"offset": -1, "delete": 0, "insert": "x"},
+    {"offset": 2, "delete": 5, "insert": ""},
+])
+def test_malformed_operations_are_rejected(operation):
+    with pytest.raises(ValueError):
+        apply_text_ops("abcd", [operation])
+
+
+def test_content_hash_is_the_sha256_of_the_utf8_text():
+    assert content_hash("") == "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"
+    assert content_hash("A --> B") != content_hash("A --> C")
+    assert len(content_hash("Größe")) == 64
@@ -0,0 +1,62 @@
+from token_budget import TokenBudget, estimate_call, estimate_seconds, estimate_tokens, MESSAGE_OVERHEAD_TOKENS
+
+
+def test_estimate_counts_words_and_punctuation():
+    assert estimate_tokens("") == 0
+    # Each arrow character is a token of its own
+    assert estimate_tokens("A --> B") == 5
+    # Long words count as several tokens
+    assert estimate_tokens("authentication") == 3
+
+
+def test_estimate_call_adds_framing_and_output_margin():
+    call = estimate_call("Edit it", "A --> B", "A --> B")
+
+    assert call["input_tokens"] == 2 + 5 + MESSAGE_OVERHEAD_TOKENS
+    assert call["output_tokens"] == int(5 * 1.1) + 20
+
+
+def test_estimate_seconds_grows_with_output():
+    assert estimate_seconds(600) > estimate_seconds(60)
+
+
+def test_charge_rejects_over_budget_and_reports_retry_after():
+    budget = TokenBudget(budget=100, window_seconds=60)
+
+    assert budget.charge("a", 80) == (True, 0)
+    charged, retry_after = budget.charge("a", 30)
+
+    assert not charged
+    assert 0 < retry_after <= 61
+    assert budget.remaining("a") == 20
+    assert budget.remaining("b") == 100
+
+
+def test_adjust_settles_estimate_against_actual_usage():
+    budget = TokenBudget(budget=100, window_seconds=60)
+    budget.charge("a", 80)
+
+    # The request used fewer tokens than estimated
+    budget.adjust("a", 30 - 80)
+    assert budget.remaining("a") == 70
+
+    # A fallback call used more; the overrun is billed even past the budget
+    budget.adjust("a", 90)
+    assert budget.remaining("a") == 0
+    assert not budget.charge("a", 1)[0]
+
+
+def test_adjust_never_goes_below_zero():
+    budget = TokenBudget(budget=100, window_seconds=60)
+
+    budget.adjust("a", -50)
+
+    assert budget.remaining("a") == 100
+
+
+def test_disabled_budget_allows_everything():
+    budget = TokenBudget(budget=0)
+
+    assert budget.charge("a", 10 ** 9) == (True, 0)
+    budget.adjust("a", 10)
+    assert budget.remaining("a") is None
@@ -0,0 +1,156 @@
+import bisect
+import json
+import time
+
+import pytest
+
+import workspace_transfer
+from workspace_transfer import export_workspace, import_workspace, EXPORT_PAGE_SIZE, IMPORT_BATCH_SIZE
+
+# Size of the workspace in the round trip test
+FOLDER_COUNT = 1000
+DIAGRAM_COUNT = 100000
+
+
+class FakeWorkspace:
+    """
+    In-memory folders and diagrams with the paging and batch insert calls of the models.
+    """
+
+    def __init__(self):
+        self.folders = {}
+        self.diagrams = {}
+        self.next_id = 1
+        self.page_sizes = []
+        self.batch_sizes = []
+
+    def _new_id(self):
+        self.next_id += 1
+        return self.next_id - 1
+
+    def add_folder(self, name, parent_id, is_root=False):
+        folder_id = self._new_id()
+        self.folders[folder_id] = {"id": folder_id, "name": name, "parent_id": parent_id, "is_root": is_root}
+        return folder_id
+
+    def _page(self, rows, after_id, limit):
+        ids = sorted(rows)
+        start = bisect.bisect_right(ids, after_id)
+        page = [dict(rows[row_id]) for row_id in ids[start:start + limit]]
+        self.page_sizes.append(len(page))
+        return page
+
+    def get_folder_page(self, after_id=0, limit=500):
+        return self._page(self.folders, after_id, limit)
+
+    def get_diagram_page(self, after_id=0, limit=500, columns="*"):
+        return self._page(self.diagrams, after_id, limit)
+
+    def create_folders(self, folders):
+        self.batch_sizes.append(len(folders))
+        return [self.folders[self.add_folder(folder["name"], folder["parent_id"])] for folder in folders]
+
+    def create_diagrams(self, diagrams):
+        self.batch_sizes.append(len(diagrams))
+        created = []
+        for diagram in diagrams:
+            diagram_id = self._new_id()
+            self.diagrams[diagram_id] = {"id": diagram_id, **diagram}
+            created.append(self.diagrams[diagram_id])
+        return created
+
+    def root(self):
+        return next(folder for folder in self.folders.values() if folder["is_root"])
+
+    def path(self, folder_id):
+        names = []
+        while folder_id:
+            folder = self.folders[folder_id]
+            if folder["is_root"]:
+                break
+            names.append(folder["name"])
+            folder_id = folder["parent_id"]
+        return "/".join(reversed(names))
+
+
+def use_workspaces(monkeypatch, source, target):
+    # Exports read from the source, imports write to the target
+    monkeypatch.setattr(workspace_transfer.Folder, "get_page", source.get_folder_page)
+    monkeypatch.setattr(workspace_transfer.Diagram, "get_page", source.get_diagram_page)
+    monkeypatch.setattr(workspace_transfer.Folder, "create_many", target.create_folders)
+    monkeypatch.setattr(workspace_transfer.Diagram, "create_many", target.create_diagrams)
+    monkeypatch.setattr(workspace_transfer, "ensure_root_folder_exists", target.root)
+
+
+@pytest.fixture
+def source():
+    workspace = FakeWorkspace()
+    root_id = workspace.add_folder("Root", None, is_root=True)
+    folder_ids = [root_id]
+    for index in range(FOLDER_COUNT):
+        # Ten top-level folders, each with nested levels below it
+        parent_id = root_id if index < 10 else folder_ids[index - 9]
+        folder_ids.append(workspace.add_folder(f"Folder {index}", parent_id))
+    for index in range(DIAGRAM_COUNT):
+        diagram_id = workspace._new_id()
+        workspace.diagrams[diagram_id] = {
+            "id": diagram_id,
+            "name": f"Diagram {index}",
+            "folder_id": folder_ids[index % len(folder_ids)],
+            "content": f"graph TD\nA{index}[Start] --> B{index}[End]",
+            "last_updated": "2024-01-01T00:00:00"
+        }
+    return workspace
+
+
+def test_round_trip_of_a_large_workspace(monkeypatch, source):
+    target = FakeWorkspace()
+    target.add_folder("Root", None, is_root=True)
+
+    use_workspaces(monkeypatch, source, target)
+
+    # The export is streamed straight into the import, as when piping one server into another
+    started = time.perf_counter()
+    result = import_workspace(export_workspace(), json.loads)
+    print(f"\nRound trip of {DIAGRAM_COUNT} diagrams in {time.perf_counter() - started:.2f}s")
+
+    assert result == {"folders_imported": FOLDER_COUNT, "diagrams_imported": DIAGRAM_COUNT, "errors": []}
+
+    # Reads and writes are bounded by the page and batch sizes, not the workspace size
+    assert max(source.page_sizes) <= EXPORT_PAGE_SIZE
+    assert max(target.batch_sizes) <= IMPORT_BATCH_SIZE
+    assert len(source.page_sizes) <= (FOLDER_COUNT + DIAGRAM_COUNT) // EXPORT_PAGE_SIZE + 3
+
+    # Every diagram lands in the folder with the same path and keeps its content
+    exported_diagrams = sorted((source.path(d["folder_id"]), d["name"], d["content"]) for d in source.diagrams.values())
+    imported_diagrams = sorted((target.path(d["folder_id"]), d["name"], d["content"]) for d in target.diagrams.values())
+    assert imported_diagrams == exported_diagrams
+
+
+def test_import_reports_bad_lines_and_keeps_going(monkeypatch):
+    target = FakeWorkspace()
+    root_id = target.add_folder("Root", None, is_root=True)
+    use_workspaces(monkeypatch, target, target)
+
+    result = import_workspace([
+        b'{"type": "header", "version": 1}',
+        b'{"type": "folder", "id": 5, "name": "Plans", "parent_id": 1}',
+        b'not json',
+        b'{"type": "diagram", "id": 9, "name": "Empty", "folder_id": 5, "content": ""}',
+        b'{"type": "diagram", "id": 10, "name": "Flow", "folder_id": 5, "content": "graph TD\\nA --> B"}',
+    ], json.loads)
+
+    assert result["folders_imported"] == 1
+    assert result["diagrams_imported"] == 1
+    assert [error["line"] for error in result["errors"]] == [3, 4]
+    diagram = next(iter(target.diagrams.values()))
+    assert target.folders[diagram["folder_id"]]["parent_id"] == root_id
+
+
+def test_import_rejects_unknown_versions(monkeypatch):
+    target = FakeWorkspace()
+    target.add_folder("Root", None, is_root=True)
+    use_workspaces(monkeypatch, target, target)
+
+    with pytest.raises(ValueError):
+        import_workspace(['{"type": "header", "version": 99}'], json.loads)
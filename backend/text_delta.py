@@ -0,0 +1,92 @@
+"""
+Helpers for describing changes between two versions of diagram text.
+
+A delta is a list of text operations, each a dictionary of the form
+{"offset": int, "delete": int, "insert": str}. Operations are applied in
+order and every offset refers to the text as modified by the operations
+before it.
+"""
+import difflib
+import hashlib
+from typing import Dict, List
+
+
+def content_hash(content: str) -> str:
+    """
+    Compute a stable hash of diagram content, used as its version identifier.
+
+    Args:
+        content (str): The diagram content
+
+    Returns:
+        str: The hex encoded SHA-256 digest of the content
+    """
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def compute_text_delta(old: str, new: str) -> List[Dict]:
+    """
+    Compute the text operations that turn one version of a text into another.
+
+    The diff is computed line by line, so the operations replace whole lines.
+
+    Args:
+        old (str): The original text
+        new (str): The updated text
+
+    Returns:
+        List[Dict]: The text operations, empty if the texts are equal
+    """
+    if old == new:
+        return []
+
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+
+    operations = []
+    offset = 0
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        old_chunk = "".join(old_lines[old_start:old_end])
+        new_chunk = "".join(new_lines[new_start:new_end])
+        if tag != "equal":
+            operations.append({
+                "offset": offset,
+                "delete": len(old_chunk),
+                "insert": new_chunk
+            })
+        offset += len(new_chunk)
+
+    return operations
+
+
+def apply_text_ops(text: str, operations: List[Dict]) -> str:
+    """
+    Apply a list of text operations to a text.
+
+    Args:
+        text (str): The text to modify
+        operations (List[Dict]): The operations to apply, in order
+
+    Returns:
+        str: The modified text
+
+    Raises:
+        ValueError: If an operation is malformed or out of range
+    """
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise ValueError("Each operation must be an object")
+
+        offset = operation.get("offset")
+        delete = operation.get("delete", 0)
+        insert = operation.get("insert", "")
+
+        if not isinstance(offset, int) or not isinstance(delete, int) or not isinstance(insert, str):
+            raise ValueError("Operations require an integer offset, an integer delete and a string insert")
+        if offset < 0 or delete < 0 or offset + delete > len(text):
+            raise ValueError(f"Operation out of range: offset {offset}, delete {delete}, length {len(text)}")
+
+        text = text[:offset] + insert + text[offset + delete:]
+
+    return text
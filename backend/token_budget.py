@@ -0,0 +1,149 @@
+"""
+Local token estimation and token budgets for AI edits.
+
+The estimate is computed without calling the model or a tokenizer, so oversized
+requests can be rejected before they tie up a worker. Each request is limited
+to MAX_REQUEST_INPUT_TOKENS, and each client to CLIENT_TOKEN_BUDGET estimated
+tokens (input plus output) per CLIENT_TOKEN_WINDOW_SECONDS. The estimate is
+charged up front and settled against the tokens the model reports once the
+request has finished.
+"""
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# Largest estimated prompt a single request may send to the model
+MAX_REQUEST_INPUT_TOKENS = int(os.getenv("MAX_REQUEST_INPUT_TOKENS", 60000))
+
+# Tokens a client may use per window (0 disables the limit)
+CLIENT_TOKEN_BUDGET = int(os.getenv("CLIENT_TOKEN_BUDGET", 1000000))
+CLIENT_TOKEN_WINDOW_SECONDS = int(os.getenv("CLIENT_TOKEN_WINDOW_SECONDS", 3600))
+
+# Latency model of a model call: fixed overhead plus generation time
+MODEL_CALL_OVERHEAD_SECONDS = float(os.getenv("MODEL_CALL_OVERHEAD_SECONDS", 1.5))
+OUTPUT_TOKENS_PER_SECOND = float(os.getenv("OUTPUT_TOKENS_PER_SECOND", 60))
+
+# Words, numbers and single punctuation characters each start at least one token
+PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+# Long words are split into several tokens, roughly every this many characters
+CHARS_PER_WORD_TOKEN = 6
+
+# No text has fewer tokens than its length divided by this, so longer texts
+# can be rejected without estimating
+MAX_CHARS_PER_TOKEN = 20
+
+# Extra tokens for message framing per model call
+MESSAGE_OVERHEAD_TOKENS = 10
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens of a text.
+
+    Counts words and punctuation, which tracks real tokenizers closely on
+    mermaid code where arrows, brackets and short ids are separate tokens.
+    """
+    if not text:
+        return 0
+    tokens = 0
+    for piece in PIECE_RE.findall(text):
+        tokens += 1 + (len(piece) - 1) // CHARS_PER_WORD_TOKEN
+    return tokens
+
+
+def estimate_call(system_prompt: str, human_content: str, expected_output: str) -> Dict:
+    """
+    Estimate the input and output tokens of a single model call.
+
+    Args:
+        system_prompt (str): The system prompt
+        human_content (str): The content of the human message
+        expected_output (str): Text of the size the model is expected to return
+
+    Returns:
+        Dict: The estimated "input_tokens" and "output_tokens"
+    """
+    return {
+        "input_tokens": estimate_tokens(system_prompt) + estimate_tokens(human_content) + MESSAGE_OVERHEAD_TOKENS,
+        # Edits usually return the input with a few lines changed or added
+        "output_tokens": int(estimate_tokens(expected_output) * 1.1) + 20
+    }
+
+
+def estimate_seconds(output_tokens: int) -> float:
+    """
+    Estimate the duration of a model call from the number of tokens it generates.
+    """
+    return round(MODEL_CALL_OVERHEAD_SECONDS + output_tokens / OUTPUT_TOKENS_PER_SECOND, 1)
+
+
+class TokenBudget:
+    """
+    Per-client token budget in fixed time windows.
+    """
+
+    def __init__(self, budget: int = CLIENT_TOKEN_BUDGET, window_seconds: int = CLIENT_TOKEN_WINDOW_SECONDS):
+        self.budget = budget
+        self.window_seconds = window_seconds
+        self._usage: Dict[str, Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def _current(self, client: str, now: float) -> Tuple[float, int]:
+        window_start, used = self._usage.get(client, (now, 0))
+        if now - window_start >= self.window_seconds:
+            return now, 0
+        return window_start, used
+
+    def charge(self, client: str, tokens: int) -> Tuple[bool, int]:
+        """
+        Use tokens from a client's budget, unless that would exceed it.
+
+        Returns:
+            Tuple[bool, int]: Whether the tokens were charged, and otherwise
+            the number of seconds until the client's window resets
+        """
+        if self.budget <= 0:
+            return True, 0
+        now = time.monotonic()
+        with self._lock:
+            window_start, used = self._current(client, now)
+            if used + tokens > self.budget:
+                return False, int(window_start + self.window_seconds - now) + 1
+            self._usage[client] = (window_start, used + tokens)
+
+            # Forget clients whose windows have ended
+            if len(self._usage) > 10000:
+                self._usage = {
+                    key: value for key, value in self._usage.items()
+                    if now - value[0] < self.window_seconds
+                }
+            return True, 0
+
+    def adjust(self, client: str, tokens: int):
+        """
+        Add tokens to or refund tokens from a client's budget without a limit check.
+
+        Used to settle an up-front estimate against the tokens actually used.
+        """
+        if self.budget <= 0 or not tokens:
+            return
+        now = time.monotonic()
+        with self._lock:
+            window_start, used = self._current(client, now)
+            self._usage[client] = (window_start, max(used + tokens, 0))
+
+    def remaining(self, client: str) -> Optional[int]:
+        """
+        Get the number of tokens left in a client's budget, or None if budgets are disabled.
+        """
+        if self.budget <= 0:
+            return None
+        with self._lock:
+            _, used = self._current(client, time.monotonic())
+            return max(self.budget - used, 0)
+
+
+client_budget = TokenBudget()
@@ -0,0 +1,206 @@
+"""
+NDJSON export and import of the whole workspace.
+
+The export is a stream of JSON lines: a header line, then every folder, then
+every diagram, each read from the database in keyset-paginated pages so memory
+use does not depend on the size of the workspace. The import parses such a
+stream line by line, creates folders under new ids and inserts diagrams in
+batches.
+"""
+import os
+from datetime import datetime
+from typing import Dict, Iterable
+
+from json_provider import dumps
+from models import Folder, Diagram, ensure_root_folder_exists
+
+EXPORT_FORMAT_VERSION = 1
+
+# Number of rows read per page when exporting
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", 500))
+
+# Number of diagrams inserted per batch when importing
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 500))
+
+# Maximum number of line errors reported by an import
+IMPORT_MAX_ERRORS = 100
+
+
+def export_workspace():
+    """
+    Generate the NDJSON lines of a workspace export.
+    """
+    yield dumps({
+        "type": "header",
+        "version": EXPORT_FORMAT_VERSION,
+        "exported_at": datetime.utcnow().isoformat()
+    }) + "\n"
+
+    last_id = 0
+    while True:
+        folders = Folder.get_page(last_id, EXPORT_PAGE_SIZE)
+        for folder in folders:
+            yield dumps({
+                "type": "folder",
+                "id": folder.get("id"),
+                "name": folder.get("name"),
+                "parent_id": folder.get("parent_id"),
+                "is_root": folder.get("is_root"),
+                "created_at": folder.get("created_at"),
+                "last_updated": folder.get("last_updated")
+            }) + "\n"
+        if len(folders) < EXPORT_PAGE_SIZE:
+            break
+        last_id = folders[-1].get("id")
+
+    last_id = 0
+    while True:
+        diagrams = Diagram.get_page(last_id, EXPORT_PAGE_SIZE, "id, name, folder_id, content, last_updated")
+        for diagram in diagrams:
+            yield dumps({
+                "type": "diagram",
+                "id": diagram.get("id"),
+                "name": diagram.get("name"),
+                "folder_id": diagram.get("folder_id"),
+                "content": diagram.get("content"),
+                "last_updated": diagram.get("last_updated")
+            }) + "\n"
+        if len(diagrams) < EXPORT_PAGE_SIZE:
+            break
+        last_id = diagrams[-1].get("id")
+
+
+class WorkspaceImport:
+    """
+    State of an import: the mapping from exported folder ids to new ids and the pending batches.
+    """
+
+    def __init__(self, loads):
+        self.loads = loads
+        self.root_id = ensure_root_folder_exists().get("id")
+        self.folder_ids: Dict = {}
+        self.pending_folders = []
+        self.pending_diagrams = []
+        self.folders_imported = 0
+        self.diagrams_imported = 0
+        self.errors = []
+
+    def error(self, line_number, message):
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"line": line_number, "error": message})
+
+    def add_line(self, line_number, line):
+        line = line.strip()
+        if not line:
+            return
+        try:
+            record = self.loads(line)
+        except ValueError:
+            self.error(line_number, "Invalid JSON")
+            return
+        if not isinstance(record, dict):
+            self.error(line_number, "Invalid record")
+            return
+
+        record_type = record.get("type")
+        if record_type == "header":
+            if record.get("version") != EXPORT_FORMAT_VERSION:
+                raise ValueError(f"Unsupported export version: {record.get('version')}")
+        elif record_type == "folder":
+            self.add_folder(line_number, record)
+        elif record_type == "diagram":
+            self.add_diagram(line_number, record)
+        else:
+            self.error(line_number, f"Unknown record type: {record_type}")
+
+    def add_folder(self, line_number, record):
+        if record.get("is_root"):
+            # The exported root folder becomes the existing root folder
+            self.folder_ids[record.get("id")] = self.root_id
+        elif not record.get("name"):
+            self.error(line_number, "Folder without a name")
+        else:
+            self.pending_folders.append(record)
+
+    def flush_folders(self):
+        """
+        Create the buffered folders one tree level per batch, parents before children.
+        """
+        remaining = self.pending_folders
+        self.pending_folders = []
+
+        while remaining:
+            # Folders whose parent is not in the export are attached to the root folder
+            remaining_ids = {folder.get("id") for folder in remaining}
+            ready = [
+                folder for folder in remaining
+                if folder.get("parent_id") in self.folder_ids or folder.get("parent_id") not in remaining_ids
+            ]
+            if not ready:
+                # Cyclic parent references
+                ready = remaining
+            ready_ids = {id(folder) for folder in ready}
+            remaining = [folder for folder in remaining if id(folder) not in ready_ids]
+
+            created = Folder.create_many([
+                {
+                    "name": folder["name"],
+                    "parent_id": self.folder_ids.get(folder.get("parent_id"), self.root_id)
+                }
+                for folder in ready
+            ])
+            for folder, new_folder in zip(ready, created):
+                self.folder_ids[folder.get("id")] = new_folder.get("id")
+            self.folders_imported += len(created)
+
+    def add_diagram(self, line_number, record):
+        if self.pending_folders:
+            self.flush_folders()
+        if not record.get("content"):
+            self.error(line_number, "Diagram without content")
+            return
+        self.pending_diagrams.append({
+            "content": record["content"],
+            "name": record.get("name"),
+            "folder_id": self.folder_ids.get(record.get("folder_id"), self.root_id)
+        })
+        if len(self.pending_diagrams) >= IMPORT_BATCH_SIZE:
+            self.flush_diagrams()
+
+    def flush_diagrams(self):
+        created = Diagram.create_many(self.pending_diagrams)
+        self.diagrams_imported += len(created)
+        self.pending_diagrams = []
+
+    def finish(self):
+        if self.pending_folders:
+            self.flush_folders()
+        if self.pending_diagrams:
+            self.flush_diagrams()
+        return {
+            "folders_imported": self.folders_imported,
+            "diagrams_imported": self.diagrams_imported,
+            "errors": self.errors
+        }
+
+
+def import_workspace(lines: Iterable, loads) -> Dict:
+    """
+    Import an NDJSON workspace export.
+
+    Args:
+        lines (Iterable): The lines of the export, as bytes or str
+        loads (Callable): The JSON decoder to use
+
+    Returns:
+        Dict: The number of imported folders and diagrams and any line errors
+
+    Raises:
+        ValueError: If the export has an unsupported format version
+    """
+    state = WorkspaceImport(loads)
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        state.add_line(line_number, line)
+    return state.finish()